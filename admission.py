@@ -0,0 +1,105 @@
+"""
+Admission control for the SMTP classification path.
+
+At most max_queue classifications may be queued or running at once. An
+email arriving beyond that is not queued behind the others. The overload
+policy handles it instead, so the SMTP response time stays bounded when
+mail arrives faster than DistilBERT can keep up:
+  degrade       classify from the subject and sender only (no encoder)
+  defer         reply 451 so the upstream MTA retries later
+  passthrough   deliver unclassified (X-Email-Category: unclassified)
+With max_wait_ms, an admitted email whose classification has not finished in
+time gets the same treatment; its classification still finishes in the
+background and keeps its slot until then. So does an email whose
+classification failed, e.g. because an inference worker died.
+"""
+import threading
+import time
+from collections import deque
+from stats import percentile
+
+POLICIES = ['degrade', 'defer', 'passthrough']
+
+
+class AdmissionController:
+    def __init__(self, max_queue: int = 32, policy: str = 'degrade', max_wait_ms: float = 0):
+        if policy not in POLICIES:
+            print(f"⚠️  Unknown OVERLOAD_POLICY '{policy}', using 'degrade'")
+            policy = 'degrade'
+        self.max_queue = max(0, max_queue)     # 0 = unbounded
+        self.policy = policy
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0 or None
+
+        self._lock = threading.Lock()
+        self.depth = 0
+        self.peak_depth = 0
+        self._depths = deque(maxlen=2000)      # Depth seen by recent arrivals
+        self._waits = deque(maxlen=2000)       # Recent seconds from admission to classification start
+        self.admitted = 0
+        self.overloaded = {'queue_full': 0, 'timeout': 0, 'error': 0}
+        self.outcomes = {policy: 0 for policy in POLICIES}
+        self.last_overload = None
+
+    def try_admit(self) -> bool:
+        """Take a queue slot; False when the queue is full (the caller applies the policy)"""
+        with self._lock:
+            self._depths.append(self.depth)
+            if self.max_queue and self.depth >= self.max_queue:
+                self.overloaded['queue_full'] += 1
+                self.last_overload = time.time()
+                return False
+            self.depth += 1
+            self.peak_depth = max(self.peak_depth, self.depth)
+            self.admitted += 1
+            return True
+
+    def release(self):
+        """Give back a slot once an admitted classification has finished"""
+        with self._lock:
+            self.depth -= 1
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self._waits.append(seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.overloaded['timeout'] += 1
+            self.last_overload = time.time()
+
+    def record_error(self):
+        """An admitted classification failed (e.g. an inference worker timed out)"""
+        with self._lock:
+            self.overloaded['error'] += 1
+            self.last_overload = time.time()
+
+    def record_outcome(self):
+        """Count one email handled by the overload policy"""
+        with self._lock:
+            self.outcomes[self.policy] += 1
+
+    def get_stats(self) -> dict:
+        """Queue depth, admission wait percentiles (milliseconds) and overload counters"""
+        with self._lock:
+            depths = sorted(self._depths)
+            waits = sorted(self._waits)
+            stats = {
+                'policy': self.policy,
+                'max_queue': self.max_queue,
+                'max_wait_ms': self.max_wait * 1000 if self.max_wait else None,
+                'depth': self.depth,
+                'peak_depth': self.peak_depth,
+                'admitted': self.admitted,
+                'overloaded': dict(self.overloaded),
+                'outcomes': dict(self.outcomes),
+                'last_overload': (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_overload))
+                                  if self.last_overload else None),
+            }
+
+        stats.update({
+            'p50_depth': percentile(depths, 50),
+            'p95_depth': percentile(depths, 95),
+            'p50_wait_ms': percentile(waits, 50, 1000),
+            'p99_wait_ms': percentile(waits, 99, 1000),
+        })
+        return stats
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+MIME parsing benchmark
+
+Times the bounded streaming parser used on the classification path against a
+full email.message parse that decodes every text/plain part, for messages
+with a short text body and attachments of growing size.
+
+Usage:
+    python benchmark_mime_parsing.py
+    python benchmark_mime_parsing.py --sizes 0.01 1 30 --repeat 5
+"""
+import argparse
+import os
+import time
+from email import message_from_string
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import config
+from mime_stream import extract_text
+
+
+def build_message(attachment_mb: float) -> bytes:
+    """A multipart/mixed message: plain and HTML text, then a binary attachment"""
+    body = MIMEMultipart('alternative')
+    body.attach(MIMEText('Your order #1234 has shipped. Track your package online. ' * 20, 'plain', 'utf-8'))
+    body.attach(MIMEText('<p>Your order #1234 has shipped.</p>' * 20, 'html', 'utf-8'))
+
+    msg = MIMEMultipart('mixed')
+    msg['Subject'] = 'Your order #1234 has shipped'
+    msg['From'] = 'Shop <orders@shop.com>'
+    msg['Message-ID'] = '<benchmark@shop.com>'
+    msg.attach(body)
+    if attachment_mb > 0:
+        msg.attach(MIMEApplication(os.urandom(int(attachment_mb * 1024 * 1024)), Name='invoice.pdf'))
+    return msg.as_string().replace('\n', '\r\n').encode('utf-8')
+
+
+def full_parse(raw: bytes) -> str:
+    """The previous classification path: decode, full parse, every text/plain part decoded"""
+    msg = message_from_string(raw.decode('utf-8', errors='ignore'))
+    body = ''
+    for part in msg.walk():
+        if part.get_content_type() == 'text/plain':
+            body += part.get_payload(decode=True).decode('utf-8', errors='ignore')
+    return body[:1000]
+
+
+def time_call(fn, repeat: int) -> float:
+    """Best of repeat runs, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run_benchmark(sizes: list, repeat: int):
+    print(f"{'Message size':>14} {'Full parse':>12} {'Streaming':>12} {'Speedup':>9}")
+    for size in sizes:
+        raw = build_message(size)
+        streamed = extract_text(raw, max_scan_bytes=config.MIME_MAX_SCAN_BYTES, max_parts=config.MIME_MAX_PARTS)[1]
+        assert streamed == full_parse(raw), "Parsers disagree on the snippet"
+
+        full_ms = time_call(lambda: full_parse(raw), repeat)
+        stream_ms = time_call(lambda: extract_text(raw, max_scan_bytes=config.MIME_MAX_SCAN_BYTES,
+                                                   max_parts=config.MIME_MAX_PARTS), repeat)
+        print(f"{len(raw) / 1024 / 1024:>11.2f} MB {full_ms:>9.2f} ms {stream_ms:>9.3f} ms "
+              f"{full_ms / stream_ms:>8.0f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare streaming and full MIME parsing by message size')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0, 0.1, 1, 5, 30],
+                        help='Attachment sizes in MB')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per size (best is reported)')
+    args = parser.parse_args()
+    run_benchmark(args.sizes, args.repeat)
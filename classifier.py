@@ -1,46 +1,572 @@
 import torch
-import pickle
 import os
+import json
+import numpy as np
 import warnings
 import threading
-from transformers import AutoTokenizer, AutoModel
-from sklearn.linear_model import LogisticRegression
-from email import message_from_string
+import queue
+from collections import deque
+from transformers import AutoTokenizer, AutoModel, AutoConfig
 from email.header import decode_header
 from email.utils import parseaddr
 import time
 import config
+import mime_stream
+from inference_engine import BatchingInferenceEngine, EncoderPriorityGate
+from inference_pool import InferencePool
+from embedding_cache import EmbeddingCache
+from onnx_encoder import OnnxEncoder, export_onnx
+from traced_encoder import TracedEncoder, artifact_metadata, build_traced_encoder
+from fast_classifier import HashedNgramClassifier
+from sender_memo import SenderMemo
+from sender_rules import SenderRules, sender_domain_of
+from near_duplicate import NearDuplicateIndex
+from linear_model import LinearSoftmaxModel
+from early_exit import EarlyExit, EarlyExitHeads, layer_features
+from training_worker import run_training_job, TrainingError
+from admission import AdmissionController
 
 # Suppress HuggingFace warnings
 warnings.filterwarnings('ignore', category=FutureWarning, module='huggingface_hub')
 
+def add_timings(totals: dict, timings: dict):
+    """Accumulate per-stage seconds into totals"""
+    for stage, seconds in timings.items():
+        totals[stage] = totals.get(stage, 0.0) + seconds
+
+
 class EmailClassifier:
+    MODEL_NAME = 'distilbert-base-uncased'
+    MAX_LENGTH = 512  # DistilBERT position embedding limit
+    TRAINING_CACHE_CHUNK = 1024  # Training texts encoded between embedding cache writes
+    CORRECTION_QUEUE_SIZE = 1000  # Corrections waiting for an online update; beyond this they wait for a retrain
+
     def __init__(self):
-        self.tokenizer = AutoTokenizer.from_pretrained('distilbert-base-uncased')
-        self.bert_model = AutoModel.from_pretrained('distilbert-base-uncased')
-        self.classifier = None
-        self.model_path = f'{config.MODEL_DIR}/classifier.pkl'
-        
+        self.tokenizer = AutoTokenizer.from_pretrained(self.MODEL_NAME)
+        self.bert_model = None
+        self.onnx_encoder = None
+        self.traced_encoder = None
+        self.quantization = 'none'
+
         # Create model directory
         os.makedirs(config.MODEL_DIR, exist_ok=True)
-        
+
+        # Sequence cap: fixed via MAX_SEQUENCE_LENGTH, or chosen from the training
+        # token-length distribution and persisted so inference matches training
+        self.encoder_config_path = f'{config.MODEL_DIR}/encoder_config.json'
+        self.max_length = self.MAX_LENGTH
+        if config.MAX_SEQUENCE_LENGTH != 'auto':
+            self.max_length = max(8, min(self.MAX_LENGTH, int(config.MAX_SEQUENCE_LENGTH)))
+        elif os.path.exists(self.encoder_config_path):
+            try:
+                with open(self.encoder_config_path) as f:
+                    self.max_length = int(json.load(f).get('max_length', self.MAX_LENGTH))
+            except (OSError, ValueError) as e:
+                print(f"Error loading encoder config: {e}")
+        self.live_token_lengths = deque(maxlen=5000)
+        self.training_token_stats = None
+        self.trained_max_length = None  # Cap of the most recent training run (its embeddings are cached)
+        self.forward_passes = 0  # Encoder forward passes run in this process (forked workers count their own)
+
+        if config.ENCODER_BACKEND == 'onnx':
+            self.onnx_encoder = self.load_onnx_encoder()
+
+        elif config.ENCODER_BACKEND == 'torchscript':
+            self.traced_encoder = self.load_traced_encoder()
+
+        if self.onnx_encoder is not None:
+            # The PyTorch weights are not needed in memory when serving from ONNX
+            self.encoder_backend = 'onnx'
+            self.hidden_size = AutoConfig.from_pretrained(self.MODEL_NAME).hidden_size
+            print(f"Using ONNX Runtime encoder ({config.ONNX_MODEL_PATH})")
+            if config.ENCODER_QUANTIZATION == 'int8':
+                print("  ENCODER_QUANTIZATION only applies to the PyTorch backend - ignoring")
+        elif self.traced_encoder is not None:
+            # The traced graph carries its own (frozen) weights
+            self.encoder_backend = 'torchscript'
+            self.quantization = self.traced_encoder.metadata['quantization']
+            self.hidden_size = AutoConfig.from_pretrained(self.MODEL_NAME).hidden_size
+            print(f"Using TorchScript encoder ({config.TORCHSCRIPT_MODEL_PATH}, {self.quantization})")
+        else:
+            self.encoder_backend = 'pytorch'
+            self.bert_model = AutoModel.from_pretrained(self.MODEL_NAME)
+            self.bert_model.eval()
+            self.hidden_size = self.bert_model.config.hidden_size
+            if config.ENCODER_QUANTIZATION == 'int8':
+                self.quantization = 'int8'
+                self.bert_model = self.quantize_model(self.bert_model)
+                print("Using dynamic int8 quantized DistilBERT encoder")
+
+        # Set by warmup(); 'ready' once the SMTP server accepts connections
+        self.readiness = {'ready': False, 'warmed_up': False, 'encoder_backend': self.encoder_backend,
+                          'warmup_seconds': None, 'cold_latency_ms': None, 'warm_latency_ms': None,
+                          'warm_batch_latency_ms': None}
+
+        # Classifier layer: NumPy softmax predictor over the embedding (None until trained)
+        self.classifier = None
+        self.model_path = f'{config.MODEL_DIR}/classifier.json'
+        self.legacy_model_path = f'{config.MODEL_DIR}/classifier.pkl'
+        # Projected float16 training features (written by training when FEATURE_PROJECTION is set)
+        self.feature_store_path = f'{config.MODEL_DIR}/features.json'
+
         # Load existing model if available
-        if os.path.exists(self.model_path):
-            self.load_model()
+        self.load_model()
+
+        # Per-layer heads for the early-exit encoder mode (None when disabled or untrained)
+        self.early_exit = None
+        self.early_exit_path = f'{config.MODEL_DIR}/early_exit.npz'
+        self.load_early_exit()
+
+        # First cascade stage: hashed n-gram model that decides confident emails without BERT
+        self.fast_model = None
+        self.fast_model_path = f'{config.MODEL_DIR}/fast_model.npz'
+        if os.path.exists(self.fast_model_path):
+            try:
+                self.fast_model = HashedNgramClassifier.load(self.fast_model_path)
+            except Exception as e:
+                print(f"Error loading fast model: {e}")
+
+        # Compiled sender rules (civic domains and any rules from SENDER_RULES_PATH)
+        self.sender_rules = SenderRules.load(config.SENDER_RULES_PATH, config.CATEGORIES)
+
+        # Memo of recent confident outcomes per bulk sender and subject template
+        self.sender_memo = None
+        if config.SENDER_MEMO_ENABLED:
+            self.sender_memo = SenderMemo(
+                max_entries=config.SENDER_MEMO_MAX_ENTRIES,
+                ttl_seconds=config.SENDER_MEMO_TTL_SECONDS,
+                min_confidence=config.SENDER_MEMO_MIN_CONFIDENCE,
+                min_observations=config.SENDER_MEMO_MIN_OBSERVATIONS
+            )
+
+        # Corrections are learned one at a time on a background thread, never on the
+        # IMAP or trainer thread that detected them
+        self._corrections = queue.Queue(maxsize=self.CORRECTION_QUEUE_SIZE)
+        self._learner = None
+        if config.ONLINE_LEARNING_ENABLED:
+            self._learner = threading.Thread(target=self._learn_corrections, name='online-learning', daemon=True)
+            self._learner.start()
+        if self.sender_memo is not None or config.ONLINE_LEARNING_ENABLED:
+            config.add_reclassification_listener(self._on_reclassification)
+
+        # Near-duplicate index: copies of one campaign reuse the first copy's embedding.
+        # model_version tells it whether stored probabilities came from the current models.
+        self.model_version = 0
+        self.near_duplicates = None
+        if config.NEAR_DUPLICATE_ENABLED:
+            self.near_duplicates = NearDuplicateIndex(
+                max_entries=config.NEAR_DUPLICATE_MAX_ENTRIES,
+                min_similarity=config.NEAR_DUPLICATE_MIN_SIMILARITY
+            )
+
+        # Bounded classification queue for the SMTP path, with its overload policy
+        self.admission = AdmissionController(max_queue=config.ADMISSION_MAX_QUEUE,
+                                             policy=config.OVERLOAD_POLICY,
+                                             max_wait_ms=config.ADMISSION_MAX_WAIT_MS)
+
+        # Worker process pool for live encoding (started by start_inference_pool)
+        self.inference_pool = None
+
+        # Live encodes run ahead of training encodes on the shared encoder
+        self.encoder_gate = EncoderPriorityGate(max_wait_ms=config.TRAINING_MAX_YIELD_MS)
+
+        # Serializes model swaps (classification itself never takes this lock)
+        self._swap_lock = threading.Lock()
+
+        # Micro-batching engine so concurrent classify() calls share forward passes.
+        # One batching thread per inference worker keeps every worker busy.
+        self.inference_engine = None
+        if config.INFERENCE_BATCHING_ENABLED and config.INFERENCE_MAX_BATCH_SIZE > 1:
+            self.inference_engine = BatchingInferenceEngine(
+                self._encode_live_requests,
+                max_batch_size=config.INFERENCE_MAX_BATCH_SIZE,
+                max_wait_ms=config.INFERENCE_MAX_WAIT_MS,
+                num_workers=max(1, config.INFERENCE_WORKERS)
+            )
+            self.inference_engine.start()
+
+        # Persistent embedding store so retraining only encodes new texts
+        self.embedding_cache = None
+        if config.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                config.EMBEDDING_CACHE_DIR,
+                self.encoder_identity,
+                dim=self.hidden_size,
+                dtype=config.EMBEDDING_CACHE_DTYPE
+            )
+
+    @property
+    def encoder_identity(self) -> str:
+        """Identifies everything that changes the embedding produced for a text"""
+        return self.encoder_identity_for(self.max_length)
+
+    def encoder_identity_for(self, max_length: int) -> str:
+        """Encoder identity at a given sequence cap"""
+        identity = f"{self.MODEL_NAME}|max_length={max_length}"
+        # The traced graph runs the same kernels as the eager model, so its embeddings are identical
+        if self.encoder_backend not in ('pytorch', 'torchscript'):
+            identity += f"|{self.encoder_backend}"
+        if self.quantization != 'none':
+            identity += f"|{self.quantization}"
+        return identity
+
+    def load_onnx_encoder(self):
+        """Load the ONNX Runtime encoder, exporting it once if needed. Returns None to fall back to PyTorch."""
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            print("⚠️  onnxruntime is not installed - falling back to PyTorch encoder")
+            return None
+
+        if not os.path.exists(config.ONNX_MODEL_PATH):
+            if not config.ONNX_AUTO_EXPORT:
+                print(f"⚠️  ONNX export not found at {config.ONNX_MODEL_PATH} - falling back to PyTorch encoder")
+                print("   Run 'python onnx_encoder.py export' to create it")
+                return None
+            print(f"Exporting {self.MODEL_NAME} to ONNX (one-time)...")
+            try:
+                export_onnx(AutoModel.from_pretrained(self.MODEL_NAME).eval(), self.tokenizer,
+                            config.ONNX_MODEL_PATH)
+            except Exception as e:
+                print(f"⚠️  ONNX export failed: {e} - falling back to PyTorch encoder")
+                return None
+
+        try:
+            return OnnxEncoder(config.ONNX_MODEL_PATH, num_threads=config.ONNX_NUM_THREADS)
+        except Exception as e:
+            print(f"⚠️  Could not load ONNX model: {e} - falling back to PyTorch encoder")
+            return None
+
+    def load_traced_encoder(self):
+        """Load the TorchScript encoder, (re)building it when missing or stale. Returns None to fall back to PyTorch."""
+        metadata = artifact_metadata(self.MODEL_NAME, config.ENCODER_QUANTIZATION)
+        if os.path.exists(config.TORCHSCRIPT_MODEL_PATH):
+            try:
+                return TracedEncoder.load(config.TORCHSCRIPT_MODEL_PATH, metadata)
+            except Exception as e:
+                print(f"⚠️  TorchScript encoder is stale or unreadable ({e}) - rebuilding")
+
+        print(f"Tracing {self.MODEL_NAME} to TorchScript (one-time)...")
+        if not build_traced_encoder(self.MODEL_NAME, config.ENCODER_QUANTIZATION, config.TORCHSCRIPT_MODEL_PATH):
+            print("⚠️  TorchScript tracing failed - falling back to PyTorch encoder")
+            return None
+        try:
+            return TracedEncoder.load(config.TORCHSCRIPT_MODEL_PATH, metadata)
+        except Exception as e:
+            print(f"⚠️  Could not load TorchScript encoder: {e} - falling back to PyTorch encoder")
+            return None
+
+    @staticmethod
+    def quantize_model(model):
+        """Return a copy of model with its Linear layers dynamically quantized to int8"""
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode_with_lengths(self, texts: list, model=None, max_length: int = None, timings: dict = None,
+                            early_exit=None, deadline: float = None):
+        """
+        Run one padded DistilBERT forward pass, returning features and token lengths.
+        timings, if given, accumulates tokenize and forward seconds. With early_exit
+        heads, each row is an EarlyExit or, if it ran every layer, its embedding.
+        """
+        start = time.perf_counter()
+        encoder = (self.onnx_encoder or self.traced_encoder) if model is None else None
+        inputs = self.tokenizer(texts, return_tensors='np' if encoder is not None else 'pt', truncation=True,
+                               max_length=max_length or self.max_length, padding=True)
+        lengths = inputs['attention_mask'].sum(1).tolist()
+        tokenized = time.perf_counter()
+        self.forward_passes += 1
+
+        if encoder is not None:
+            features = encoder.encode(inputs['input_ids'], inputs['attention_mask'])
+        elif early_exit is not None and model is None:
+            with torch.no_grad():
+                features = early_exit.run(self.bert_model, inputs['input_ids'], inputs['attention_mask'],
+                                          config.EARLY_EXIT_CONFIDENCE, deadline)
         else:
-            self.classifier = LogisticRegression(max_iter=1000, multi_class='multinomial')
-    
-    def extract_features(self, text: str) -> torch.Tensor:
-        """Extract features from text using DistilBERT"""
-        inputs = self.tokenizer(text, return_tensors='pt', truncation=True, 
-                               max_length=512, padding=True)
-        
+            with torch.no_grad():
+                outputs = (model if model is not None else self.bert_model)(**inputs)
+                # Use [CLS] token embedding as text representation
+                features = outputs.last_hidden_state[:, 0, :].numpy()
+
+        if timings is not None:
+            add_timings(timings, {'tokenize': tokenized - start, 'forward': time.perf_counter() - tokenized})
+        return features, lengths
+
+    def encode_layers(self, texts: list, layers: list, max_length: int = None) -> np.ndarray:
+        """[CLS] vectors after each of the given encoder layers, shaped (len(texts), len(layers), hidden)"""
+        inputs = self.tokenizer(texts, return_tensors='pt', truncation=True,
+                                max_length=max_length or self.max_length, padding=True)
+        self.forward_passes += 1
         with torch.no_grad():
-            outputs = self.bert_model(**inputs)
-            # Use [CLS] token embedding as text representation
-            features = outputs.last_hidden_state[:, 0, :].squeeze()
-        
-        return features.numpy()
+            return layer_features(self.bert_model, inputs['input_ids'], inputs['attention_mask'], layers)
+
+    def encode_batch(self, texts: list, model=None, max_length: int = None):
+        """Extract features for a list of texts with one padded DistilBERT forward pass"""
+        return self.encode_with_lengths(texts, model, max_length)[0]
+
+    def _encode_live_batch(self, texts: list, max_length: int = None, timings: dict = None,
+                           early_exit=None, deadline: float = None):
+        """Encode texts for live classification (in a worker process when the pool is running)"""
+        max_length = max_length or self.max_length
+        with self.encoder_gate.live():
+            if self.inference_pool is not None:
+                features, lengths, batch_timings = self.inference_pool.encode(
+                    texts, max_length, early_exit, deadline, timeout=config.INFERENCE_TIMEOUT_SECONDS)
+                if timings is not None:
+                    add_timings(timings, batch_timings)
+            else:
+                features, lengths = self.encode_with_lengths(texts, max_length=max_length, timings=timings,
+                                                             early_exit=early_exit, deadline=deadline)
+        self.live_token_lengths.extend(lengths)
+        return features
+
+    def _encode_live_requests(self, requests: list):
+        """
+        Encode a batch of (text, max_length, early_exit, deadline) requests from the
+        inference engine. Each result is (embedding or EarlyExit, timings of the
+        forward pass it shared); a shared pass keeps the earliest deadline.
+        """
+        results = [None] * len(requests)
+        for max_length, early_exit in set((cap, heads) for _, cap, heads, _ in requests):
+            idx = [i for i, (_, cap, heads, _) in enumerate(requests) if cap == max_length and heads is early_exit]
+            deadlines = [requests[i][3] for i in idx if requests[i][3] is not None]
+            timings = {}
+            features = self._encode_live_batch([requests[i][0] for i in idx], max_length, timings,
+                                               early_exit, min(deadlines) if deadlines else None)
+            for i, feature in zip(idx, features):
+                results[i] = (feature, timings)
+        return results
+
+    def close(self, timeout: float = 5):
+        """
+        Stop receiving corrections, let the online-learning thread finish the ones
+        already queued, and stop the batching engine and inference workers
+        """
+        config.remove_reclassification_listener(self._on_reclassification)
+        if self._learner is not None:
+            try:
+                self._corrections.put(None, timeout=timeout)
+                self._learner.join(timeout)
+            except queue.Full:
+                print("⚠️  Online learning thread did not drain its queue before shutdown")
+            self._learner = None
+        if self.inference_engine is not None:
+            self.inference_engine.stop()
+        if self.inference_pool is not None:
+            self.inference_pool.close()
+            self.inference_pool = None
+
+    def start_inference_pool(self, num_workers: int):
+        """
+        Fork inference worker processes that share this process's encoder weights.
+        Must be called before the first forward pass in this process.
+        """
+        if self.forward_passes:
+            # torch's OpenMP pool is already running here; forked workers could deadlock in it
+            raise RuntimeError("start_inference_pool() must be called before the first forward pass")
+        self.inference_pool = InferencePool(self, num_workers, config.INFERENCE_THREADS_PER_WORKER)
+
+    def warmup(self, rounds: int = None) -> dict:
+        """
+        Run synthetic batches through the live encoder (every inference worker when
+        the pool is running) so lazy initialization in the tokenizer, the encoder and
+        the TorchScript profiling executor is paid before the first email. Live
+        token-length statistics are not touched. Returns the readiness dict.
+        """
+        rounds = max(1, rounds or config.ENCODER_WARMUP_ROUNDS)
+        short = 'Your order has shipped and will arrive on Friday. Track your package online.'
+        batches = [[short], [short * 2] * max(1, config.INFERENCE_MAX_BATCH_SIZE),
+                   [short * (self.max_length // 8 + 1)]]
+        copies = self.inference_pool.num_workers if self.inference_pool is not None else 1
+
+        def encode(texts):
+            if self.inference_pool is not None:
+                futures = [self.inference_pool.submit(texts, self.max_length) for _ in range(copies)]
+                for future in futures:
+                    future.result()
+            else:
+                self.encode_with_lengths(texts, max_length=self.max_length)
+
+        start = time.perf_counter()
+        latencies = []
+        for _ in range(rounds):
+            round_latencies = []
+            for texts in batches:
+                batch_start = time.perf_counter()
+                encode(texts)
+                round_latencies.append((time.perf_counter() - batch_start) * 1000)
+            latencies.append(round_latencies)
+
+        self.readiness.update({
+            'warmed_up': True,
+            'warmup_seconds': time.perf_counter() - start,
+            'cold_latency_ms': latencies[0][0],
+            'warm_latency_ms': latencies[-1][0],
+            'warm_batch_latency_ms': latencies[-1][1],
+        })
+        print(f"🔥 Encoder warmed up in {self.readiness['warmup_seconds']:.1f}s ({self.encoder_backend}): "
+              f"single email {latencies[0][0]:.0f}ms cold → {latencies[-1][0]:.0f}ms warm")
+        return self.readiness
+
+    def encode_many(self, texts: list, batch_size: int = None, encode_fn=None, max_length: int = None,
+                    background: bool = False, progress=None) -> list:
+        """
+        Encode many texts in length-bucketed batches: texts are sorted by token
+        length before batching so short emails are never padded to long ones.
+        Background (training) batches each wait for a quiet moment in live traffic.
+        progress, if given, is called with the number of texts encoded so far.
+        """
+        batch_size = batch_size or config.TRAINING_BATCH_SIZE
+        max_length = max_length or self.max_length
+        encode_fn = encode_fn or (lambda batch: self.encode_batch(batch, max_length=max_length))
+        if len(texts) <= batch_size and not background:
+            return list(encode_fn(texts))
+
+        token_ids = self.tokenizer(texts, truncation=True, max_length=max_length)['input_ids']
+        order = sorted(range(len(texts)), key=lambda i: len(token_ids[i]))
+
+        features = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch_idx = order[start:start + batch_size]
+            if background:
+                self.encoder_gate.wait_for_turn()
+            batch_features = encode_fn([texts[i] for i in batch_idx])
+            for i, feature in zip(batch_idx, batch_features):
+                features[i] = feature
+            if progress is not None:
+                progress(start + len(batch_idx))
+        return features
+
+    def extract_features(self, text: str, max_length: int = None, timings: dict = None,
+                         early_exit=None, deadline: float = None):
+        """
+        Extract features from text using DistilBERT (batched with concurrent requests when enabled).
+        With early_exit heads the result may be an EarlyExit instead of an embedding.
+        """
+        max_length = max_length or self.max_length
+        if self.inference_engine is not None:
+            # Queued behind at most one batch, then a worker encode bounded by the same timeout
+            feature, batch_timings = self.inference_engine.encode((text, max_length, early_exit, deadline),
+                                                                  timeout=2 * config.INFERENCE_TIMEOUT_SECONDS)
+            if timings is not None:
+                add_timings(timings, batch_timings)
+            return feature
+        return self._encode_live_batch([text], max_length, timings, early_exit, deadline)[0]
+
+    def extract_features_batch(self, texts: list, max_length: int = None, timings: dict = None,
+                               early_exit=None, deadline: float = None) -> list:
+        """Extract live features for many texts in as few padded forward passes as possible"""
+        max_length = max_length or self.max_length
+        if len(texts) == 1:
+            return [self.extract_features(texts[0], max_length, timings, early_exit, deadline)]
+        return self.encode_many(texts, batch_size=max(config.TRAINING_BATCH_SIZE, config.INFERENCE_MAX_BATCH_SIZE),
+                                encode_fn=lambda batch: self._encode_live_batch(batch, max_length, timings,
+                                                                                early_exit, deadline))
+
+    def get_training_features(self, texts: list, max_length: int = None, progress=None) -> list:
+        """
+        Return embeddings for training texts at a sequence cap, encoding only those
+        not already cached (in a worker process when the pool is running).
+        progress, if given, is called with (texts done, total).
+        """
+        max_length = max_length or self.max_length
+        identity = self.encoder_identity_for(max_length)
+        features = self.embedding_cache.get_many(texts, identity) if self.embedding_cache else [None] * len(texts)
+        missing = [i for i, feature in enumerate(features) if feature is None]
+        if self.embedding_cache:
+            print(f"  Embedding cache: {len(texts) - len(missing)} cached, {len(missing)} to encode")
+
+        # Encode directly rather than through the batching engine so training
+        # does not wait on the live-traffic batching window, yielding to live
+        # encodes between batches. Chunks are cached as they finish, so a run
+        # that times out still saves the next one that work.
+        encode_fn = None
+        if self.inference_pool is not None:
+            # Once workers have been forked from this process it must not start torch's thread pool itself
+            encode_fn = lambda batch: self.inference_pool.encode(
+                batch, max_length, timeout=config.INFERENCE_TIMEOUT_SECONDS)[0]
+        done = len(texts) - len(missing)
+        if progress is not None:
+            progress(done, len(texts))
+        for start in range(0, len(missing), self.TRAINING_CACHE_CHUNK):
+            chunk = missing[start:start + self.TRAINING_CACHE_CHUNK]
+            chunk_texts = [texts[i] for i in chunk]
+            encoded = self.encode_many(chunk_texts, max_length=max_length, encode_fn=encode_fn, background=True,
+                                       progress=progress and (lambda n: progress(done + n, len(texts))))
+            for i, feature in zip(chunk, encoded):
+                features[i] = feature
+            if self.embedding_cache:
+                self.embedding_cache.put_many(chunk_texts, encoded, identity)
+            done += len(chunk)
+
+        return features
+
+    @staticmethod
+    def length_percentiles(lengths) -> dict:
+        """Summarize a token-length distribution"""
+        if len(lengths) == 0:
+            return {'count': 0}
+        lengths = np.asarray(lengths)
+        return {
+            'count': int(len(lengths)),
+            'p50': int(np.percentile(lengths, 50)),
+            'p90': int(np.percentile(lengths, 90)),
+            'p95': int(np.percentile(lengths, 95)),
+            'p99': int(np.percentile(lengths, 99)),
+            'max': int(lengths.max()),
+        }
+
+    def choose_sequence_length(self, texts: list) -> int:
+        """
+        In auto mode, pick max_length from the training token-length distribution
+        (SEQUENCE_LENGTH_PERCENTILE, rounded up to a multiple of 32). The current cap
+        is kept while it still covers that percentile without being more than twice
+        as long, so retraining does not flap between values (each change means
+        re-encoding the corpus). Live traffic keeps the current cap until the model
+        trained at the new one is swapped in.
+        """
+        lengths = [len(ids) for ids in self.tokenizer(texts, truncation=False, verbose=False)['input_ids']]
+        self.training_token_stats = self.length_percentiles(lengths)
+        stats = self.training_token_stats
+        print(f"  Token lengths: p50={stats['p50']}, p95={stats['p95']}, p99={stats['p99']}, max={stats['max']}")
+
+        if config.MAX_SEQUENCE_LENGTH != 'auto':
+            return self.max_length
+
+        target = int(np.percentile(lengths, config.SEQUENCE_LENGTH_PERCENTILE))
+        target = max(32, min(self.MAX_LENGTH, -(-target // 32) * 32))
+        if target <= self.max_length <= 2 * target:
+            return self.max_length
+
+        print(f"  Sequence cap: {self.max_length} → {target} tokens "
+              f"(p{config.SEQUENCE_LENGTH_PERCENTILE:g} of training emails)")
+        return target
+
+    def get_token_length_stats(self) -> dict:
+        """Token-length distribution of live and training emails against the current cap"""
+        live = list(self.live_token_lengths)
+        return {
+            'max_length': self.max_length,
+            'mode': 'auto' if config.MAX_SEQUENCE_LENGTH == 'auto' else 'fixed',
+            'live': self.length_percentiles(live),
+            'live_truncated_fraction': (sum(1 for n in live if n >= self.max_length) / len(live)) if live else 0.0,
+            'training': self.training_token_stats,
+        }
+
+    def prune_embedding_cache(self, texts: list):
+        """
+        Evict cached embeddings for texts that are no longer in training data.
+        Embeddings at the serving cap and at the cap of the last training run are
+        kept, so a retrain whose model was rejected is not re-encoded next time.
+        """
+        if self.embedding_cache is None:
+            return
+        identities = {self.encoder_identity_for(self.max_length)}
+        if self.trained_max_length is not None:
+            identities.add(self.encoder_identity_for(self.trained_max_length))
+        evicted = self.embedding_cache.retain(texts, sorted(identities))
+        if evicted:
+            print(f"  🧹 Evicted {evicted} cached embeddings no longer in training data")
     
     def decode_subject(self, subject):
         """Decode MIME-encoded email subject"""
@@ -55,134 +581,367 @@ class EmailClassifier:
                 parts.append(content)
         return ''.join(parts)
 
-    def parse_email(self, raw_email: str) -> tuple:
-        """Parse email and extract relevant text"""
-        msg = message_from_string(raw_email)
+    def parse_email(self, raw_email) -> tuple:
+        """
+        Parse an email (bytes or str) and extract relevant text. Only the headers
+        and the first text needed for the snippet are parsed (see mime_stream).
+        """
+        headers, body = mime_stream.extract_text(raw_email, snippet_chars=1000,
+                                                 max_scan_bytes=config.MIME_MAX_SCAN_BYTES,
+                                                 max_parts=config.MIME_MAX_PARTS)
 
         # Extract and decode subject
-        raw_subject = msg.get('subject', '')
-        subject = self.decode_subject(raw_subject)
-        
-        # Extract body
-        body = ''
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == 'text/plain':
-                    body += part.get_payload(decode=True).decode('utf-8', errors='ignore')
-        else:
-            body = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
-        
+        subject = self.decode_subject(headers.get('subject', ''))
+
         # Extract sender
-        from_addr = parseaddr(msg.get('from', ''))[1]
-        
+        from_addr = parseaddr(headers.get('from', ''))[1]
+
         # Combine subject and body (first 1000 chars of body)
-        text = f"{subject} {body[:1000]}"
-        
-        message_id = msg.get('message-id', '')
-        
-        return text, subject, from_addr, message_id, msg
-    
+        text = f"{subject} {body}"
+
+        message_id = headers.get('message-id', '')
+
+        return text, subject, from_addr, message_id, headers
+
+    def reload_sender_rules(self):
+        """Recompile the sender rules from SENDER_RULES_PATH (hit counts start over)"""
+        self.sender_rules = SenderRules.load(config.SENDER_RULES_PATH, config.CATEGORIES)
+        return self.sender_rules
+
+    def apply_sender_heuristics_batch(self, from_addrs: list, probabilities) -> np.ndarray:
+        """Apply the sender rules to a (num_emails, num_categories) probability matrix"""
+        return self.sender_rules.apply_batch([sender_domain_of(a) for a in from_addrs], probabilities)
+
     def apply_sender_heuristics(self, from_addr: str, probabilities: list) -> list:
         """Apply sender-based heuristics to adjust classification probabilities"""
-        adjusted_probs = probabilities.copy()
+        return self.apply_sender_heuristics_batch([from_addr], [probabilities])[0].tolist()
 
-        # Extract domain from sender email
-        domain = from_addr.lower().split('@')[-1] if '@' in from_addr else ''
+    def apply_user_weights_batch(self, user_emails: list, probabilities: np.ndarray) -> np.ndarray:
+        """Scale each row by its user's category weights and renormalize (rows without a user are unchanged)"""
+        weighted_probs = probabilities.copy()
+        has_user = np.array([bool(user_email) for user_email in user_emails], dtype=bool)
+        if not has_user.any():
+            return weighted_probs
 
-        # Government and civic organization domains should be classified as personal, not shopping
-        civic_domains = ['.gov', '.edu', '.org']
-        civic_keywords = ['government', 'county', 'city', 'state', 'municipal', 'district', 'commissioner']
+        # One weights lookup per distinct user in the batch
+        user_weights = {}
+        weights = np.ones_like(probabilities)
+        for i in np.flatnonzero(has_user):
+            user_email = user_emails[i]
+            if user_email not in user_weights:
+                preferences = config.get_user_weights(user_email)
+                user_weights[user_email] = [preferences.get(category, 1.0) for category in config.CATEGORIES]
+            weights[i] = user_weights[user_email]
 
-        is_civic = False
+        weighted_probs[has_user] *= weights[has_user]
+        weighted_probs[has_user] /= weighted_probs[has_user].sum(axis=1, keepdims=True)
+        return weighted_probs
 
-        # Check domain
-        for civic_domain in civic_domains:
-            if domain.endswith(civic_domain):
-                is_civic = True
-                break
+    def classify(self, raw_email, user_email: str = None) -> tuple:
+        """
+        Classify an email and return category, confidence, processing time, probability
+        breakdown and a details dict (the cascade stage that decided)
+        """
+        return self.classify_batch([raw_email], [user_email])[0]
 
-        # Check if domain contains civic keywords
-        if not is_civic:
-            for keyword in civic_keywords:
-                if keyword in domain:
-                    is_civic = True
-                    break
-
-        # If civic email, strongly bias away from shopping toward personal
-        if is_civic and 'shopping' in config.CATEGORIES:
-            shopping_idx = config.CATEGORIES.index('shopping')
-            personal_idx = config.CATEGORIES.index('personal') if 'personal' in config.CATEGORIES else 0
+    def classify_degraded(self, raw_email, user_email: str = None) -> tuple:
+        """
+        Cheap classification for overload, without DistilBERT: the sender memo, or
+        else the cascade n-gram model on the subject and sender domain at whatever
+        confidence, then sender rules and user weights. Returns a classify() tuple
+        with stage 'degraded'.
+        """
+        start_time = time.time()
+        timings = {}
+        stage_start = time.perf_counter()
+        text, subject, from_addr, message_id, msg = self.parse_email(raw_email)
+        sender_domain = sender_domain_of(from_addr)
+        timings['parse'] = time.perf_counter() - stage_start
 
-            # Reduce shopping probability by 80%
-            shopping_prob = adjusted_probs[shopping_idx]
-            adjusted_probs[shopping_idx] = shopping_prob * 0.2
+        stage_start = time.perf_counter()
+        memo = self.sender_memo.get(SenderMemo.make_key(sender_domain, subject)) if self.sender_memo else None
+        timings['lookup'] = time.perf_counter() - stage_start
 
-            # Add the reduced probability to personal
-            adjusted_probs[personal_idx] += shopping_prob * 0.8
+        fast_model = self.fast_model
+        if memo is not None:
+            probabilities = np.asarray(memo[1], dtype=np.float64)
+        elif fast_model is not None and list(fast_model.classes) == config.CATEGORIES:
+            stage_start = time.perf_counter()
+            probabilities = fast_model.predict_proba(f"{subject} {sender_domain}")
+            timings['cascade'] = time.perf_counter() - stage_start
+        else:
+            probabilities = np.full(len(config.CATEGORIES), 1.0 / len(config.CATEGORIES))
 
-            # Normalize
-            total = sum(adjusted_probs)
-            adjusted_probs = [p / total for p in adjusted_probs]
+        stage_start = time.perf_counter()
+        probabilities = self.sender_rules.apply_batch([sender_domain], [probabilities])
+        final_probs = self.apply_user_weights_batch([user_email], probabilities)[0].tolist()
+        best = int(np.argmax(final_probs))
+        timings['predict'] = time.perf_counter() - stage_start
 
-        return adjusted_probs
+        prob_dict = {config.CATEGORIES[j]: final_probs[j] for j in range(len(config.CATEGORIES))}
+        details = {'stage': 'degraded', 'timings': timings, 'model_id': None, 'exit_layer': None}
+        return (config.CATEGORIES[best], final_probs[best], time.time() - start_time, message_id, subject,
+                prob_dict, sender_domain, details)
 
-    def classify(self, raw_email: str, user_email: str = None) -> tuple:
-        """Classify an email and return category, confidence, processing time, and probability breakdown"""
+    def classify_batch(self, raw_emails: list, user_emails: list = None) -> list:
+        """
+        Classify many emails at once: one batched encode for every email the cascade
+        escalates, one predict_proba call, and vectorized heuristics and user weights.
+        Returns one classify() tuple per email; processing time is the batch time
+        divided evenly across its emails, and so are the per-stage timings in
+        details['timings'] for stages that run once for the whole batch.
+        """
         start_time = time.time()
+        if user_emails is None:
+            user_emails = [None] * len(raw_emails)
+        timings = [{} for _ in raw_emails]
+        deadline = None
+        if config.EARLY_EXIT_LATENCY_BUDGET_MS > 0:
+            deadline = time.monotonic() + config.EARLY_EXIT_LATENCY_BUDGET_MS / 1000
 
-        text, subject, from_addr, message_id, msg = self.parse_email(raw_email)
-        features = self.extract_features(text)
+        parsed = []
+        for i, raw_email in enumerate(raw_emails):
+            stage_start = time.perf_counter()
+            parsed.append(self.parse_email(raw_email))
+            timings[i]['parse'] = time.perf_counter() - stage_start
+        texts = [p[0] for p in parsed]
+        from_addrs = [p[2] for p in parsed]
 
         # Extract sender domain for explainability
-        sender_domain = from_addr.lower().split('@')[-1] if '@' in from_addr else ''
-
-        if self.classifier is None or not hasattr(self.classifier, 'classes_'):
-            # No trained model yet, default to personal
-            processing_time = time.time() - start_time
-            default_probs = {'personal': 0.5, 'shopping': 0.25, 'spam': 0.25}
-            return 'personal', 0.5, processing_time, message_id, subject, default_probs, sender_domain
-
-        # Predict
-        prediction = self.classifier.predict([features])[0]
-        probabilities = self.classifier.predict_proba([features])[0]
-
-        # Apply sender-based heuristics
-        probabilities = self.apply_sender_heuristics(from_addr, probabilities)
-
-        # Apply user weights if available
-        if user_email:
-            weights = config.get_user_weights(user_email)
-            weighted_probs = []
-            for i, category in enumerate(config.CATEGORIES):
-                weighted_probs.append(probabilities[i] * weights.get(category, 1.0))
-
-            # Normalize
-            total = sum(weighted_probs)
-            weighted_probs = [p / total for p in weighted_probs]
-
-            # Get prediction from weighted probabilities
-            max_idx = weighted_probs.index(max(weighted_probs))
-            prediction = config.CATEGORIES[max_idx]
-            confidence = weighted_probs[max_idx]
-            final_probs = weighted_probs
-        else:
-            # Get prediction from heuristics-adjusted probabilities
-            if hasattr(probabilities, 'tolist'):
-                prob_list = probabilities.tolist()
+        sender_domains = [sender_domain_of(from_addr) for from_addr in from_addrs]
+        memo_keys = [SenderMemo.make_key(sender_domains[i], parsed[i][1]) if self.sender_memo else None
+                     for i in range(len(parsed))]
+
+        # Snapshot the serving model: a swap during this batch does not affect it
+        classifier, max_length, model_version = self.classifier, self.max_length, self.model_version
+        early_exit = self.early_exit
+
+        # Sender memo, near-duplicates, then cascade: all answer without the DistilBERT forward pass
+        probabilities = np.zeros((len(raw_emails), len(config.CATEGORIES)))
+        stages = ['cascade'] * len(raw_emails)
+        signatures = [None] * len(raw_emails)
+        duplicates = {}      # row -> near-duplicate entry whose embedding needs rescoring
+        known_features = {}  # row -> embedding (reused or freshly encoded)
+        exit_layers = {}     # row -> encoder layer it left at, in early-exit mode
+        escalated = []
+        for i, text in enumerate(texts):
+            stage_start = time.perf_counter()
+            memo = self.sender_memo.get(memo_keys[i]) if self.sender_memo else None
+            if memo is not None:
+                stages[i] = 'memo'
+                probabilities[i] = memo[1]
+                timings[i]['lookup'] = time.perf_counter() - stage_start
+                continue
+
+            if self.near_duplicates is not None:
+                signatures[i] = self.near_duplicates.signature(text)
+                duplicate = self.near_duplicates.lookup(signatures[i])
+                if duplicate is not None and duplicate['model_version'] == model_version:
+                    stages[i] = 'near_duplicate'
+                    probabilities[i] = duplicate['probabilities']
+                    timings[i]['lookup'] = time.perf_counter() - stage_start
+                    continue
+                if duplicate is not None and duplicate['features'] is not None:
+                    # Stored by an older model - rescore the cached embedding
+                    stages[i] = 'near_duplicate'
+                    duplicates[i] = duplicate
+                    known_features[i] = duplicate['features']
+                    escalated.append(i)
+                    timings[i]['lookup'] = time.perf_counter() - stage_start
+                    continue
+            timings[i]['lookup'] = time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            fast_probs = self.fast_predict(text)
+            timings[i]['cascade'] = time.perf_counter() - stage_start
+            if fast_probs is None:
+                stages[i] = 'bert'
+                escalated.append(i)
             else:
-                prob_list = list(probabilities)
-            max_idx = prob_list.index(max(prob_list))
-            prediction = config.CATEGORIES[max_idx]
-            confidence = max(prob_list)
-            final_probs = prob_list
+                probabilities[i] = fast_probs
 
-        # Create probability dictionary for explainability
-        prob_dict = {config.CATEGORIES[i]: final_probs[i] for i in range(len(config.CATEGORIES))}
+        trained = classifier is not None
+        predict_start = time.perf_counter()
+        if escalated and trained:
+            to_encode = [i for i in escalated if i not in known_features]
+            if to_encode:
+                encode_timings = {}
+                stage_start = time.perf_counter()
+                encoded = self.extract_features_batch([texts[i] for i in to_encode], max_length, encode_timings,
+                                                      early_exit, deadline)
+                encode_time = time.perf_counter() - stage_start
+                known_features.update(zip(to_encode, encoded))
 
-        processing_time = time.time() - start_time
+                # Time not spent tokenizing or in the forward pass went to batching and worker hand-off
+                encode_timings['queue'] = max(0.0, encode_time - sum(encode_timings.values()))
+                for i in to_encode:
+                    timings[i].update({stage: t / len(to_encode) for stage, t in encode_timings.items()})
+                predict_start = time.perf_counter()
+            # Rows that left the encoder early were already scored by their layer's head
+            for i in escalated:
+                if isinstance(known_features[i], EarlyExit):
+                    exit_layers[i], probabilities[i] = known_features.pop(i)
+            full_depth = [i for i in escalated if i in known_features]
+            if full_depth:
+                features = np.asarray([known_features[i] for i in full_depth])
+                probabilities[full_depth] = classifier.predict_proba(features)
+            if early_exit is not None:
+                for i in to_encode:
+                    exit_layers.setdefault(i, early_exit.metadata.get('num_layers'))
+        elif escalated:
+            # Placeholder rows; replaced by the untrained default below
+            for i in escalated:
+                stages[i] = 'bert'
+            probabilities[escalated] = 1.0 / len(config.CATEGORIES)
 
-        return prediction, confidence, processing_time, message_id, subject, prob_dict, sender_domain
+        # Remember fresh model outcomes so repeated mail can skip the encoder
+        unscored = set() if trained else set(escalated)
+        for i, stage in enumerate(stages):
+            if stage == 'memo' or i in unscored:
+                continue
+            row = probabilities[i]
+            if i in duplicates:
+                self.near_duplicates.update(duplicates[i], row, model_version)
+            elif self.near_duplicates is not None and stage != 'near_duplicate':
+                self.near_duplicates.add(signatures[i], known_features.get(i), row, model_version)
+            if self.sender_memo is not None:
+                self.sender_memo.observe(memo_keys[i], config.CATEGORIES[int(row.argmax())], row.tolist())
+
+        probabilities = self.sender_rules.apply_batch(sender_domains, probabilities)
+        probabilities = self.apply_user_weights_batch(user_emails, probabilities)
+        best = probabilities.argmax(axis=1)
+        predict_time = (time.perf_counter() - predict_start) / max(1, len(raw_emails))
+
+        processing_time = (time.time() - start_time) / max(1, len(raw_emails))
+        model_id = classifier.metadata.get('model_id') if trained else None
+
+        results = []
+        for i, (text, subject, from_addr, message_id, msg) in enumerate(parsed):
+            sender_domain = sender_domains[i]
+            timings[i]['predict'] = predict_time
+            details = {'stage': stages[i], 'timings': timings[i], 'model_id': model_id,
+                       'exit_layer': exit_layers.get(i)}
+
+            if stages[i] == 'bert' and not trained:
+                # No trained model yet, default to personal
+                default_probs = {'personal': 0.5, 'shopping': 0.25, 'spam': 0.25}
+                results.append(('personal', 0.5, processing_time, message_id, subject,
+                                default_probs, sender_domain, details))
+                continue
+
+            final_probs = probabilities[i].tolist()
+            prediction = config.CATEGORIES[best[i]]
+            confidence = final_probs[best[i]]
+
+            # Create probability dictionary for explainability
+            prob_dict = {config.CATEGORIES[j]: final_probs[j] for j in range(len(config.CATEGORIES))}
+            results.append((prediction, confidence, processing_time, message_id, subject,
+                            prob_dict, sender_domain, details))
+
+        return results
     
+    def _on_reclassification(self, message_id, user_email, sender_domain, old_category, new_category):
+        """A user corrected mail from this sender: stop answering it from the memo and learn from it"""
+        if sender_domain and self.sender_memo is not None:
+            removed = self.sender_memo.invalidate_sender(sender_domain)
+            if removed:
+                print(f"   🧹 Dropped {removed} memoized outcomes for {sender_domain}")
+        if config.ONLINE_LEARNING_ENABLED:
+            self.queue_correction(message_id, user_email, new_category)
+
+    def queue_correction(self, message_id: str, user_email: str, new_category: str) -> bool:
+        """Hand a correction to the online-learning thread; False when its queue is full"""
+        try:
+            self._corrections.put_nowait((message_id, user_email, new_category))
+            return True
+        except queue.Full:
+            print(f"   ⚠️  Online learning queue full - {message_id} waits for the next full retrain")
+            return False
+
+    def _learn_corrections(self):
+        while True:
+            correction = self._corrections.get()
+            if correction is None:
+                # Sentinel from close()
+                self._corrections.task_done()
+                return
+            message_id, user_email, new_category = correction
+            try:
+                self.learn_correction(message_id, user_email, new_category)
+            except Exception as e:
+                print(f"   ⚠️  Online update failed for {message_id}: {e}")
+            finally:
+                self._corrections.task_done()
+
+    def learn_correction(self, message_id: str, user_email: str, new_category: str) -> bool:
+        """
+        Apply one user correction to the serving model immediately with a few SGD
+        steps on its embedding. The periodic full retrain still refits from scratch.
+        """
+        classifier, max_length = self.classifier, self.max_length
+        if classifier is None or new_category not in classifier.classes_:
+            return False
+        text = config.get_training_text(message_id, user_email)
+        if not text:
+            return False
+
+        features = self.get_training_features([text], max_length)
+        model, steps = classifier.partial_fit(features, [new_category],
+                                              learning_rate=config.ONLINE_LEARNING_RATE,
+                                              max_steps=config.ONLINE_LEARNING_MAX_STEPS)
+        if not np.all(np.isfinite(model.coef_)):
+            print("   ⚠️  Online update skipped: non-finite weights")
+            return False
+        if self.swap_model(model, max_length, replaces=classifier) is None:
+            # A full retrain swapped in meanwhile; the next one includes this correction
+            return False
+        print(f"   🎯 Online update: learned '{new_category}' for {message_id} in {steps} steps "
+              f"({model.metadata['online_updates']} since last full retrain)")
+        return True
+
+    def fast_predict(self, text: str):
+        """
+        Probabilities (in CATEGORIES order) from the n-gram stage when it is enabled
+        and confident enough, otherwise None to escalate to DistilBERT
+        """
+        fast_model = self.fast_model
+        if not config.CASCADE_ENABLED or fast_model is None or not fast_model.enabled:
+            return None
+        if list(fast_model.classes) != config.CATEGORIES:
+            return None
+
+        probabilities = fast_model.predict_proba(text)
+        if probabilities.max() < config.CASCADE_CONFIDENCE_THRESHOLD:
+            return None
+        return probabilities
+
+    def train_fast_model(self, texts: list, labels: list):
+        """Train and save the n-gram cascade stage from the same training data as the main model"""
+        if not config.CASCADE_ENABLED:
+            return
+        print("  Training cascade n-gram model...")
+        start_time = time.time()
+        try:
+            fast_model = HashedNgramClassifier()
+            stats = fast_model.train(texts, labels, config.CASCADE_CONFIDENCE_THRESHOLD,
+                                     config.CASCADE_MIN_PRECISION)
+            fast_model.save(self.fast_model_path)
+        except Exception as e:
+            print(f"  ⚠️  Cascade model training failed: {e}")
+            return
+
+        # Swap in the new model only once it is complete
+        self.fast_model = fast_model
+        self.model_version += 1
+        if self.sender_memo is not None:
+            self.sender_memo.clear()
+        if 'precision' in stats:
+            print(f"  Cascade holdout: {stats['coverage']*100:.1f}% decided at "
+                  f"≥{config.CASCADE_CONFIDENCE_THRESHOLD:g} confidence, "
+                  f"{stats['precision']*100:.1f}% precision")
+        state = 'enabled' if fast_model.enabled else 'disabled (precision below CASCADE_MIN_PRECISION or too little data)'
+        print(f"  ✓ Cascade model trained in {time.time() - start_time:.2f}s - {state}")
+
     def train(self, texts: list, labels: list):
         """Train the classifier with email texts and labels"""
         if len(texts) < len(config.CATEGORIES):
@@ -193,47 +952,41 @@ class EmailClassifier:
         print(f"Training on {len(texts)} emails...")
         start_time = time.time()
 
-        # Extract features for all texts
-        print("  Extracting features...")
-        features = [self.extract_features(text) for text in texts]
-        feature_time = time.time() - start_time
-        print(f"  Feature extraction completed in {feature_time:.2f}s")
-
-        # Train with timeout
-        print("  Training model...")
-        training_result = {'success': False, 'error': None}
-
-        def train_worker():
-            try:
-                self.classifier.fit(features, labels)
-                training_result['success'] = True
-            except Exception as e:
-                training_result['error'] = str(e)
-
-        thread = threading.Thread(target=train_worker)
-        thread.daemon = True
-        thread.start()
-        thread.join(timeout=config.MAX_TRAINING_TIME_SECONDS)
-
-        if thread.is_alive():
-            print(f"  ⚠️  Training timeout after {config.MAX_TRAINING_TIME_SECONDS}s - model training aborted")
+        # Encode and fit in a worker process that can be killed cleanly
+        max_length = self.choose_sequence_length(texts)
+        self.trained_max_length = max_length
+        print("  Extracting features and training model in worker process...")
+        try:
+            result = run_training_job(self.encoder_gate, texts, labels, max_length)
+        except TrainingError as e:
+            print(f"  ✗ Training failed: {e}")
             config.set_training_status(False)
             return False
 
-        if not training_result['success']:
-            error = training_result.get('error', 'Unknown error')
-            print(f"  ✗ Training failed: {error}")
+        model, features, feature_time = result['model'], result['features'], result['feature_time']
+        training_time = time.time() - start_time
+        print(f"  Feature extraction completed in {feature_time:.2f}s, "
+              f"fit in {model.metadata['fit_iterations']} iterations")
+
+        store = result['feature_store']
+        if store is not None:
+            projection = store['projection']
+            print(f"  📉 Features projected ({projection['kind']}) from {projection['input_dim']} to "
+                  f"{projection['dim']} dims: {store['num_samples'] * store['dim'] * 2:,} bytes of float16"
+                  + (f", {projection['explained_variance']*100:.1f}% of variance kept"
+                     if 'explained_variance' in projection else ''))
+
+        if not self.validate_model(model, features, labels, result['validation']):
             config.set_training_status(False)
             return False
 
-        training_time = time.time() - start_time
-        self.save_model()
+        model_size = self.swap_model(model, max_length)
+        self.update_early_exit(result['early_exit'])
 
         # Collect and log model stats
-        num_features = len(features[0]) if features else 0
-        num_classes = len(self.classifier.classes_) if hasattr(self.classifier, 'classes_') else 0
-        num_coefficients = self.classifier.coef_.size if hasattr(self.classifier, 'coef_') else 0
-        model_size = os.path.getsize(self.model_path) if os.path.exists(self.model_path) else 0
+        num_features = model.num_features
+        num_classes = len(model.classes_)
+        num_coefficients = model.coef_.size
 
         config.log_model_stats(
             model_name='LogisticRegression',
@@ -250,17 +1003,144 @@ class EmailClassifier:
         print(f"  📊 Model stats: {num_features} features, {num_classes} classes, {num_coefficients} coefficients, {model_size:,} bytes")
         return True
     
+    def validate_model(self, model, features: list, labels: list, validation: dict = None) -> bool:
+        """
+        Check a newly trained model before it replaces the serving one: finite
+        weights of the right shape, and accuracy on the training features no more
+        than MODEL_SWAP_MAX_ACCURACY_DROP below the serving model's. validation
+        carries both accuracies when the training worker measured them itself
+        (projected features are not sent back).
+        """
+        if model.num_features != self.hidden_size:
+            print(f"  ✗ New model rejected: {model.num_features} features, encoder produces {self.hidden_size}")
+            return False
+        # -inf intercepts are legal: aligned_to() uses them for categories absent from training
+        intercept = np.asarray(model.intercept_)
+        if not np.all(np.isfinite(model.coef_)) or not np.all(np.isfinite(intercept) | np.isneginf(intercept)):
+            print("  ✗ New model rejected: non-finite weights")
+            return False
+
+        labels = np.asarray(labels)
+        if validation is not None:
+            new_accuracy = validation['accuracy']
+        else:
+            features = np.asarray(features)
+            new_accuracy = float(np.mean(model.predict(features) == labels))
+
+        current = self.classifier
+        current_accuracy = None
+        if current is not None and current.encoder_identity == model.encoder_identity:
+            if validation is not None:
+                current_accuracy = validation['serving_accuracy']
+            else:
+                current_accuracy = float(np.mean(current.predict(features) == labels))
+        if current_accuracy is not None:
+            print(f"  Validation accuracy: new {new_accuracy*100:.1f}%, serving {current_accuracy*100:.1f}%")
+            if new_accuracy < current_accuracy - config.MODEL_SWAP_MAX_ACCURACY_DROP:
+                print("  ✗ New model rejected: accuracy dropped by more than MODEL_SWAP_MAX_ACCURACY_DROP - "
+                      "keeping the serving model")
+                return False
+        else:
+            print(f"  Validation accuracy: new {new_accuracy*100:.1f}%")
+        return True
+
+    def swap_model(self, model, max_length: int, replaces=None):
+        """
+        Atomically replace the serving model (and the sequence cap it was trained
+        at) and persist it. Classifications already running keep the model they
+        started with. With replaces, the swap only happens if that model is still
+        serving. Returns the saved model's size in bytes, or None if not swapped.
+        """
+        with self._swap_lock:
+            if replaces is not None and self.classifier is not replaces:
+                return None
+            # Saved under the lock so the artifact on disk is always the serving model
+            model_size = model.save(self.model_path)
+            if max_length != self.max_length:
+                with open(self.encoder_config_path, 'w') as f:
+                    json.dump({'max_length': max_length}, f)
+                if self.near_duplicates is not None:
+                    # Stored embeddings were produced under the old cap
+                    self.near_duplicates.clear()
+            self.classifier = model
+            self.max_length = max_length
+            self.model_version += 1
+            if self.embedding_cache is not None:
+                self.embedding_cache.model_identity = self.encoder_identity_for(max_length)
+
+            # Memoized outcomes came from the previous model
+            if self.sender_memo is not None:
+                self.sender_memo.clear()
+        if replaces is None:
+            print(f"  🔄 Swapped in new model {model.metadata.get('model_id', '')}")
+        return model_size
+
     def save_model(self):
-        """Save the trained classifier"""
-        with open(self.model_path, 'wb') as f:
-            pickle.dump(self.classifier, f)
+        """Save the trained classifier as a NumPy artifact; returns its size in bytes"""
+        return self.classifier.save(self.model_path)
     
     def load_model(self):
-        """Load a trained classifier"""
+        """Load the trained classifier artifact, converting a legacy pickled model once"""
         try:
-            with open(self.model_path, 'rb') as f:
-                self.classifier = pickle.load(f)
+            if os.path.exists(self.model_path):
+                model = LinearSoftmaxModel.load(self.model_path)
+            elif os.path.exists(self.legacy_model_path):
+                model = self.convert_legacy_model()
+            else:
+                model = None
+            if model is None:
+                return
+            if model.encoder_identity and model.encoder_identity != self.encoder_identity:
+                print(f"⚠️  Model was trained on '{model.encoder_identity}' embeddings but the encoder is "
+                      f"'{self.encoder_identity}' - retrain for best accuracy")
+            self.classifier = model.aligned_to(config.CATEGORIES)
             print("Loaded existing model")
         except Exception as e:
             print(f"Error loading model: {e}")
-            self.classifier = LogisticRegression(max_iter=1000, multi_class='multinomial')
+            self.classifier = None
+
+    def update_early_exit(self, heads):
+        """Serve freshly trained early-exit heads (None disables early exit)"""
+        if heads is not None:
+            heads.save(self.early_exit_path)
+            evaluation = heads.metadata['evaluation']
+            policy = min(evaluation['thresholds'], key=lambda t: abs(t['threshold'] - config.EARLY_EXIT_CONFIDENCE))
+            print(f"  🚪 Early-exit heads for layers {heads.layers}: holdout accuracy "
+                  f"{policy['accuracy']*100:.1f}% at threshold {policy['threshold']} "
+                  f"(full depth {evaluation['full_depth_accuracy']*100:.1f}%), "
+                  f"{policy['mean_layers']:.1f} layers on average")
+        self.early_exit = heads
+
+    def load_early_exit(self):
+        """Load the early-exit heads when the mode is enabled and they match the encoder"""
+        if not config.EARLY_EXIT_ENABLED:
+            return
+        if self.bert_model is None:
+            print(f"⚠️  EARLY_EXIT_ENABLED needs the eager PyTorch encoder ({self.encoder_backend} is in use) - ignoring")
+            return
+        if not os.path.exists(self.early_exit_path):
+            return
+        try:
+            heads = EarlyExitHeads.load(self.early_exit_path)
+        except Exception as e:
+            print(f"Error loading early-exit heads: {e}")
+            return
+        if heads.encoder_identity != self.encoder_identity:
+            print("⚠️  Early-exit heads were trained for a different encoder - retrain to enable early exit")
+            return
+        self.early_exit = heads
+        print(f"Loaded early-exit heads for layers {heads.layers}")
+
+    def convert_legacy_model(self):
+        """Export the coefficients of a pickled sklearn LogisticRegression to the NumPy artifact"""
+        import pickle
+
+        with open(self.legacy_model_path, 'rb') as f:
+            legacy = pickle.load(f)
+        if not hasattr(legacy, 'coef_'):
+            return None
+        # The pickle does not record the encoder; assume the current one
+        model = LinearSoftmaxModel.from_sklearn(legacy, self.encoder_identity, {'converted_from': 'classifier.pkl'})
+        model.save(self.model_path)
+        print(f"Converted {self.legacy_model_path} to {self.model_path}")
+        return model
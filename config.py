@@ -1,3 +1,4 @@
+import itertools
 import os
 import sqlite3
 from datetime import datetime
@@ -11,8 +12,31 @@ CONFIDENCE_THRESHOLD = float(os.getenv('CONFIDENCE_THRESHOLD', 0.7))
 MAX_TRAINING_EMAILS = int(os.getenv('MAX_TRAINING_EMAILS', 500))
 MAX_TOTAL_TRAINING_MESSAGES = int(os.getenv('MAX_TOTAL_TRAINING_MESSAGES', 10000))
 MAX_TRAINING_TIME_SECONDS = int(os.getenv('MAX_TRAINING_TIME_SECONDS', 300))
+TRAINING_WORKER_MEMORY_LIMIT_MB = int(os.getenv('TRAINING_WORKER_MEMORY_LIMIT_MB', 0))  # 0 = no limit
+TRAINING_WORKER_NICE = int(os.getenv('TRAINING_WORKER_NICE', 10))
+TRAINING_WORKER_THREADS = int(os.getenv('TRAINING_WORKER_THREADS', 0))  # 0 = half the cores
 TRAINING_SCHEDULE = os.getenv('TRAINING_SCHEDULE', '3:00')
 
+# Inference batching (groups concurrent classifications into one forward pass)
+INFERENCE_BATCHING_ENABLED = os.getenv('INFERENCE_BATCHING_ENABLED', 'true').lower() == 'true'
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 16))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 5))  # Upper bound on added latency per email
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 0))  # Encoder worker processes (0 = encode in-process)
+INFERENCE_THREADS_PER_WORKER = int(os.getenv('INFERENCE_THREADS_PER_WORKER', 0))  # 0 = cores / workers
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv('INFERENCE_TIMEOUT_SECONDS', 30))  # Longest wait for a live encode (a dead worker loses its task)
+
+# Admission control: classifications queued or running at once before OVERLOAD_POLICY applies
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 32))  # 0 = unbounded
+ADMISSION_MAX_WAIT_MS = float(os.getenv('ADMISSION_MAX_WAIT_MS', 0))  # Classification time before OVERLOAD_POLICY applies (0 = none)
+# Overload policy: 'degrade' (subject/sender model, no encoder), 'defer' (451, upstream retries)
+# or 'passthrough' (deliver with X-Email-Category: unclassified)
+OVERLOAD_POLICY = os.getenv('OVERLOAD_POLICY', 'degrade').lower()
+
+# Thread pools for the SMTP handler's blocking stages, so the aiosmtpd event loop stays responsive
+SMTP_CLASSIFY_WORKERS = int(os.getenv('SMTP_CLASSIFY_WORKERS', 0))  # 0 = enough to fill every inference batch
+SMTP_IO_WORKERS = int(os.getenv('SMTP_IO_WORKERS', 8))  # Parsing, SQLite, footer and delivery
+EVENT_LOOP_LAG_INTERVAL_MS = float(os.getenv('EVENT_LOOP_LAG_INTERVAL_MS', 100))  # Lag monitor sampling interval
+
 # IMAP IDLE Configuration
 IDLE_ENABLED = os.getenv('IDLE_ENABLED', 'true').lower() == 'true'
 IDLE_TIMEOUT = int(os.getenv('IDLE_TIMEOUT', 29 * 60))  # Default 29 minutes (RFC 2177 max)
@@ -24,6 +48,18 @@ DELIVERY_PORT = int(os.getenv('DELIVERY_PORT', 25))
 DELIVERY_USE_TLS = os.getenv('DELIVERY_USE_TLS', 'false').lower() == 'true'
 DELIVERY_USER = os.getenv('DELIVERY_USER', '')
 DELIVERY_PASSWORD = os.getenv('DELIVERY_PASSWORD', '')
+# Delivery connection pool: connections are kept open and reused across messages
+DELIVERY_POOL_SIZE = int(os.getenv('DELIVERY_POOL_SIZE', 4))  # Max concurrent connections to DELIVERY_HOST
+DELIVERY_POOL_IDLE_SECONDS = float(os.getenv('DELIVERY_POOL_IDLE_SECONDS', 60))  # Idle connections older than this are closed
+DELIVERY_RETRIES = int(os.getenv('DELIVERY_RETRIES', 1))  # Retries on a fresh connection after a transient failure
+DELIVERY_TIMEOUT = float(os.getenv('DELIVERY_TIMEOUT', 30))  # Socket timeout, and max wait for a free connection
+# Delivery spool: classified mail is fsynced to DELIVERY_SPOOL_DIR before the 250 reply and
+# delivered by background workers, so a mail server outage no longer means 451s to the sender
+DELIVERY_SPOOL_ENABLED = os.getenv('DELIVERY_SPOOL_ENABLED', 'true').lower() == 'true'
+DELIVERY_SPOOL_WORKERS = int(os.getenv('DELIVERY_SPOOL_WORKERS', 2))  # Background delivery threads
+DELIVERY_RETRY_BASE_SECONDS = float(os.getenv('DELIVERY_RETRY_BASE_SECONDS', 30))  # First retry delay, doubled per attempt
+DELIVERY_RETRY_MAX_SECONDS = float(os.getenv('DELIVERY_RETRY_MAX_SECONDS', 3600))  # Longest delay between retries
+DELIVERY_MAX_AGE_HOURS = float(os.getenv('DELIVERY_MAX_AGE_HOURS', 120))  # Spooled mail older than this is moved to failed/
 
 # Footer settings (for adding classifier links to emails)
 FOOTER_ENABLED = os.getenv('FOOTER_ENABLED', 'true').lower() == 'true'
@@ -42,6 +78,83 @@ if users_str:
 DATA_DIR = '/app/data'
 MODEL_DIR = '/app/models'
 DB_PATH = f'{DATA_DIR}/classifier.db'
+DELIVERY_SPOOL_DIR = f'{DATA_DIR}/spool'
+ONNX_MODEL_PATH = f'{MODEL_DIR}/distilbert.onnx'
+TORCHSCRIPT_MODEL_PATH = f'{MODEL_DIR}/distilbert.torchscript.pt'
+
+# Encoder precision: 'none' (fp32) or 'int8' (dynamic int8 quantization of Linear layers)
+ENCODER_QUANTIZATION = os.getenv('ENCODER_QUANTIZATION', 'none').lower()
+
+# Encoder backend: 'pytorch', 'torchscript' (traced graph cached in MODEL_DIR) or 'onnx'
+# (ONNX Runtime); the alternatives fall back to PyTorch if unavailable
+ENCODER_BACKEND = os.getenv('ENCODER_BACKEND', 'pytorch').lower()
+ONNX_AUTO_EXPORT = os.getenv('ONNX_AUTO_EXPORT', 'true').lower() == 'true'
+ONNX_NUM_THREADS = int(os.getenv('ONNX_NUM_THREADS', 0))  # 0 = onnxruntime default
+
+# Early exit: per-layer heads let confident emails leave the encoder before the last layer
+# (PyTorch backend only; DistilBERT has 6 layers)
+EARLY_EXIT_ENABLED = os.getenv('EARLY_EXIT_ENABLED', 'false').lower() == 'true'
+EARLY_EXIT_LAYERS = [int(layer) for layer in os.getenv('EARLY_EXIT_LAYERS', '2,4').split(',') if layer.strip()]
+EARLY_EXIT_CONFIDENCE = float(os.getenv('EARLY_EXIT_CONFIDENCE', 0.95))
+EARLY_EXIT_LATENCY_BUDGET_MS = float(os.getenv('EARLY_EXIT_LATENCY_BUDGET_MS', 0))  # 0 = no budget
+EARLY_EXIT_TRAINING_SAMPLES = int(os.getenv('EARLY_EXIT_TRAINING_SAMPLES', 1000))  # Emails the heads are fitted on
+
+# Warmup batches run through the encoder before the SMTP server accepts connections
+ENCODER_WARMUP_ENABLED = os.getenv('ENCODER_WARMUP_ENABLED', 'true').lower() == 'true'
+ENCODER_WARMUP_ROUNDS = int(os.getenv('ENCODER_WARMUP_ROUNDS', 3))
+
+# Tokenization: 'auto' picks the sequence cap from the training token-length distribution
+MAX_SEQUENCE_LENGTH = os.getenv('MAX_SEQUENCE_LENGTH', 'auto').lower()
+SEQUENCE_LENGTH_PERCENTILE = float(os.getenv('SEQUENCE_LENGTH_PERCENTILE', 99))
+TRAINING_BATCH_SIZE = int(os.getenv('TRAINING_BATCH_SIZE', 32))  # Emails per length-bucketed training batch
+TRAINING_MAX_YIELD_MS = float(os.getenv('TRAINING_MAX_YIELD_MS', 1000))  # Longest a training batch waits for live encodes
+MODEL_SWAP_MAX_ACCURACY_DROP = float(os.getenv('MODEL_SWAP_MAX_ACCURACY_DROP', 0.05))  # Reject a retrained model that scores worse
+
+# Online learning: apply each user correction to the serving model as soon as it is detected
+ONLINE_LEARNING_ENABLED = os.getenv('ONLINE_LEARNING_ENABLED', 'true').lower() == 'true'
+ONLINE_LEARNING_RATE = float(os.getenv('ONLINE_LEARNING_RATE', 1.0))
+ONLINE_LEARNING_MAX_STEPS = int(os.getenv('ONLINE_LEARNING_MAX_STEPS', 10))
+
+# Classification-path MIME parsing: bounds on how much of a message is read
+MIME_MAX_SCAN_BYTES = int(os.getenv('MIME_MAX_SCAN_BYTES', 8 * 1024 * 1024))
+MIME_MAX_PARTS = int(os.getenv('MIME_MAX_PARTS', 100))
+
+# Per-stage latency breakdown recorded for every classification (shown on the dashboard)
+STAGE_TIMINGS_ENABLED = os.getenv('STAGE_TIMINGS_ENABLED', 'true').lower() == 'true'
+STAGE_TIMINGS_RETENTION_DAYS = int(os.getenv('STAGE_TIMINGS_RETENTION_DAYS', 30))
+# Stages in pipeline order: queue is time waiting for a shared forward pass, deliver is the footer and SMTP hand-off
+TIMING_STAGES = ['parse', 'lookup', 'cascade', 'queue', 'tokenize', 'forward', 'predict', 'db', 'deliver', 'total']
+
+# Embedding cache (reuses DistilBERT embeddings across retraining runs)
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+EMBEDDING_CACHE_DIR = f'{MODEL_DIR}/embedding_cache'
+EMBEDDING_CACHE_DTYPE = os.getenv('EMBEDDING_CACHE_DTYPE', 'float32').lower()  # 'float16' halves the cache on disk
+
+# Training feature projection: 'none', 'pca' or 'random'. Projected training features are kept
+# in a float16 array in MODEL_DIR (features.json) and the classifier layer is fitted on it
+FEATURE_PROJECTION = os.getenv('FEATURE_PROJECTION', 'none').lower()
+FEATURE_PROJECTION_DIM = int(os.getenv('FEATURE_PROJECTION_DIM', 128))
+FEATURE_PROJECTION_FIT_SAMPLES = int(os.getenv('FEATURE_PROJECTION_FIT_SAMPLES', 2000))  # Embeddings the projection is fitted on
+
+# Cascade: a hashed n-gram model decides confident emails before DistilBERT runs
+CASCADE_ENABLED = os.getenv('CASCADE_ENABLED', 'true').lower() == 'true'
+CASCADE_CONFIDENCE_THRESHOLD = float(os.getenv('CASCADE_CONFIDENCE_THRESHOLD', 0.95))
+CASCADE_MIN_PRECISION = float(os.getenv('CASCADE_MIN_PRECISION', 0.97))  # Holdout precision required to enable the stage
+
+# Sender memo: answer repeated mail from stable bulk senders without the encoder
+SENDER_MEMO_ENABLED = os.getenv('SENDER_MEMO_ENABLED', 'true').lower() == 'true'
+SENDER_MEMO_MAX_ENTRIES = int(os.getenv('SENDER_MEMO_MAX_ENTRIES', 10000))
+SENDER_MEMO_TTL_SECONDS = int(os.getenv('SENDER_MEMO_TTL_SECONDS', 3600))
+SENDER_MEMO_MIN_CONFIDENCE = float(os.getenv('SENDER_MEMO_MIN_CONFIDENCE', 0.9))
+SENDER_MEMO_MIN_OBSERVATIONS = int(os.getenv('SENDER_MEMO_MIN_OBSERVATIONS', 3))  # Agreeing outcomes before the memo answers
+
+# Sender rules: JSON file of domain suffix/keyword rules (built-in civic rule when missing)
+SENDER_RULES_PATH = os.getenv('SENDER_RULES_PATH', f'{DATA_DIR}/sender_rules.json')
+
+# Near-duplicate index: reuse embeddings across copies of one campaign sent to many mailboxes
+NEAR_DUPLICATE_ENABLED = os.getenv('NEAR_DUPLICATE_ENABLED', 'true').lower() == 'true'
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv('NEAR_DUPLICATE_MAX_ENTRIES', 5000))  # ~3KB of embedding each
+NEAR_DUPLICATE_MIN_SIMILARITY = float(os.getenv('NEAR_DUPLICATE_MIN_SIMILARITY', 0.8))  # Estimated Jaccard similarity of word shingles
 
 # Categories
 CATEGORIES = ['personal', 'shopping', 'spam']
@@ -74,6 +187,8 @@ def init_db():
                   shopping_prob REAL,
                   spam_prob REAL,
                   sender_domain TEXT,
+                  stage TEXT,
+                  exit_layer INTEGER,
                   timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
 
     # Migrate existing classifications table - add probability columns if they don't exist
@@ -88,6 +203,22 @@ def init_db():
         c.execute("ALTER TABLE classifications ADD COLUMN sender_domain TEXT")
         print("Migration complete")
 
+    # Migrate classifications table - add the deciding cascade stage
+    try:
+        c.execute("SELECT stage FROM classifications LIMIT 1")
+    except sqlite3.OperationalError:
+        print("Migrating classifications table to add stage column...")
+        c.execute("ALTER TABLE classifications ADD COLUMN stage TEXT")
+        print("Migration complete")
+
+    # Migrate classifications table - add the encoder layer an early-exit classification left at
+    try:
+        c.execute("SELECT exit_layer FROM classifications LIMIT 1")
+    except sqlite3.OperationalError:
+        print("Migrating classifications table to add exit_layer column...")
+        c.execute("ALTER TABLE classifications ADD COLUMN exit_layer INTEGER")
+        print("Migration complete")
+
     # Training data table
     c.execute('''CREATE TABLE IF NOT EXISTS training_data
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -151,6 +282,26 @@ def init_db():
     # Initialize with default row
     c.execute('''INSERT OR IGNORE INTO training_status (id, is_training) VALUES (1, 0)''')
 
+    # Migrate training_status table - add progress reported by the training worker
+    try:
+        c.execute("SELECT phase FROM training_status LIMIT 1")
+    except sqlite3.OperationalError:
+        print("Migrating training_status table to add progress columns...")
+        c.execute("ALTER TABLE training_status ADD COLUMN phase TEXT")
+        c.execute("ALTER TABLE training_status ADD COLUMN progress_current INTEGER")
+        c.execute("ALTER TABLE training_status ADD COLUMN progress_total INTEGER")
+        print("Migration complete")
+
+    # Stage timings table - per-stage latency of each classification, in milliseconds
+    c.execute(f'''CREATE TABLE IF NOT EXISTS stage_timings
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  classification_id INTEGER,
+                  stage TEXT,
+                  model_id TEXT,
+                  {', '.join(f'{name}_ms REAL' for name in TIMING_STAGES)},
+                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_stage_timings_timestamp ON stage_timings (timestamp)''')
+
     conn.commit()
     conn.close()
 
@@ -197,7 +348,8 @@ def get_existing_classification(message_id: str, user_email: str = None):
 
 def log_classification(message_id: str, user_email: str, subject: str,
                        predicted: str, confidence: float, processing_time: float,
-                       probabilities: dict = None, sender_domain: str = None):
+                       probabilities: dict = None, sender_domain: str = None,
+                       stage: str = None, exit_layer: int = None):
     """Log a classification decision with full probability breakdown.
     Returns the classification ID for use in footer links."""
     conn = get_db()
@@ -210,10 +362,10 @@ def log_classification(message_id: str, user_email: str, subject: str,
 
     c.execute('''INSERT INTO classifications
                  (message_id, user_email, subject, predicted_category, confidence, processing_time,
-                  personal_prob, shopping_prob, spam_prob, sender_domain)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  personal_prob, shopping_prob, spam_prob, sender_domain, stage, exit_layer)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
               (message_id, user_email, subject, predicted, confidence, processing_time,
-               personal_prob, shopping_prob, spam_prob, sender_domain))
+               personal_prob, shopping_prob, spam_prob, sender_domain, stage, exit_layer))
 
     classification_id = c.lastrowid
     conn.commit()
@@ -221,6 +373,18 @@ def log_classification(message_id: str, user_email: str, subject: str,
 
     return classification_id
 
+# Callbacks notified of every logged reclassification: fn(message_id, user_email, sender_domain, old, new)
+_reclassification_listeners = []
+
+def add_reclassification_listener(callback):
+    """Register a callback for user corrections (e.g. to invalidate cached outcomes)"""
+    _reclassification_listeners.append(callback)
+
+def remove_reclassification_listener(callback):
+    """Unregister a callback added with add_reclassification_listener (no-op if it is not registered)"""
+    if callback in _reclassification_listeners:
+        _reclassification_listeners.remove(callback)
+
 def log_reclassification(message_id: str, user_email: str, subject: str,
                          old_category: str, new_category: str,
                          old_folder: str = None, new_folder: str = None):
@@ -237,6 +401,11 @@ def log_reclassification(message_id: str, user_email: str, subject: str,
                  (message_id, user_email, subject, old_category, new_category, old_folder, new_folder)
                  VALUES (?, ?, ?, ?, ?, ?, ?)''',
               (message_id, user_email, subject, old_category, new_category, old_folder, new_folder))
+    c.execute('''SELECT sender_domain FROM classifications
+                 WHERE message_id = ? AND sender_domain IS NOT NULL
+                 ORDER BY timestamp DESC LIMIT 1''', (message_id,))
+    row = c.fetchone()
+    sender_domain = row[0] if row else None
     conn.commit()
     conn.close()
 
@@ -249,6 +418,22 @@ def log_reclassification(message_id: str, user_email: str, subject: str,
     print(f"   Classification Change: {old_category} → {new_category}")
     print(f"   IMAP Folder Move: '{old_folder}' → '{new_folder}'")
 
+    for callback in _reclassification_listeners:
+        try:
+            callback(message_id, user_email, sender_domain, old_category, new_category)
+        except Exception as e:
+            print(f"⚠️  Reclassification listener failed: {e}")
+
+def get_training_text(message_id: str, user_email: str):
+    """Return the stored training text for a message, or None"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT body FROM training_data WHERE message_id = ? AND user_email = ?',
+              (message_id, user_email))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
 def add_to_training_data(message_id: str, user_email: str, subject: str, body: str, category: str):
     """Add a newly classified message to training data for reclassification tracking"""
     conn = get_db()
@@ -356,6 +541,9 @@ def set_training_status(is_training: bool, num_samples: int = None):
                      SET is_training = 1,
                          started_at = CURRENT_TIMESTAMP,
                          num_samples = ?,
+                         phase = NULL,
+                         progress_current = NULL,
+                         progress_total = NULL,
                          updated_at = CURRENT_TIMESTAMP
                      WHERE id = 1''', (num_samples,))
     else:
@@ -366,11 +554,25 @@ def set_training_status(is_training: bool, num_samples: int = None):
     conn.commit()
     conn.close()
 
+def set_training_progress(phase: str, current: int, total: int):
+    """Record training progress (samples encoded or fit iterations)"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''UPDATE training_status
+                 SET phase = ?,
+                     progress_current = ?,
+                     progress_total = ?,
+                     updated_at = CURRENT_TIMESTAMP
+                 WHERE id = 1''', (phase, current, total))
+    conn.commit()
+    conn.close()
+
 def get_training_status():
     """Get the current training status"""
     conn = get_db()
     c = conn.cursor()
-    c.execute('''SELECT is_training, started_at, num_samples, updated_at
+    c.execute('''SELECT is_training, started_at, num_samples, updated_at,
+                        phase, progress_current, progress_total
                  FROM training_status
                  WHERE id = 1''')
     row = c.fetchone()
@@ -381,6 +583,129 @@ def get_training_status():
             'is_training': bool(row[0]),
             'started_at': row[1],
             'num_samples': row[2],
-            'updated_at': row[3]
+            'updated_at': row[3],
+            'phase': row[4],
+            'progress_current': row[5],
+            'progress_total': row[6]
         }
-    return {'is_training': False, 'started_at': None, 'num_samples': None, 'updated_at': None}
+    return {'is_training': False, 'started_at': None, 'num_samples': None, 'updated_at': None,
+            'phase': None, 'progress_current': None, 'progress_total': None}
+
+def get_cascade_stats(days: int = 7):
+    """Per-stage classification counts and latency, for the cascade escalation rate"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT COALESCE(stage, 'bert'), COUNT(*), AVG(processing_time)
+                 FROM classifications
+                 WHERE timestamp > datetime('now', ?)
+                 GROUP BY COALESCE(stage, 'bert')''', (f'-{days} days',))
+    rows = c.fetchall()
+    conn.close()
+
+    stages = {row[0]: {'count': row[1], 'avg_processing_time': row[2]} for row in rows}
+    total = sum(s['count'] for s in stages.values())
+    bert = stages.get('bert', {'count': 0, 'avg_processing_time': None})
+
+    # Time saved: every decision made before BERT avoided the average BERT-path latency
+    time_saved = None
+    if bert['avg_processing_time'] is not None and len(stages) > 1:
+        time_saved = sum(s['count'] * (bert['avg_processing_time'] - s['avg_processing_time'])
+                         for name, s in stages.items() if name != 'bert')
+
+    return {
+        'days': days,
+        'total': total,
+        'stages': stages,
+        'escalation_rate': bert['count'] / total if total else None,
+        'time_saved_seconds': time_saved
+    }
+
+def get_exit_depth_stats(days: int = 7):
+    """Early-exit classifications per encoder exit layer, with their average latency"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT exit_layer, COUNT(*), AVG(processing_time)
+                 FROM classifications
+                 WHERE exit_layer IS NOT NULL AND timestamp > datetime('now', ?)
+                 GROUP BY exit_layer ORDER BY exit_layer''', (f'-{days} days',))
+    rows = c.fetchall()
+    conn.close()
+
+    total = sum(row[1] for row in rows)
+    return {
+        'days': days,
+        'total': total,
+        'layers': [{'layer': row[0], 'count': row[1], 'share': row[1] / total,
+                    'avg_processing_time': row[2]} for row in rows]
+    }
+
+# Stage timing rows written by this process; every STAGE_TIMINGS_PRUNE_EVERY-th one prunes old rows
+STAGE_TIMINGS_PRUNE_EVERY = 1000
+_stage_timing_inserts = itertools.count()
+
+def log_stage_timings(classification_id: int, stage: str, model_id: str, timings: dict):
+    """Record per-stage seconds for one classification (stages missing from timings are stored as NULL)"""
+    conn = get_db()
+    c = conn.cursor()
+    columns = ', '.join(f'{name}_ms' for name in TIMING_STAGES)
+    values = [timings[name] * 1000 if name in timings else None for name in TIMING_STAGES]
+    c.execute(f'''INSERT INTO stage_timings (classification_id, stage, model_id, {columns})
+                  VALUES (?, ?, ?, {', '.join('?' * len(TIMING_STAGES))})''',
+              [classification_id, stage, model_id] + values)
+    # Keep the table bounded (counted per insert: cascade and memo hits have no classification id)
+    if next(_stage_timing_inserts) % STAGE_TIMINGS_PRUNE_EVERY == 0:
+        c.execute("DELETE FROM stage_timings WHERE timestamp < datetime('now', ?)",
+                  (f'-{STAGE_TIMINGS_RETENTION_DAYS} days',))
+    conn.commit()
+    conn.close()
+
+_NO_TIMINGS = {'count': 0, 'p50': None, 'p95': None, 'p99': None}
+
+def _stage_percentiles(c, group: str, since: str) -> dict:
+    """
+    Row count and per-stage p50/p95/p99 (ms, nearest rank) for each value of the
+    SQL expression group, computed by SQLite so no rows are loaded into Python
+    """
+    values = ' UNION ALL '.join(f"SELECT grp, '{name}' AS stage, {name}_ms AS v FROM recent "
+                                f"WHERE {name}_ms IS NOT NULL" for name in TIMING_STAGES)
+    # Nearest rank: the value at 0-based rank min(n - 1, int(p * n)), as in stats.percentile()
+    picks = ', '.join(f"MAX(CASE WHEN pos = MIN(n - 1, CAST(n * {p / 100} AS INTEGER)) THEN v END)"
+                      for p in (50, 95, 99))
+    c.execute(f'''WITH recent AS (SELECT {group} AS grp, * FROM stage_timings WHERE timestamp > datetime('now', ?)),
+                       ranked AS (SELECT grp, stage, v,
+                                         ROW_NUMBER() OVER (PARTITION BY grp, stage ORDER BY v) - 1 AS pos,
+                                         COUNT(*) OVER (PARTITION BY grp, stage) AS n
+                                  FROM ({values}))
+                  SELECT grp, stage, n, {picks} FROM ranked GROUP BY grp, stage''', (since,))
+    groups = {}
+    for grp, stage, count, p50, p95, p99 in c.fetchall():
+        groups.setdefault(grp, {})[stage] = {'count': count, 'p50': p50, 'p95': p95, 'p99': p99}
+
+    c.execute(f'''SELECT {group} AS grp, COUNT(*) FROM stage_timings WHERE timestamp > datetime('now', ?)
+                  GROUP BY grp ORDER BY MIN(timestamp)''', (since,))
+    return {grp: {'count': count,
+                  'stages': {name: groups.get(grp, {}).get(name, dict(_NO_TIMINGS)) for name in TIMING_STAGES}}
+            for grp, count in c.fetchall()}
+
+def get_stage_timing_stats(days: int = 7):
+    """
+    Latency percentiles (ms) per stage over the last `days` days: overall, per day
+    and per model, so a regression can be traced to the stage and model that caused it
+    """
+    since = f'-{days} days'
+    conn = get_db()
+    c = conn.cursor()
+    overall = _stage_percentiles(c, "''", since).get('') or {
+        'count': 0, 'stages': {name: dict(_NO_TIMINGS) for name in TIMING_STAGES}}
+    daily = _stage_percentiles(c, 'date(timestamp)', since)
+    models = _stage_percentiles(c, "COALESCE(model_id, '')", since)
+    conn.close()
+
+    return {
+        'days': days,
+        'stages': TIMING_STAGES,
+        'count': overall['count'],
+        'overall': overall['stages'],
+        'daily': [{'date': day, **group} for day, group in daily.items()],
+        'models': [{'model_id': model_id or None, **group} for model_id, group in models.items()]
+    }
@@ -0,0 +1,194 @@
+"""
+Pooled, persistent SMTP connections to DELIVERY_HOST.
+
+Opening a connection per message pays TCP connect, EHLO, STARTTLS and AUTH
+every time. The pool keeps delivered-to connections open and reuses them:
+  - at most max_connections are open (idle or in use); callers wait for one
+  - an idle connection is checked with NOOP before reuse and dropped if it fails
+  - idle connections older than max_idle_seconds are closed by a reaper thread
+  - a transient failure (disconnect, socket error, 4xx reply) is retried on a
+    fresh connection, up to retries times; 5xx replies are not retried
+"""
+import smtplib
+import threading
+import time
+from collections import deque
+from stats import percentile
+
+
+class DeliveryError(Exception):
+    pass
+
+
+def is_transient(error: Exception) -> bool:
+    """Worth retrying on a new connection: dropped connections, socket errors and 4xx replies"""
+    if isinstance(error, DeliveryError):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError))
+
+
+class SMTPConnectionPool:
+    def __init__(self, host: str, port: int, use_tls: bool = False, user: str = None, password: str = None,
+                 max_connections: int = 4, max_idle_seconds: float = 60, retries: int = 1,
+                 timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.user = user
+        self.password = password
+        self.max_connections = max(1, max_connections)
+        self.max_idle_seconds = max_idle_seconds
+        self.retries = max(0, retries)
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._lock = threading.Lock()
+        self._idle = []                      # (connection, last used) stack, most recent last
+        self._reaper = None
+        self._stopped = threading.Event()
+
+        # Statistics
+        self._latencies = deque(maxlen=2000)  # Recent per-message delivery seconds
+        self.delivered = 0
+        self.failed = 0
+        self.retried = 0
+        self.opened = 0
+        self.reused = 0
+        self.noop_failures = 0
+        self.reaped = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.user and self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            self._close(smtp)
+            raise
+        with self._lock:
+            self.opened += 1
+        return smtp
+
+    @staticmethod
+    def _close(smtp: smtplib.SMTP):
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def _take_idle(self):
+        """Most recently used idle connection that still answers NOOP, or None"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                smtp, last_used = self._idle.pop()
+            if time.monotonic() - last_used <= self.max_idle_seconds:
+                try:
+                    if smtp.noop()[0] == 250:
+                        with self._lock:
+                            self.reused += 1
+                        return smtp
+                except Exception:
+                    pass
+                with self._lock:
+                    self.noop_failures += 1
+            self._close(smtp)
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name='delivery-pool-reaper', daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._stopped.wait(max(1.0, self.max_idle_seconds / 2)):
+            self.reap()
+
+    def reap(self) -> int:
+        """Close idle connections unused for longer than max_idle_seconds"""
+        cutoff = time.monotonic() - self.max_idle_seconds
+        with self._lock:
+            stale = [smtp for smtp, last_used in self._idle if last_used < cutoff]
+            self._idle = [(smtp, last_used) for smtp, last_used in self._idle if last_used >= cutoff]
+            self.reaped += len(stale)
+        for smtp in stale:
+            self._close(smtp)
+        return len(stale)
+
+    def send(self, mail_from: str, rcpt_tos: list, message: bytes) -> dict:
+        """
+        Deliver one message, reusing a pooled connection when one is healthy.
+        Returns sendmail()'s refused-recipients dict; raises the last error, or
+        DeliveryError when no connection slot frees up within the timeout.
+        """
+        self._start_reaper()
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.failed += 1
+            raise DeliveryError(f"No delivery connection free within {self.timeout:g}s")
+        try:
+            smtp = self._take_idle()
+            attempt = 0
+            while True:
+                try:
+                    if smtp is None:
+                        smtp = self._connect()
+                    refused = smtp.sendmail(mail_from, rcpt_tos, message)
+                    break
+                except Exception as e:
+                    if smtp is not None:
+                        self._close(smtp)
+                        smtp = None
+                    if attempt >= self.retries or not is_transient(e):
+                        with self._lock:
+                            self.failed += 1
+                        raise
+                    attempt += 1
+                    with self._lock:
+                        self.retried += 1
+
+            with self._lock:
+                self._idle.append((smtp, time.monotonic()))
+                self.delivered += 1
+                self._latencies.append(time.perf_counter() - start)
+            return refused
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Stop the reaper and close every idle connection"""
+        self._stopped.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            self._close(smtp)
+
+    def get_stats(self) -> dict:
+        """Connection reuse, retries and delivery latency percentiles (milliseconds)"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            connections = self.opened + self.reused
+            return {
+                'host': f"{self.host}:{self.port}",
+                'max_connections': self.max_connections,
+                'idle_connections': len(self._idle),
+                'delivered': self.delivered,
+                'failed': self.failed,
+                'retried': self.retried,
+                'connections_opened': self.opened,
+                'connections_reused': self.reused,
+                'hit_rate': self.reused / connections if connections else None,
+                'noop_failures': self.noop_failures,
+                'reaped': self.reaped,
+                'p50_latency_ms': percentile(latencies, 50, 1000),
+                'p99_latency_ms': percentile(latencies, 99, 1000),
+            }
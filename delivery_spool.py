@@ -0,0 +1,338 @@
+"""
+Durable on-disk delivery spool.
+
+With the spool enabled, handle_DATA answers 250 once the classified message is
+on disk, not once DELIVERY_HOST has accepted it. A mail server hiccup no longer
+turns into a 451 that makes fetchmail refetch (and the classifier reclassify)
+the same email. Each message is two files in DELIVERY_SPOOL_DIR:
+  <id>.eml     the message as it will be delivered, written and fsynced first
+  <id>.json    envelope and retry state, written to a temp file, fsynced and
+               renamed into place; a message is spooled once this exists
+Background workers deliver due messages over the delivery connection pool.
+On a failure a message is retried with exponential backoff, from
+DELIVERY_RETRY_BASE_SECONDS doubling up to DELIVERY_RETRY_MAX_SECONDS. It is
+moved to failed/ when the mail server rejects it with a 5xx reply, when it is
+older than DELIVERY_MAX_AGE_HOURS, or when its message file has gone missing.
+Recipients refused while others accepted the message are retried (4xx) or
+written to failed/ as a copy addressed to them alone (5xx). Spooled messages
+survive restarts: start() reloads them before the SMTP server accepts mail.
+"""
+import heapq
+import json
+import os
+import shutil
+import smtplib
+import threading
+import time
+import uuid
+from collections import deque
+from delivery_pool import is_transient
+from stats import percentile
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DeliverySpool:
+    def __init__(self, spool_dir: str, pool, workers: int = 2, retry_base_seconds: float = 30,
+                 retry_max_seconds: float = 3600, max_age_hours: float = 120):
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, 'failed')
+        self.pool = pool                     # SMTPConnectionPool (anything with send(mail_from, rcpt_tos, data))
+        self.workers = max(1, workers)
+        self.retry_base = max(0.0, retry_base_seconds)
+        self.retry_max = max(self.retry_base, retry_max_seconds)
+        self.max_age = max_age_hours * 3600
+
+        self._cond = threading.Condition()
+        self._due = []                       # (next attempt, message id) heap
+        self._pending = {}                   # message id -> metadata of every spooled message
+        self._threads = []
+        self._stopped = threading.Event()
+
+        # Statistics
+        self._write_times = deque(maxlen=2000)   # Recent seconds to spool a message (incl. fsync)
+        self._queue_times = deque(maxlen=2000)   # Recent seconds from spooling to delivery
+        self.spooled = 0
+        self.recovered = 0
+        self.delivered = 0
+        self.deferred = 0
+        self.failed = 0
+        self.refused_recipients = 0          # Recipients dead-lettered while others got the message
+        self.last_error = None
+
+    def _paths(self, message_id: str):
+        return (os.path.join(self.spool_dir, f"{message_id}.eml"),
+                os.path.join(self.spool_dir, f"{message_id}.json"))
+
+    def _write_meta(self, message_id: str, meta: dict):
+        _, meta_path = self._paths(message_id)
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, meta_path)
+        _fsync_dir(self.spool_dir)
+
+    def enqueue(self, mail_from: str, rcpt_tos: list, data: bytes) -> str:
+        """Write a message durably to the spool; returns its spool ID once it is safe to answer 250"""
+        start = time.perf_counter()
+        message_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:12]}"
+        eml_path, _ = self._paths(message_id)
+        with open(eml_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        now = time.time()
+        meta = {
+            'mail_from': mail_from,
+            'rcpt_tos': list(rcpt_tos),
+            'spooled_at': now,
+            'attempts': 0,
+            'next_attempt': now,
+            'last_error': None,
+        }
+        self._write_meta(message_id, meta)
+
+        with self._cond:
+            self._pending[message_id] = meta
+            heapq.heappush(self._due, (now, message_id))
+            self.spooled += 1
+            self._write_times.append(time.perf_counter() - start)
+            self._cond.notify()
+        return message_id
+
+    def recover(self) -> int:
+        """Reload spooled messages from disk (after a restart); returns how many"""
+        os.makedirs(self.failed_dir, exist_ok=True)
+        recovered = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            if not name.endswith('.json'):
+                continue
+            message_id = name[:-len('.json')]
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Unreadable spool entry {name}: {e}")
+                continue
+            with self._cond:
+                if message_id in self._pending:
+                    continue
+                self._pending[message_id] = meta
+                heapq.heappush(self._due, (meta['next_attempt'], message_id))
+            recovered += 1
+
+        # A message file without metadata was never acknowledged with 250
+        for name in os.listdir(self.spool_dir):
+            if name.endswith('.eml') and name[:-len('.eml')] not in self._pending:
+                os.remove(os.path.join(self.spool_dir, name))
+
+        with self._cond:
+            self.recovered += recovered
+            self._cond.notify_all()
+        return recovered
+
+    def start(self):
+        """Recover spooled messages and start the delivery workers"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        recovered = self.recover()
+        if recovered:
+            print(f"📬 Recovered {recovered} spooled message(s) for delivery")
+        self._stopped.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'delivery-spool-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5):
+        """Stop the workers; undelivered messages stay on disk for the next start"""
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _next_due(self):
+        """Block until a message is due (or the spool stops); returns its ID or None"""
+        with self._cond:
+            while not self._stopped.is_set():
+                if self._due:
+                    next_attempt, message_id = self._due[0]
+                    wait = next_attempt - time.time()
+                    if wait <= 0:
+                        heapq.heappop(self._due)
+                        return message_id
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _worker(self):
+        while True:
+            message_id = self._next_due()
+            if message_id is None:
+                return
+            try:
+                self.attempt(message_id)
+            except Exception as e:
+                # Spool I/O failed; leave the message on disk and try again later
+                print(f"  ✗ Spool error for {message_id}: {e}")
+                with self._cond:
+                    heapq.heappush(self._due, (time.time() + self.retry_max, message_id))
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds before retry number attempts (1-based)"""
+        return min(self.retry_max, self.retry_base * (2 ** max(0, attempts - 1)))
+
+    def attempt(self, message_id: str) -> bool:
+        """Try to deliver one spooled message; True when it was delivered to every recipient"""
+        eml_path, _ = self._paths(message_id)
+        with self._cond:
+            meta = self._pending[message_id]
+        try:
+            with open(eml_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            meta['last_error'] = 'Spooled message file is missing'
+            self._fail(message_id, meta)
+            print(f"  ✗ Spooled message {message_id} has no message file - moved to failed/")
+            return False
+
+        expired = time.time() - meta['spooled_at'] > self.max_age
+        try:
+            refused = self.pool.send(meta['mail_from'], meta['rcpt_tos'], data)
+        except smtplib.SMTPRecipientsRefused as e:
+            # Nobody accepted it, but the codes may still differ per recipient
+            self._refused(message_id, meta, e.recipients, expired, delivered=False)
+            return False
+        except Exception as e:
+            meta['attempts'] += 1
+            meta['last_error'] = str(e)
+            # Only a 5xx reply to this message is final; connection or AUTH trouble is retried until max age
+            rejected = (isinstance(e, (smtplib.SMTPDataError, smtplib.SMTPSenderRefused))
+                        and not is_transient(e))
+            if rejected or expired:
+                self._fail(message_id, meta)
+                print(f"  ✗ Delivery of spooled message {message_id} failed permanently: {e}")
+            else:
+                self._defer(message_id, meta)
+            return False
+
+        if refused:
+            # Accepted for some recipients only
+            self._refused(message_id, meta, refused, expired, delivered=True)
+            return False
+        self._remove_delivered(message_id, meta)
+        return True
+
+    def _refused(self, message_id: str, meta: dict, refused: dict, expired: bool, delivered: bool):
+        """
+        Retry recipients refused with a 4xx reply on their own and dead-letter
+        those refused with a 5xx. delivered: the other recipients accepted it.
+        """
+        meta['attempts'] += 1
+        meta['last_error'] = '; '.join(f"{rcpt}: {code} {reply.decode('utf-8', errors='ignore')}"
+                                       for rcpt, (code, reply) in refused.items())
+        print(f"  ⚠️  Spooled message {message_id} refused for {meta['last_error']}")
+        retry = [rcpt for rcpt, (code, _) in refused.items() if 400 <= code < 500]
+        rejected = [rcpt for rcpt in refused if rcpt not in retry]
+        if not retry and not delivered:
+            self._fail(message_id, meta)
+            print(f"  ✗ Delivery of spooled message {message_id} failed permanently")
+            return
+        if rejected:
+            self._fail(message_id, meta, rejected)
+        if not retry:
+            self._remove_delivered(message_id, meta)
+            return
+        meta['rcpt_tos'] = retry
+        if expired:
+            self._fail(message_id, meta)
+        else:
+            self._defer(message_id, meta)
+
+    def _remove_delivered(self, message_id: str, meta: dict):
+        eml_path, meta_path = self._paths(message_id)
+        os.remove(meta_path)
+        os.remove(eml_path)
+        with self._cond:
+            del self._pending[message_id]
+            self.delivered += 1
+            self._queue_times.append(time.time() - meta['spooled_at'])
+
+    def _defer(self, message_id: str, meta: dict):
+        """Schedule the next attempt after the backoff for this many attempts"""
+        meta['next_attempt'] = time.time() + self.backoff(meta['attempts'])
+        self._write_meta(message_id, meta)
+        with self._cond:
+            self.deferred += 1
+            self.last_error = meta['last_error']
+            heapq.heappush(self._due, (meta['next_attempt'], message_id))
+        print(f"  ⏳ Delivery of {message_id} deferred (attempt {meta['attempts']}): {meta['last_error']}")
+
+    def _fail(self, message_id: str, meta: dict, recipients: list = None):
+        """
+        Move a message that will never be delivered to failed/ for inspection.
+        With recipients, only they refused it: a copy addressed to them is
+        written to failed/ and the spooled message is left in place.
+        """
+        eml_path, meta_path = self._paths(message_id)
+        if recipients is not None:
+            name = f"{message_id}-refused-{meta['attempts']}"
+            shutil.copyfile(eml_path, os.path.join(self.failed_dir, f"{name}.eml"))
+            with open(os.path.join(self.failed_dir, f"{name}.json"), 'w') as f:
+                json.dump(dict(meta, rcpt_tos=recipients), f)
+            with self._cond:
+                self.refused_recipients += len(recipients)
+                self.last_error = meta['last_error']
+            return
+
+        self._write_meta(message_id, meta)
+        if os.path.exists(eml_path):
+            os.replace(eml_path, os.path.join(self.failed_dir, os.path.basename(eml_path)))
+        os.replace(meta_path, os.path.join(self.failed_dir, os.path.basename(meta_path)))
+        with self._cond:
+            del self._pending[message_id]
+            self.failed += 1
+            self.last_error = meta['last_error']
+
+    def get_stats(self) -> dict:
+        """Queue depth and age, delivery outcomes, and spool write/queue time percentiles (milliseconds)"""
+        now = time.time()
+        with self._cond:
+            ages = [now - meta['spooled_at'] for meta in self._pending.values()]
+            retrying = sum(1 for meta in self._pending.values() if meta['attempts'])
+            writes = sorted(self._write_times)
+            queue_times = sorted(self._queue_times)
+            stats = {
+                'depth': len(self._pending),
+                'retrying': retrying,
+                'oldest_age_seconds': max(ages) if ages else None,
+                'spooled': self.spooled,
+                'recovered': self.recovered,
+                'delivered': self.delivered,
+                'deferred': self.deferred,
+                'failed': self.failed,
+                'refused_recipients': self.refused_recipients,
+                'last_error': self.last_error,
+                'workers': self.workers,
+            }
+        stats.update({
+            'p50_write_ms': percentile(writes, 50, 1000),
+            'p99_write_ms': percentile(writes, 99, 1000),
+            'p50_queue_ms': percentile(queue_times, 50, 1000),
+            'p99_queue_ms': percentile(queue_times, 99, 1000),
+        })
+        return stats
@@ -0,0 +1,167 @@
+"""
+Early-exit DistilBERT encoding for a latency-budget mode.
+
+Small softmax heads are trained on the [CLS] representation after some of
+the transformer layers (EARLY_EXIT_LAYERS). At inference the encoder runs one
+layer at a time; after each layer with a head, rows whose head is at least
+EARLY_EXIT_CONFIDENCE confident stop there and take the head's probabilities,
+and the rest continue on a smaller batch. Once a request's latency budget is
+spent, every remaining row exits at the next head. Rows that reach the last
+layer get the ordinary [CLS] embedding for the main classifier.
+
+Heads are fitted in the training worker on a sample of training_data, with a
+holdout split measuring each head and the exit policy against a full-depth
+head fitted on the same sample. They are stored in one .npz file with the
+encoder identity they were trained for, and only work with the eager PyTorch
+encoder (the traced and ONNX graphs do not expose intermediate layers).
+"""
+import json
+import os
+import time
+from collections import namedtuple
+import numpy as np
+from linear_model import LinearSoftmaxModel
+
+# A row that left the encoder before the last layer
+EarlyExit = namedtuple('EarlyExit', ['layer', 'probabilities'])
+
+EVALUATION_THRESHOLDS = [0.8, 0.9, 0.95, 0.99]
+
+
+def run_layers(model, input_ids, attention_mask, depth: int):
+    """Yield (layer number, hidden states) after each of the first depth transformer layers"""
+    hidden = model.embeddings(input_ids)
+    for number, layer in enumerate(model.transformer.layer[:depth], start=1):
+        hidden = layer(x=hidden, attn_mask=attention_mask)[-1]
+        yield number, hidden
+
+
+def layer_features(model, input_ids, attention_mask, layers: list) -> np.ndarray:
+    """[CLS] vectors after each of layers, shaped (batch, len(layers), hidden)"""
+    wanted = set(layers)
+    collected = [hidden[:, 0, :].numpy() for number, hidden in
+                 run_layers(model, input_ids, attention_mask, max(layers)) if number in wanted]
+    return np.stack(collected, axis=1)
+
+
+class EarlyExitHeads:
+    def __init__(self, heads: dict, encoder_identity: str, metadata: dict = None):
+        self.heads = heads                  # layer number -> LinearSoftmaxModel
+        self.layers = sorted(heads)
+        self.encoder_identity = encoder_identity
+        self.metadata = metadata or {}
+
+    def run(self, model, input_ids, attention_mask, threshold: float, deadline: float = None) -> list:
+        """
+        Encode a batch layer by layer. Returns one entry per row: an EarlyExit, or
+        the final [CLS] embedding for rows that ran every layer. deadline is a
+        time.monotonic() value after which remaining rows exit at the next head.
+        """
+        num_layers = len(model.transformer.layer)
+        results = [None] * len(input_ids)
+        active = np.arange(len(input_ids))
+        hidden = model.embeddings(input_ids)
+        for number, layer in enumerate(model.transformer.layer, start=1):
+            hidden = layer(x=hidden, attn_mask=attention_mask)[-1]
+            if number == num_layers:
+                for row, feature in zip(active, hidden[:, 0, :].numpy()):
+                    results[row] = feature
+                break
+            if number not in self.heads:
+                continue
+
+            probabilities = self.heads[number].predict_proba(hidden[:, 0, :].numpy())
+            if deadline is not None and time.monotonic() >= deadline:
+                leaving = np.ones(len(active), dtype=bool)
+            else:
+                leaving = probabilities.max(axis=1) >= threshold
+            for row, probs in zip(active[leaving], probabilities[leaving]):
+                results[row] = EarlyExit(number, probs)
+            if leaving.all():
+                break
+            if leaving.any():
+                # Continue with the undecided rows only
+                keep = np.flatnonzero(~leaving).tolist()
+                active, hidden, attention_mask = active[keep], hidden[keep], attention_mask[keep]
+        return results
+
+    def save(self, path: str) -> int:
+        """Write all heads to one .npz file (atomically); returns bytes written"""
+        arrays = {}
+        for layer, head in self.heads.items():
+            arrays[f'coef_{layer}'] = np.asarray(head.coef_, dtype=np.float32)
+            arrays[f'intercept_{layer}'] = np.asarray(head.intercept_, dtype=np.float32)
+        metadata = dict(self.metadata, layers=self.layers, encoder_identity=self.encoder_identity,
+                        classes=[str(c) for c in self.heads[self.layers[0]].classes_])
+        arrays['metadata'] = np.array(json.dumps(metadata))
+
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        self.metadata = metadata
+        return os.path.getsize(path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(str(data['metadata']))
+            heads = {layer: LinearSoftmaxModel(data[f'coef_{layer}'], data[f'intercept_{layer}'],
+                                               metadata['classes'], metadata['encoder_identity'])
+                     for layer in metadata['layers']}
+        return cls(heads, metadata['encoder_identity'], metadata)
+
+
+def evaluate_exit_policy(layer_probs: list, full_probs: np.ndarray, labels: np.ndarray, layers: list,
+                         num_layers: int, threshold: float) -> dict:
+    """Exit-depth distribution and accuracy of exiting at the first head reaching threshold"""
+    predictions = full_probs.argmax(axis=1)
+    depths = np.full(len(labels), num_layers)
+    decided = np.zeros(len(labels), dtype=bool)
+    for layer, probs in zip(layers, layer_probs):
+        leaving = ~decided & (probs.max(axis=1) >= threshold)
+        predictions[leaving] = probs[leaving].argmax(axis=1)
+        depths[leaving] = layer
+        decided |= leaving
+    full_predictions = full_probs.argmax(axis=1)
+    return {
+        'threshold': threshold,
+        'accuracy': float(np.mean(predictions == labels)),
+        'agreement_with_full_depth': float(np.mean(predictions == full_predictions)),
+        'exit_distribution': {str(layer): int(np.sum(depths == layer)) for layer in layers + [num_layers]},
+        'mean_layers': float(depths.mean()),
+    }
+
+
+def fit_heads(features_by_layer: np.ndarray, final_features: np.ndarray, labels: list, layers: list,
+              num_layers: int, categories: list, encoder_identity: str, fit, thresholds: list = None,
+              holdout: float = 0.2, seed: int = 0) -> EarlyExitHeads:
+    """
+    Fit one head per exit layer. features_by_layer is (n, len(layers), hidden);
+    fit(X, y) returns a fitted sklearn LogisticRegression. The exit policy is
+    measured on a holdout split against a full-depth head fitted on the same
+    training split, and stored in the heads' metadata under 'evaluation'.
+    """
+    labels = np.asarray(labels)
+    order = np.random.RandomState(seed).permutation(len(labels))
+    split = int(len(labels) * (1 - holdout))
+    train, test = order[:split], order[split:]
+    if len(test) == 0 or len(set(labels[train])) < 2:
+        train = test = order
+
+    to_model = lambda X, y: LinearSoftmaxModel.from_sklearn(fit(X, y), encoder_identity).aligned_to(categories)
+    heads = {layer: to_model(features_by_layer[train, i], labels[train]) for i, layer in enumerate(layers)}
+    full_head = to_model(final_features[train], labels[train])
+
+    test_labels = np.array([categories.index(label) for label in labels[test]])
+    layer_probs = [heads[layer].predict_proba(features_by_layer[test, i]) for i, layer in enumerate(layers)]
+    full_probs = full_head.predict_proba(final_features[test])
+    evaluation = {
+        'train_samples': int(len(train)),
+        'holdout_samples': int(len(test)),
+        'full_depth_accuracy': float(np.mean(full_probs.argmax(axis=1) == test_labels)),
+        'layer_accuracy': {str(layer): float(np.mean(probs.argmax(axis=1) == test_labels))
+                           for layer, probs in zip(layers, layer_probs)},
+        'thresholds': [evaluate_exit_policy(layer_probs, full_probs, test_labels, layers, num_layers, threshold)
+                       for threshold in thresholds or EVALUATION_THRESHOLDS],
+    }
+    return EarlyExitHeads(heads, encoder_identity, {'evaluation': evaluation, 'num_layers': num_layers})
@@ -0,0 +1,290 @@
+"""
+Persistent, content-addressed store of DistilBERT embeddings.
+
+Embeddings are keyed by a SHA-256 of the encoder identity plus the input
+text, so a text is only ever encoded once per model configuration. Vectors
+live in a flat float32 (or float16) file that is memory-mapped for reads; a small SQLite
+index maps each key to its row slot. Vectors can be stored as float16 to
+halve the cache on disk; they are always returned as float32. Entries whose text has left
+training_data are evicted on retrain and their slots reused.
+
+Writers take an exclusive file lock and readers a shared one, so the cache
+can be shared by the main process and worker processes.
+"""
+import fcntl
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_identity: str, dim: int = 768, dtype: str = 'float32'):
+        self.cache_dir = cache_dir
+        self.model_identity = model_identity
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.index_path = os.path.join(cache_dir, 'index.db')
+        self.lock_path = os.path.join(cache_dir, 'write.lock')
+        self._generation = 0  # Bumped by compaction, selects the vector file
+
+        self._lock = threading.RLock()
+        self._mmap = None
+        self._mmap_rows = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._init_index()
+
+    @property
+    def vectors_path(self) -> str:
+        return self._vectors_path(self._generation)
+
+    def _vectors_path(self, generation: int) -> str:
+        return os.path.join(self.cache_dir, f'embeddings.{generation}.f{self.dtype.itemsize * 8}')
+
+    @contextmanager
+    def _file_lock(self, operation: int):
+        """Hold the cache lock file (LOCK_EX or LOCK_SH) with the current generation loaded"""
+        with self._lock:
+            with open(self.lock_path, 'w') as lock_file:
+                fcntl.flock(lock_file, operation)
+                try:
+                    self._refresh_generation()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_lock(self):
+        """Exclusive lock across threads and processes for index/vector writes"""
+        return self._file_lock(fcntl.LOCK_EX)
+
+    def _read_lock(self):
+        """
+        Shared lock for reads: slots looked up in the index are read before a
+        writer in another process can free, reuse or compact them
+        """
+        return self._file_lock(fcntl.LOCK_SH)
+
+    def _refresh_generation(self):
+        """Pick up a compaction done by another process"""
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()
+        conn.close()
+        generation = int(row[0]) if row else 0
+        if generation != self._generation:
+            self._generation = generation
+            self._mmap = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=30.0)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_index(self):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS embeddings
+                     (key TEXT PRIMARY KEY,
+                      slot INTEGER NOT NULL UNIQUE,
+                      model_identity TEXT,
+                      created_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS meta
+                     (name TEXT PRIMARY KEY, value TEXT)''')
+        c.execute("SELECT value FROM meta WHERE name = 'generation'")
+        row = c.fetchone()
+        self._generation = int(row[0]) if row else 0
+        c.execute("SELECT name, value FROM meta WHERE name IN ('dim', 'dtype')")
+        stored = dict(c.fetchall())
+        # Caches written before the dtype setting existed are float32
+        stored.setdefault('dtype', 'float32')
+        if 'dim' in stored and (int(stored['dim']) != self.dim or stored['dtype'] != self.dtype.name):
+            # Vector layout changed - existing rows are unusable
+            print(f"  Embedding cache layout changed ({stored['dim']} x {stored['dtype']} → "
+                  f"{self.dim} x {self.dtype.name}), clearing cache")
+            c.execute('DELETE FROM embeddings')
+            for name in os.listdir(self.cache_dir):
+                if name.startswith('embeddings.'):
+                    os.remove(os.path.join(self.cache_dir, name))
+        c.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+        c.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dtype', ?)", (self.dtype.name,))
+        conn.commit()
+        conn.close()
+
+    def key_for(self, text: str, model_identity: str = None) -> str:
+        """Content address of a text under an encoder identity (default: the current one)"""
+        identity = model_identity or self.model_identity
+        return hashlib.sha256(f"{identity}\0{text}".encode('utf-8', errors='ignore')).hexdigest()
+
+    def _num_rows(self) -> int:
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize)
+
+    def _vectors(self):
+        """Memory-mapped view of the vector file (reopened when it has grown)"""
+        rows = self._num_rows()
+        if rows == 0:
+            return None
+        if self._mmap is None or self._mmap_rows != rows:
+            self._mmap = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(rows, self.dim))
+            self._mmap_rows = rows
+        return self._mmap
+
+    def get_many(self, texts: list, model_identity: str = None) -> list:
+        """Return cached embeddings for texts, with None for texts not yet encoded"""
+        keys = [self.key_for(text, model_identity) for text in texts]
+        results = [None] * len(texts)
+
+        with self._read_lock():
+            conn = self._connect()
+            c = conn.cursor()
+            slots = {}
+            unique_keys = list(set(keys))
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                c.execute(f'''SELECT key, slot FROM embeddings
+                              WHERE key IN ({','.join('?' * len(chunk))})''', chunk)
+                slots.update(c.fetchall())
+            conn.close()
+
+            if not slots:
+                return results
+
+            vectors = self._vectors()
+            if vectors is None:
+                return results
+            for i, key in enumerate(keys):
+                slot = slots.get(key)
+                if slot is not None and slot < len(vectors):
+                    results[i] = np.array(vectors[slot], dtype=np.float32)
+        return results
+
+    def put_many(self, texts: list, vectors: list, model_identity: str = None):
+        """Store embeddings for texts, reusing freed slots before growing the file"""
+        if not texts:
+            return
+
+        model_identity = model_identity or self.model_identity
+        entries = {}
+        for text, vector in zip(texts, vectors):
+            entries[self.key_for(text, model_identity)] = np.asarray(vector, dtype=self.dtype).reshape(self.dim)
+
+        with self._write_lock():
+            conn = self._connect()
+            c = conn.cursor()
+
+            # Skip keys that are already present
+            keys = list(entries)
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                c.execute(f'''SELECT key FROM embeddings
+                              WHERE key IN ({','.join('?' * len(chunk))})''', chunk)
+                for (key,) in c.fetchall():
+                    entries.pop(key, None)
+            if not entries:
+                conn.close()
+                return
+
+            num_rows = self._num_rows()
+            c.execute('SELECT slot FROM embeddings')
+            used = {row[0] for row in c.fetchall()}
+            free_slots = iter([slot for slot in range(num_rows) if slot not in used])
+            next_slot = num_rows
+
+            mode = 'r+b' if os.path.exists(self.vectors_path) else 'wb'
+            with open(self.vectors_path, mode) as f:
+                for key, vector in entries.items():
+                    slot = next(free_slots, None)
+                    if slot is None:
+                        slot = next_slot
+                        next_slot += 1
+                    f.seek(slot * self.dim * self.dtype.itemsize)
+                    f.write(vector.tobytes())
+                    c.execute('INSERT INTO embeddings (key, slot, model_identity) VALUES (?, ?, ?)',
+                              (key, slot, model_identity))
+                f.flush()
+                os.fsync(f.fileno())
+
+            conn.commit()
+            conn.close()
+
+    def retain(self, texts: list, model_identities: list = None) -> int:
+        """
+        Evict every entry that does not belong to one of texts under one of
+        model_identities (default: the current encoder identity). Called with the
+        full training_data corpus so the cache follows the training data
+        retention limit. Returns the number evicted.
+        """
+        keep = {self.key_for(text, identity) for identity in (model_identities or [self.model_identity])
+                for text in texts}
+
+        with self._write_lock():
+            conn = self._connect()
+            c = conn.cursor()
+            c.execute('SELECT key FROM embeddings')
+            stale = [(key,) for (key,) in c.fetchall() if key not in keep]
+            c.executemany('DELETE FROM embeddings WHERE key = ?', stale)
+            conn.commit()
+
+            c.execute('SELECT COUNT(*) FROM embeddings')
+            live = c.fetchone()[0]
+            conn.close()
+
+            # Reclaim disk space once most of the file is free slots
+            if self._num_rows() > 2 * live + 1000:
+                self._compact()
+
+        return len(stale)
+
+    def _compact(self):
+        """
+        Rewrite live entries into slots 0..n-1 of a new vector file. The index
+        switches to the new file in one transaction, so a crash at any point
+        leaves a consistent cache.
+        """
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('SELECT key, slot FROM embeddings ORDER BY slot')
+        rows = c.fetchall()
+
+        vectors = self._vectors()
+        old_path = self.vectors_path
+        new_generation = self._generation + 1
+        new_path = self._vectors_path(new_generation)
+        with open(new_path, 'wb') as f:
+            for key, old_slot in rows:
+                f.write(np.asarray(vectors[old_slot]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Slots are UNIQUE, so move them out of the way before renumbering
+        c.execute('UPDATE embeddings SET slot = -slot - 1')
+        c.executemany('UPDATE embeddings SET slot = ? WHERE key = ?',
+                      [(new_slot, key) for new_slot, (key, _) in enumerate(rows)])
+        c.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('generation', ?)",
+                  (str(new_generation),))
+        conn.commit()
+        conn.close()
+
+        self._generation = new_generation
+        self._mmap = None
+        os.remove(old_path)
+        print(f"  🧹 Compacted embedding cache to {len(rows)} entries")
+
+    def get_stats(self) -> dict:
+        """Return entry count and on-disk size of the cache"""
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('SELECT COUNT(*) FROM embeddings WHERE model_identity = ?', (self.model_identity,))
+        entries = c.fetchone()[0]
+        conn.close()
+        return {
+            'model_identity': self.model_identity,
+            'entries': entries,
+            'slots': self._num_rows(),
+            'dtype': self.dtype.name,
+            'size_bytes': os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0,
+        }
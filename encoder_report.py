@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Encoder comparison report
+
+Runs the stored training_data through the reference fp32 PyTorch encoder and
+a candidate encoder, and reports:
+  - embedding drift (cosine similarity and relative L2 error per email)
+  - downstream accuracy change of the logistic regression layer
+  - per-email encoding latency
+
+Usage:
+    python encoder_report.py --candidate int8 --limit 500
+    python encoder_report.py --candidate onnx --limit 500
+    python encoder_report.py --candidate torchscript --limit 500
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+from transformers import AutoModel
+import config
+from classifier import EmailClassifier
+from onnx_encoder import OnnxEncoder, export_onnx
+from traced_encoder import TracedEncoder, trace_encoder
+
+CANDIDATES = ['int8', 'onnx', 'torchscript']
+
+
+def load_training_sample(limit: int):
+    """Load a random sample of (text, label) pairs from training_data"""
+    conn = config.get_db()
+    c = conn.cursor()
+    c.execute('SELECT body, category FROM training_data ORDER BY RANDOM() LIMIT ?', (limit,))
+    rows = c.fetchall()
+    conn.close()
+    return [row[0] or '' for row in rows], [row[1] for row in rows]
+
+
+def encode_all(encode_fn, texts: list, batch_size: int = 16) -> np.ndarray:
+    """Encode texts in fixed-size batches"""
+    return np.vstack([encode_fn(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+
+
+def measure_latency(encode_fn, texts: list, samples: int = 50) -> dict:
+    """Time single-email encodes, as seen by the SMTP path"""
+    timings = []
+    for text in texts[:samples]:
+        start = time.perf_counter()
+        encode_fn([text])
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'samples': len(timings),
+        'mean_ms': float(np.mean(timings)) if timings else None,
+        'p50_ms': timings[len(timings) // 2] if timings else None,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] if timings else None,
+    }
+
+
+def embedding_drift(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """Per-email agreement between two embedding matrices"""
+    ref_norm = np.linalg.norm(reference, axis=1)
+    cand_norm = np.linalg.norm(candidate, axis=1)
+    cosine = np.sum(reference * candidate, axis=1) / np.maximum(ref_norm * cand_norm, 1e-12)
+    relative_l2 = np.linalg.norm(reference - candidate, axis=1) / np.maximum(ref_norm, 1e-12)
+    return {
+        'mean_cosine': float(cosine.mean()),
+        'min_cosine': float(cosine.min()),
+        'mean_relative_l2': float(relative_l2.mean()),
+        'max_relative_l2': float(relative_l2.max()),
+        'max_abs_diff': float(np.abs(reference - candidate).max()),
+    }
+
+
+def downstream_accuracy(reference: np.ndarray, candidate: np.ndarray, labels: list,
+                        holdout_fraction: float = 0.2, seed: int = 0) -> dict:
+    """
+    Fit the logistic regression layer on reference embeddings and compare holdout
+    accuracy when it is fed reference vs candidate embeddings (a drop-in encoder
+    swap), plus the accuracy of a layer refit on candidate embeddings.
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    labels = np.array(labels)
+    if len(labels) < 10 or len(set(labels)) < 2:
+        return {'error': 'Not enough labelled training data for an accuracy comparison'}
+
+    order = np.random.RandomState(seed).permutation(len(labels))
+    split = max(1, int(len(labels) * holdout_fraction))
+    test_idx, train_idx = order[:split], order[split:]
+
+    model = LogisticRegression(max_iter=1000, multi_class='multinomial')
+    model.fit(reference[train_idx], labels[train_idx])
+    ref_pred = model.predict(reference[test_idx])
+    cand_pred = model.predict(candidate[test_idx])
+
+    refit = LogisticRegression(max_iter=1000, multi_class='multinomial')
+    refit.fit(candidate[train_idx], labels[train_idx])
+
+    reference_accuracy = float(np.mean(ref_pred == labels[test_idx]))
+    candidate_accuracy = float(np.mean(cand_pred == labels[test_idx]))
+    return {
+        'holdout_samples': int(len(test_idx)),
+        'reference_accuracy': reference_accuracy,
+        'candidate_accuracy': candidate_accuracy,
+        'accuracy_change': candidate_accuracy - reference_accuracy,
+        'refit_candidate_accuracy': float(np.mean(refit.predict(candidate[test_idx]) == labels[test_idx])),
+        'prediction_agreement': float(np.mean(ref_pred == cand_pred)),
+    }
+
+
+def compare_encoders(texts: list, labels: list, reference_encode, candidate_encode,
+                     latency_samples: int = 50) -> dict:
+    """Full comparison of a candidate encoder against the reference encoder"""
+    reference = encode_all(reference_encode, texts)
+    candidate = encode_all(candidate_encode, texts)
+    reference_latency = measure_latency(reference_encode, texts, latency_samples)
+    candidate_latency = measure_latency(candidate_encode, texts, latency_samples)
+
+    speedup = None
+    if reference_latency['mean_ms'] and candidate_latency['mean_ms']:
+        speedup = reference_latency['mean_ms'] / candidate_latency['mean_ms']
+
+    return {
+        'num_emails': len(texts),
+        'drift': embedding_drift(reference, candidate),
+        'accuracy': downstream_accuracy(reference, candidate, labels),
+        'latency': {
+            'reference': reference_latency,
+            'candidate': candidate_latency,
+            'speedup': speedup,
+        },
+    }
+
+
+def build_candidate_encoder(classifier: EmailClassifier, candidate: str, reference_model):
+    """Return an encode function for the named candidate encoder"""
+    if candidate == 'int8':
+        quantized = EmailClassifier.quantize_model(reference_model)
+        return lambda texts: classifier.encode_batch(texts, model=quantized)
+    if candidate == 'onnx':
+        if not os.path.exists(config.ONNX_MODEL_PATH):
+            export_onnx(reference_model, classifier.tokenizer, config.ONNX_MODEL_PATH)
+        onnx_encoder = OnnxEncoder(config.ONNX_MODEL_PATH, num_threads=config.ONNX_NUM_THREADS)
+        return lambda texts: onnx_encoder.encode_texts(classifier.tokenizer, texts, classifier.max_length)
+    if candidate == 'torchscript':
+        traced_encoder = TracedEncoder(trace_encoder(reference_model, classifier.tokenizer))
+        return lambda texts: traced_encoder.encode_texts(classifier.tokenizer, texts, classifier.max_length)
+    raise ValueError(f"Unknown candidate encoder '{candidate}' (choose from {', '.join(CANDIDATES)})")
+
+
+def print_report(candidate: str, report: dict):
+    drift = report['drift']
+    accuracy = report['accuracy']
+    latency = report['latency']
+
+    print(f"\n=== Encoder Comparison: fp32 vs {candidate} ({report['num_emails']} emails) ===")
+    print(f"Embedding drift:  mean cosine {drift['mean_cosine']:.5f}, min cosine {drift['min_cosine']:.5f}, "
+          f"mean relative L2 {drift['mean_relative_l2']:.4f}")
+    if 'error' in accuracy:
+        print(f"Accuracy:         {accuracy['error']}")
+    else:
+        print(f"Accuracy:         fp32 {accuracy['reference_accuracy']*100:.1f}% → "
+              f"{candidate} {accuracy['candidate_accuracy']*100:.1f}% "
+              f"({accuracy['accuracy_change']*100:+.1f} pts, refit {accuracy['refit_candidate_accuracy']*100:.1f}%, "
+              f"agreement {accuracy['prediction_agreement']*100:.1f}%)")
+    print(f"Latency / email:  fp32 {latency['reference']['mean_ms']:.1f}ms (p95 {latency['reference']['p95_ms']:.1f}ms) → "
+          f"{candidate} {latency['candidate']['mean_ms']:.1f}ms (p95 {latency['candidate']['p95_ms']:.1f}ms)"
+          + (f", {latency['speedup']:.2f}x" if latency['speedup'] else ''))
+
+
+def run_report(candidate: str = 'int8', limit: int = 500, latency_samples: int = 50) -> dict:
+    """Compare the candidate encoder to fp32 on stored training data and save the report"""
+    texts, labels = load_training_sample(limit)
+    if not texts:
+        print("No training data available - run training first")
+        return None
+
+    classifier = EmailClassifier()
+    try:
+        if classifier.encoder_backend == 'pytorch' and classifier.quantization == 'none':
+            reference_model = classifier.bert_model
+        else:
+            reference_model = AutoModel.from_pretrained(EmailClassifier.MODEL_NAME).eval()
+
+        reference_encode = lambda batch: classifier.encode_batch(batch, model=reference_model)
+        candidate_encode = build_candidate_encoder(classifier, candidate, reference_model)
+
+        report = compare_encoders(texts, labels, reference_encode, candidate_encode, latency_samples)
+    finally:
+        classifier.close()
+    report['candidate'] = candidate
+    print_report(candidate, report)
+
+    report_path = os.path.join(config.MODEL_DIR, f'encoder_report_{candidate}.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to {report_path}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare a candidate encoder against fp32 DistilBERT')
+    parser.add_argument('--candidate', choices=CANDIDATES, default='int8')
+    parser.add_argument('--limit', type=int, default=500, help='Number of training emails to compare on')
+    parser.add_argument('--latency-samples', type=int, default=50, help='Emails timed one at a time')
+    args = parser.parse_args()
+
+    config.init_db()
+    run_report(args.candidate, args.limit, args.latency_samples)
@@ -0,0 +1,120 @@
+"""
+Dedicated executors for the SMTP handler's blocking stages, and an
+event-loop lag monitor.
+
+aiosmtpd runs every SMTP session on one asyncio event loop, so anything
+blocking in handle_DATA (a DistilBERT pass, SQLite, smtplib delivery) also
+stalls EHLO and RCPT for every other session. The handler hands those stages
+to two bounded thread pools instead:
+  classify    classifier.classify (CPU-bound; sized so batches can fill)
+  io          parsing, SQLite, degraded classification, footer and delivery
+The lag monitor sleeps for a fixed interval on the loop and records how late
+it wakes up. That lateness is how long any session's next SMTP reply would
+have been held up.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from stats import percentile
+
+
+class StageExecutor:
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f'smtp-{name}')
+
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=2000)   # Recent seconds from submission to start
+        self.submitted = 0
+        self.active = 0
+        self.completed = 0
+
+    def submit(self, fn, *args) -> asyncio.Future:
+        """Run fn(*args) on this executor; must be called from the event loop"""
+        submitted = time.perf_counter()
+
+        def call():
+            with self._lock:
+                self.active += 1
+                self._waits.append(time.perf_counter() - submitted)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        with self._lock:
+            self.submitted += 1
+        return asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def run(self, fn, *args):
+        return await self.submit(fn, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def get_stats(self) -> dict:
+        """Pool size, busy and queued tasks, and queue wait percentiles (milliseconds)"""
+        with self._lock:
+            waits = sorted(self._waits)
+            submitted, active, completed = self.submitted, self.active, self.completed
+        return {
+            'max_workers': self.max_workers,
+            'active': active,
+            'queued': submitted - completed - active,
+            'completed': completed,
+            'p50_wait_ms': percentile(waits, 50, 1000),
+            'p99_wait_ms': percentile(waits, 99, 1000),
+        }
+
+
+class EventLoopLagMonitor:
+    def __init__(self, interval_ms: float = 100, window: int = 3000):
+        self.interval = max(1.0, interval_ms) / 1000.0
+        self._lock = threading.Lock()
+        self._lags = deque(maxlen=window)   # Recent lag samples (seconds)
+        self.max_lag = 0.0
+        self.samples = 0
+        self._future = None
+
+    async def run(self):
+        """Sample lag forever on the running loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - start - self.interval))
+
+    def record(self, lag: float):
+        with self._lock:
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            self.samples += 1
+
+    def start(self, loop):
+        """Start sampling on a loop running in another thread (aiosmtpd's controller loop)"""
+        self._future = asyncio.run_coroutine_threadsafe(self.run(), loop)
+
+    def stop(self):
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    def get_stats(self) -> dict:
+        """Lag percentiles over the recent window and the worst since start (milliseconds)"""
+        with self._lock:
+            lags = sorted(self._lags)
+            max_lag, samples = self.max_lag, self.samples
+        return {
+            'interval_ms': self.interval * 1000,
+            'samples': samples,
+            'window_samples': len(lags),
+            'p50_lag_ms': percentile(lags, 50, 1000),
+            'p99_lag_ms': percentile(lags, 99, 1000),
+            'window_max_lag_ms': lags[-1] * 1000 if lags else None,
+            'max_lag_ms': max_lag * 1000,
+        }
@@ -0,0 +1,152 @@
+"""
+Reduced-dimension float16 feature store for training and offline evaluation.
+
+With FEATURE_PROJECTION set, training no longer holds a 768-dim float32 vector
+per sample. A projection is fitted on a sample of the corpus's embeddings:
+  pca       top FEATURE_PROJECTION_DIM principal components
+  random    Gaussian random projection (fixed seed)
+and every training embedding is projected as it is read from the embedding
+cache or encoded, into one contiguous float16 array next to the model:
+  features.json           metadata: projection, encoder identity, shape, and
+                          the array and projection file names
+  features.<id>.npy       float16 matrix of shape (samples, dim)
+  features.<id>.npz       projection mean and components, and the labels
+The logistic regression is fitted directly on the memory-mapped array. The
+fitted layer is then folded back onto raw embeddings (coef · P, intercept -
+coef · P · mean), so serving, online updates and the classifier artifact are
+unchanged.
+"""
+import json
+import os
+import time
+import numpy as np
+from linear_model import LinearSoftmaxModel, read_metadata
+
+PROJECTIONS = ['pca', 'random']
+
+
+class FeatureProjection:
+    def __init__(self, kind: str, mean, components, metadata: dict = None):
+        self.kind = kind
+        self.mean = np.asarray(mean, dtype=np.float32)                # (input_dim,)
+        self.components = np.asarray(components, dtype=np.float32)    # (dim, input_dim)
+        self.metadata = metadata or {}
+
+    @classmethod
+    def fit(cls, kind: str, sample, dim: int, seed: int = 0):
+        """Fit a projection to dim dimensions on a (samples, input_dim) embedding sample"""
+        sample = np.asarray(sample, dtype=np.float32)
+        if kind == 'pca':
+            mean = sample.mean(axis=0)
+            _, singular_values, components = np.linalg.svd(sample - mean, full_matrices=False)
+            dim = min(dim, len(components))
+            variance = singular_values ** 2
+            explained = float(variance[:dim].sum() / max(variance.sum(), 1e-12))
+            return cls(kind, mean, components[:dim], {'explained_variance': explained})
+        if kind == 'random':
+            rng = np.random.RandomState(seed)
+            components = rng.normal(size=(dim, sample.shape[1])) / np.sqrt(dim)
+            return cls(kind, np.zeros(sample.shape[1]), components, {'seed': seed})
+        raise ValueError(f"Unknown feature projection '{kind}' (choose from {', '.join(PROJECTIONS)})")
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    def transform(self, X) -> np.ndarray:
+        """Project a (n_samples, input_dim) matrix to (n_samples, dim)"""
+        return (np.asarray(X, dtype=np.float32) - self.mean) @ self.components.T
+
+    def fold(self, model: LinearSoftmaxModel) -> LinearSoftmaxModel:
+        """A model over raw embeddings scoring exactly like model over projected ones"""
+        coef = np.asarray(model.coef_, dtype=np.float32) @ self.components
+        intercept = np.asarray(model.intercept_, dtype=np.float32) - coef @ self.mean
+        metadata = dict(model.metadata, projection=self.describe())
+        return LinearSoftmaxModel(coef, intercept, model.classes_, model.encoder_identity, metadata)
+
+    def describe(self) -> dict:
+        return dict(self.metadata, kind=self.kind, dim=self.dim, input_dim=int(self.components.shape[1]))
+
+
+class FeatureStore:
+    def __init__(self, features, labels, projection: FeatureProjection, metadata: dict = None):
+        self.features = features            # (samples, dim) float16, usually memory-mapped
+        self.labels = labels                # (samples,) str
+        self.projection = projection
+        self.metadata = metadata or {}
+
+    @classmethod
+    def create(cls, meta_path: str, num_samples: int, labels: list, projection: FeatureProjection,
+               encoder_identity: str):
+        """
+        Start a new store: the float16 array is allocated on disk and filled with
+        write(); commit() publishes it.
+        """
+        model_dir = os.path.dirname(meta_path) or '.'
+        base = os.path.splitext(os.path.basename(meta_path))[0]
+        store_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{time.monotonic_ns() % 1000000}"
+        features = np.lib.format.open_memmap(os.path.join(model_dir, f"{base}.{store_id}.npy"), mode='w+',
+                                             dtype=np.float16, shape=(num_samples, projection.dim))
+        metadata = {
+            'store_id': store_id,
+            'features_file': f"{base}.{store_id}.npy",
+            'projection_file': f"{base}.{store_id}.npz",
+            'encoder_identity': encoder_identity,
+            'num_samples': int(num_samples),
+            'dim': projection.dim,
+            'dtype': 'float16',
+            'projection': projection.describe(),
+        }
+        return cls(features, np.asarray(labels, dtype=str), projection, metadata)
+
+    def write(self, rows, embeddings):
+        """Project raw embeddings and store them at rows"""
+        self.features[rows] = self.projection.transform(embeddings).astype(np.float16)
+
+    def commit(self, meta_path: str) -> int:
+        """Flush the array, then atomically replace the metadata; returns bytes on disk"""
+        model_dir = os.path.dirname(meta_path) or '.'
+        self.features.flush()
+        projection_path = os.path.join(model_dir, self.metadata['projection_file'])
+        with open(projection_path, 'wb') as f:
+            np.savez(f, mean=self.projection.mean, components=self.projection.components, labels=self.labels)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.metadata['saved_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.metadata, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, meta_path)
+
+        # Earlier stores are superseded
+        base = os.path.splitext(os.path.basename(meta_path))[0]
+        keep = {self.metadata['features_file'], self.metadata['projection_file']}
+        for name in os.listdir(model_dir):
+            if name.startswith(f"{base}.") and name.endswith(('.npy', '.npz')) and name not in keep:
+                try:
+                    os.remove(os.path.join(model_dir, name))
+                except OSError:
+                    pass
+        return self.size_bytes(model_dir)
+
+    def size_bytes(self, model_dir: str) -> int:
+        return sum(os.path.getsize(os.path.join(model_dir, self.metadata[name]))
+                   for name in ('features_file', 'projection_file'))
+
+    @classmethod
+    def load(cls, meta_path: str):
+        """Load a committed store, memory-mapping the feature array"""
+        metadata = read_metadata(meta_path)
+        if metadata is None:
+            raise FileNotFoundError(meta_path)
+        model_dir = os.path.dirname(meta_path) or '.'
+        features = np.load(os.path.join(model_dir, metadata['features_file']), mmap_mode='r')
+        with np.load(os.path.join(model_dir, metadata['projection_file']), allow_pickle=False) as data:
+            projection = FeatureProjection(metadata['projection']['kind'], data['mean'], data['components'],
+                                           {k: v for k, v in metadata['projection'].items()
+                                            if k not in ('kind', 'dim', 'input_dim')})
+            labels = data['labels']
+        return cls(features, labels, projection, metadata)
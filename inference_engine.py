@@ -0,0 +1,225 @@
+"""
+Micro-batching inference engine for DistilBERT feature extraction.
+
+Concurrent classify() calls submit their text to a shared queue. Worker
+threads collect pending requests into a batch (bounded by a maximum batch
+size and a maximum wait in milliseconds) and run one padded forward pass
+for the whole batch, then hand each caller its own embedding row.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from stats import percentile
+
+
+class BatchingInferenceEngine:
+    def __init__(self, encode_fn, max_batch_size: int = 16, max_wait_ms: float = 5.0,
+                 num_workers: int = 1):
+        """
+        Args:
+            encode_fn: Callable taking a list of queued requests (as passed to
+                       encode()) and returning one embedding row per request
+            max_batch_size: Maximum number of requests per forward pass
+            max_wait_ms: Maximum time the first request of a batch waits for
+                         more requests to arrive before the batch is run
+            num_workers: Number of batches that may be encoded concurrently
+                         (one per inference worker process)
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.num_workers = max(1, num_workers)
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._running = False
+
+        # Statistics
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=2000)  # Recent per-request latencies (seconds)
+        self.total_requests = 0
+        self.total_batches = 0
+        self.largest_batch = 0
+
+    def start(self):
+        """Start the batching worker threads"""
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f'inference-batcher-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop the worker threads after their current batch"""
+        if not self._running:
+            return
+        self._running = False
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding and return a Future for its embedding"""
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text, timeout: float = None):
+        """Encode a single text, blocking until its batch has been processed"""
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect_batch(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires"""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    # Wait expired - still take anything already queued
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown requested - finish this batch first
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+
+            texts = [text for text, _, _ in batch]
+            try:
+                features = self.encode_fn(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            for i, (_, future, enqueued_at) in enumerate(batch):
+                future.set_result(features[i])
+
+            with self._stats_lock:
+                self.total_requests += len(batch)
+                self.total_batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+                self._latencies.extend(now - enqueued_at for _, _, enqueued_at in batch)
+
+    def get_stats(self) -> dict:
+        """Return batching statistics and recent latency percentiles (milliseconds)"""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            total_requests = self.total_requests
+            total_batches = self.total_batches
+            largest_batch = self.largest_batch
+
+        return {
+            'num_workers': self.num_workers,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queue.qsize(),
+            'total_requests': total_requests,
+            'total_batches': total_batches,
+            'avg_batch_size': total_requests / total_batches if total_batches else 0,
+            'largest_batch': largest_batch,
+            'p50_latency_ms': percentile(latencies, 50, 1000),
+            'p99_latency_ms': percentile(latencies, 99, 1000),
+        }
+
+
+class EncoderPriorityGate:
+    """
+    Gives live encodes priority over background (training) encodes on the shared
+    encoder. Live encodes never wait; a background batch waits until no live
+    encode is running and none has finished within idle_ms, or until max_wait_ms
+    has passed so training still makes progress under sustained load.
+
+    State lives in shared memory so a forked training worker sees the parent's
+    live encodes. The background side only reads it and takes no lock, so
+    killing a worker mid-wait cannot block live traffic.
+    """
+
+    def __init__(self, idle_ms: float = 10.0, max_wait_ms: float = 1000.0):
+        self.idle = idle_ms / 1000.0
+        self.max_wait = max_wait_ms / 1000.0
+        self._lock = threading.Lock()
+        self._active_live = multiprocessing.RawValue('i', 0)
+        self._last_live = multiprocessing.RawValue('d', 0.0)
+
+        # Statistics (written by the background side only)
+        self._background_batches = multiprocessing.RawValue('q', 0)
+        self._background_waits = multiprocessing.RawValue('q', 0)
+        self._background_wait_time = multiprocessing.RawValue('d', 0.0)
+
+    def __getstate__(self):
+        # Passed to a spawned training worker: shared values travel, the lock does not
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def live(self):
+        """Mark a live encode for its duration"""
+        with self._lock:
+            self._active_live.value += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active_live.value -= 1
+                self._last_live.value = time.monotonic()
+
+    def wait_for_turn(self) -> float:
+        """Block a background batch until live traffic is quiet; returns seconds waited"""
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if self._active_live.value == 0:
+                quiet = now - self._last_live.value
+                if quiet >= self.idle:
+                    break
+                time.sleep(min(self.idle - quiet, deadline - now))
+            else:
+                time.sleep(min(self.idle, deadline - now))
+
+        waited = time.monotonic() - start
+        self._background_batches.value += 1
+        if waited > 0.001:
+            self._background_waits.value += 1
+            self._background_wait_time.value += waited
+        return waited
+
+    def get_stats(self) -> dict:
+        return {
+            'active_live_encodes': self._active_live.value,
+            'background_batches': self._background_batches.value,
+            'background_batches_delayed': self._background_waits.value,
+            'background_wait_seconds': self._background_wait_time.value,
+        }
@@ -0,0 +1,120 @@
+"""
+Multi-process inference worker pool.
+
+Worker processes are forked from the main process after the encoder has been
+loaded, so the PyTorch weights are shared copy-on-write instead of being
+loaded once per worker (inference never writes to them). Each worker runs
+tokenization and the forward pass with its own torch thread pool, outside
+the main process's GIL, so encoding scales with core count while the SMTP
+server, dashboard, IDLE threads and training keep running in the main
+process.
+
+The pool must be created before the main process runs its first forward
+pass: forking after torch's OpenMP thread pool has started can deadlock the
+children.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import Future, TimeoutError
+
+# Fast tokenizers must not start their own thread pool before the fork
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+# Set in the parent before forking; inherited by every worker
+_worker_classifier = None
+
+
+def _init_worker(num_threads: int):
+    """Per-worker setup: thread budget and a private ONNX session if needed"""
+    import torch
+    import config
+    from onnx_encoder import OnnxEncoder
+
+    # Shutdown is driven by the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    torch.set_num_threads(num_threads)
+
+    # onnxruntime sessions are not fork-safe, so each worker opens its own
+    if _worker_classifier.onnx_encoder is not None:
+        _worker_classifier.onnx_encoder = OnnxEncoder(config.ONNX_MODEL_PATH, num_threads=num_threads)
+
+
+def _encode_in_worker(texts: list, max_length: int = None, early_exit=None, deadline: float = None):
+    # Forked workers hold a copy of the classifier, so the cap and early-exit heads are passed per call
+    timings = {}
+    features, lengths = _worker_classifier.encode_with_lengths(texts, max_length=max_length, timings=timings,
+                                                               early_exit=early_exit, deadline=deadline)
+    return features, lengths, timings
+
+
+def process_memory(pid: int) -> dict:
+    """Resident and proportional set size of a process in MB (PSS counts shared pages fractionally)"""
+    memory = {'pid': pid}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    memory[f'{key.lower()}_mb'] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return memory
+
+
+class InferencePool:
+    def __init__(self, classifier, num_workers: int, threads_per_worker: int = 0):
+        global _worker_classifier
+        _worker_classifier = classifier
+
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+
+        self._lock = threading.Lock()
+        self.timeouts = 0
+
+        ctx = multiprocessing.get_context('fork')
+        self._pool = ctx.Pool(num_workers, initializer=_init_worker,
+                              initargs=(self.threads_per_worker,))
+        print(f"Started {num_workers} inference worker processes "
+              f"({self.threads_per_worker} torch threads each)")
+
+    def submit(self, texts: list, max_length: int = None, early_exit=None, deadline: float = None) -> Future:
+        """Encode texts in a worker process; the Future resolves to (features, token lengths, timings)"""
+        future = Future()
+        self._pool.apply_async(_encode_in_worker, (texts, max_length, early_exit, deadline),
+                               callback=future.set_result,
+                               error_callback=future.set_exception)
+        return future
+
+    def encode(self, texts: list, max_length: int = None, early_exit=None, deadline: float = None,
+               timeout: float = None):
+        """
+        Encode texts in a worker process, blocking until done. Raises TimeoutError
+        after timeout seconds: if a worker dies (OOM killer, crash in torch) the
+        pool replaces it but drops its task, so the Future would never resolve.
+        """
+        try:
+            return self.submit(texts, max_length, early_exit, deadline).result(timeout=timeout)
+        except TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Inference worker did not answer within {timeout:g}s")
+
+    def close(self):
+        """Terminate the worker processes"""
+        self._pool.terminate()
+        self._pool.join()
+
+    def get_stats(self) -> dict:
+        """Worker count and per-process memory, to confirm weights are shared"""
+        # multiprocessing.Pool keeps its worker processes in _pool
+        workers = [process_memory(process.pid) for process in getattr(self._pool, '_pool', [])]
+        return {
+            'num_workers': self.num_workers,
+            'threads_per_worker': self.threads_per_worker,
+            'timeouts': self.timeouts,
+            'main_process': process_memory(os.getpid()),
+            'workers': workers,
+        }
@@ -0,0 +1,182 @@
+"""
+Pure-NumPy logistic regression predictor and its on-disk artifact.
+
+Training still uses sklearn, but the fitted coefficients are exported to a
+versioned artifact:
+  classifier.json         metadata: format version, class order, encoder
+                          identity, shape, and the weights file name
+  classifier.<id>.npy     float32 matrix of shape (classes, features + 1);
+                          the last column holds the intercepts
+The weights file is written first under a new name and classifier.json is
+replaced atomically afterwards, so a reader never sees a half-written model.
+Weights are loaded memory-mapped and scored with one matrix product and a
+softmax - no sklearn import or input validation on the hot path.
+"""
+import json
+import os
+import time
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+class LinearSoftmaxModel:
+    def __init__(self, coef, intercept, classes, encoder_identity: str = None, metadata: dict = None):
+        self.coef_ = coef                    # (n_classes, n_features)
+        self.intercept_ = intercept          # (n_classes,)
+        self.classes_ = np.asarray(classes)
+        self.encoder_identity = encoder_identity
+        self.metadata = metadata or {}
+
+    @classmethod
+    def from_sklearn(cls, model, encoder_identity: str = None, metadata: dict = None):
+        """Convert a fitted multinomial sklearn LogisticRegression"""
+        coef = np.asarray(model.coef_, dtype=np.float32)
+        intercept = np.asarray(model.intercept_, dtype=np.float32)
+        if len(model.classes_) == 2 and coef.shape[0] == 1:
+            # sklearn scores a two-class model as [-d, d]
+            coef = np.vstack([-coef[0], coef[0]])
+            intercept = np.array([-intercept[0], intercept[0]], dtype=np.float32)
+        return cls(coef, intercept, [str(c) for c in model.classes_], encoder_identity, metadata)
+
+    def aligned_to(self, categories: list):
+        """
+        Reorder rows so classes_ matches categories. Categories missing from the
+        training data get zero weights and a -inf intercept (probability 0).
+        """
+        if list(self.classes_) == list(categories):
+            return self
+        rows = {c: i for i, c in enumerate(self.classes_)}
+        coef = np.zeros((len(categories), self.coef_.shape[1]), dtype=np.float32)
+        intercept = np.full(len(categories), -np.inf, dtype=np.float32)
+        for i, category in enumerate(categories):
+            if category in rows:
+                coef[i] = self.coef_[rows[category]]
+                intercept[i] = self.intercept_[rows[category]]
+        return LinearSoftmaxModel(coef, intercept, categories, self.encoder_identity, self.metadata)
+
+    @property
+    def num_features(self) -> int:
+        return self.coef_.shape[1]
+
+    def decision_function(self, X) -> np.ndarray:
+        return np.asarray(X, dtype=np.float32) @ self.coef_.T + self.intercept_
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Softmax class probabilities for a (n_samples, n_features) matrix"""
+        scores = self.decision_function(X)
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return scores / scores.sum(axis=1, keepdims=True)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.decision_function(X).argmax(axis=1)]
+
+    def partial_fit(self, X, y, learning_rate: float = 1.0, max_steps: int = 10):
+        """
+        Apply a few corrected samples with normalized SGD steps on the softmax
+        cross-entropy, stopping once every sample is predicted as its label.
+        Returns (new model, steps taken); this model is left untouched (its
+        weights may be a read-only memory map).
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        classes = list(self.classes_)
+        targets = np.array([classes.index(label) for label in y])
+        onehot = np.zeros((len(targets), len(classes)), dtype=np.float32)
+        onehot[np.arange(len(targets)), targets] = 1.0
+
+        coef = np.array(self.coef_, dtype=np.float32)
+        intercept = np.array(self.intercept_, dtype=np.float32)
+        # A class absent from the last refit has a -inf intercept and could never be learned
+        finite = np.isfinite(intercept)
+        for target in set(targets):
+            if not finite[target]:
+                intercept[target] = intercept[finite].min() if finite.any() else 0.0
+
+        # Scale by the sample norm so one step moves the scores by about learning_rate
+        step_size = learning_rate / (1.0 + (X * X).sum(axis=1, keepdims=True))
+        steps = 0
+        while steps < max_steps:
+            scores = X @ coef.T + intercept
+            if np.all(scores.argmax(axis=1) == targets):
+                break
+            probs = np.exp(scores - scores.max(axis=1, keepdims=True))
+            probs /= probs.sum(axis=1, keepdims=True)
+            # Intercepts stay fixed: a single correction should not shift the class priors
+            coef -= ((probs - onehot) * step_size).T @ X
+            steps += 1
+
+        metadata = dict(self.metadata)
+        metadata['online_updates'] = metadata.get('online_updates', 0) + len(targets)
+        return LinearSoftmaxModel(coef, intercept, classes, self.encoder_identity, metadata), steps
+
+    def save(self, meta_path: str) -> int:
+        """Write the weights file and then atomically replace the metadata; returns bytes written"""
+        model_dir = os.path.dirname(meta_path) or '.'
+        base = os.path.splitext(os.path.basename(meta_path))[0]
+        model_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{time.monotonic_ns() % 1000000}"
+        weights_name = f"{base}.{model_id}.npy"
+
+        weights = np.hstack([self.coef_, self.intercept_[:, None]]).astype(np.float32)
+        with open(os.path.join(model_dir, weights_name), 'wb') as f:
+            np.save(f, weights)
+            f.flush()
+            os.fsync(f.fileno())
+
+        previous = read_metadata(meta_path)
+        metadata = dict(self.metadata)
+        metadata.update({
+            'format_version': FORMAT_VERSION,
+            'model_id': model_id,
+            'weights_file': weights_name,
+            'classes': [str(c) for c in self.classes_],
+            'encoder_identity': self.encoder_identity,
+            'num_classes': int(self.coef_.shape[0]),
+            'num_features': int(self.coef_.shape[1]),
+            'dtype': 'float32',
+            'saved_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, meta_path)
+        self.metadata = metadata
+
+        # Keep the previous weights file for readers still mapping it; drop older ones
+        keep = {weights_name, previous.get('weights_file') if previous else None}
+        for name in os.listdir(model_dir):
+            if name.startswith(f"{base}.") and name.endswith('.npy') and name not in keep:
+                try:
+                    os.remove(os.path.join(model_dir, name))
+                except OSError:
+                    pass
+
+        return os.path.getsize(os.path.join(model_dir, weights_name)) + os.path.getsize(meta_path)
+
+    @classmethod
+    def load(cls, meta_path: str, mmap: bool = True):
+        """Load an artifact written by save(), memory-mapping the weights"""
+        metadata = read_metadata(meta_path)
+        if metadata is None:
+            raise FileNotFoundError(meta_path)
+        if metadata.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model format version {metadata.get('format_version')}")
+
+        weights_path = os.path.join(os.path.dirname(meta_path) or '.', metadata['weights_file'])
+        weights = np.load(weights_path, mmap_mode='r' if mmap else None)
+        expected = (metadata['num_classes'], metadata['num_features'] + 1)
+        if weights.shape != expected:
+            raise ValueError(f"Weights shape {weights.shape} does not match metadata {expected}")
+
+        return cls(weights[:, :-1], np.array(weights[:, -1]), metadata['classes'],
+                   metadata.get('encoder_identity'), metadata)
+
+
+def read_metadata(meta_path: str):
+    """Return the artifact metadata, or None if there is no artifact"""
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
@@ -15,6 +15,11 @@ def main():
     
     # Initialize classifier
     classifier = EmailClassifier()
+
+    # Fork inference workers before any other threads run a forward pass,
+    # so they share the encoder weights copy-on-write
+    if config.INFERENCE_WORKERS > 0:
+        classifier.start_inference_pool(config.INFERENCE_WORKERS)
     
     # Initialize trainer
     trainer = EmailTrainer(classifier)
@@ -41,7 +46,10 @@ def main():
     print("="*60 + "\n")
 
     # Start web UI (blocking)
-    run_web_ui(trainer=trainer, classifier=classifier)
+    try:
+        run_web_ui(trainer=trainer, classifier=classifier, smtp_server=smtp_server)
+    finally:
+        classifier.close()
 
 if __name__ == '__main__':
     main()
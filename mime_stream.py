@@ -0,0 +1,171 @@
+"""
+Bounded, bytes-based MIME parsing for the classification path.
+
+Classification only needs a few headers and the first ~1000 characters of
+body text, so instead of building a full email.message tree this module:
+  - parses headers only (each header block is capped at MAX_HEADER_BYTES)
+  - walks multipart bodies by searching for boundary lines in the raw bytes,
+    without copying or decoding the parts in between
+  - decodes only the prefix of each text/plain part needed to fill the snippet
+  - for messages without a text/plain part, streams the first HTML part
+    through html_text until the snippet is filled
+  - skips attachments and non-text parts without decoding their payloads
+  - stops at the snippet length, at max_scan_bytes into the message, or after
+    max_parts parts, whichever comes first
+
+Body text is decoded as UTF-8 (ignoring errors), as the full parser did, so the
+text given to the encoder for plain-text mail is unchanged. The trainer uses
+the same function, so training and classification see the same text.
+"""
+import binascii
+import codecs
+import quopri
+import re
+from email.parser import HeaderParser
+from html_text import html_to_text
+
+MAX_HEADER_BYTES = 256 * 1024
+HEADER_END = re.compile(rb'\r?\n\r?\n')
+# Worst-case encoded bytes per decoded character (quoted-printable UTF-8 with soft line breaks)
+ENCODED_BYTES_PER_CHAR = 16
+HTML_CHUNK_BYTES = 64 * 1024
+
+_header_parser = HeaderParser()
+
+
+def parse_headers(data: bytes, start: int = 0, end: int = None):
+    """Parse the header block at data[start:]; returns (headers Message, offset where the body starts)"""
+    end = len(data) if end is None else end
+    limit = min(end, start + MAX_HEADER_BYTES)
+    if data.startswith(b'\n', start) or data.startswith(b'\r\n', start):
+        # No headers at all: the body starts after the blank line
+        return _header_parser.parsestr(''), data.index(b'\n', start) + 1
+    match = HEADER_END.search(data, start, limit)
+    header_end, body_start = (match.start(), match.end()) if match else (limit, limit)
+    headers = _header_parser.parsestr(data[start:header_end].decode('utf-8', errors='ignore'))
+    return headers, body_start
+
+
+def _iter_decoded(data: bytes, start: int, end: int, encoding: str, chunk_bytes: int):
+    """Yield a part body as text, decoding chunk_bytes of the encoded body at a time"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    carry = b''
+    for offset in range(start, end, chunk_bytes):
+        chunk = carry + data[offset:min(end, offset + chunk_bytes)]
+        last = offset + chunk_bytes >= end
+        if encoding == 'base64':
+            chunk = b''.join(chunk.split())
+            cut = len(chunk) - (0 if last else len(chunk) % 4)
+            chunk, carry = chunk[:cut], chunk[cut:]
+            try:
+                chunk = binascii.a2b_base64(chunk)
+            except binascii.Error:
+                return
+        elif encoding == 'quoted-printable':
+            # Only decode whole lines so an escape is never split
+            cut = len(chunk) if last else chunk.rfind(b'\n') + 1
+            chunk, carry = quopri.decodestring(chunk[:cut]), chunk[cut:]
+        yield decoder.decode(chunk, final=last)
+
+
+def _decode_prefix(data: bytes, start: int, end: int, encoding: str, chars: int) -> str:
+    """Decode just enough of a part body to yield up to chars characters"""
+    text = ''
+    for chunk in _iter_decoded(data, start, end, encoding, chars * ENCODED_BYTES_PER_CHAR):
+        text += chunk
+        if len(text) >= chars:
+            break
+    return text[:chars]
+
+
+def _iter_parts(data: bytes, start: int, end: int, boundary: str):
+    """Yield (start, end) of each part between multipart boundary lines"""
+    delimiter = b'--' + boundary.encode('utf-8', errors='ignore')
+
+    # The first delimiter may sit at the very start of the body; later ones follow a newline
+    pos = start if data.startswith(delimiter, start) else data.find(b'\n' + delimiter, start, end)
+    if pos == -1:
+        return
+    if pos != start:
+        pos += 1
+
+    while True:
+        after = pos + len(delimiter)
+        if data.startswith(b'--', after):
+            return  # Closing delimiter
+        line_end = data.find(b'\n', after, end)
+        if line_end == -1:
+            return
+        part_start = line_end + 1
+
+        next_pos = data.find(b'\n' + delimiter, part_start, end)
+        part_end = end if next_pos == -1 else next_pos
+        if part_end > part_start and data[part_end - 1:part_end] == b'\r':
+            part_end -= 1
+        yield part_start, part_end
+        if next_pos == -1:
+            return
+        pos = next_pos + 1
+
+
+def _collect(data: bytes, start: int, end: int, headers, out: list, budget: dict, top_level: bool):
+    """Append decoded text from the entity at data[start:end] until the budget is used up"""
+    content_type = headers.get_content_type()
+    maintype = headers.get_content_maintype()
+
+    if maintype == 'multipart':
+        boundary = headers.get_param('boundary')
+        if not boundary:
+            return
+        for part_start, part_end in _iter_parts(data, start, end, boundary):
+            if budget['chars'] <= 0 or budget['parts'] <= 0:
+                return
+            budget['parts'] -= 1
+            part_headers, body_start = parse_headers(data, part_start, part_end)
+            _collect(data, body_start, part_end, part_headers, out, budget, top_level=False)
+        return
+
+    if content_type == 'message/rfc822':
+        # A forwarded message: its own headers, then its body
+        inner_headers, body_start = parse_headers(data, start, end)
+        _collect(data, body_start, end, inner_headers, out, budget, top_level=False)
+        return
+
+    encoding = headers.get('content-transfer-encoding', '').strip().lower()
+    if content_type == 'text/html' and headers.get_content_disposition() != 'attachment':
+        # Only used when the message turns out to have no text/plain part
+        if budget['html'] is None:
+            budget['html'] = (start, end, encoding)
+        return
+
+    # A single-part message is classified on its text whatever the subtype; inside a
+    # multipart only inline text/plain parts count
+    if top_level:
+        if maintype != 'text':
+            return
+    elif content_type != 'text/plain' or headers.get_content_disposition() == 'attachment':
+        return
+
+    text = _decode_prefix(data, start, end, encoding, budget['chars'])
+    out.append(text)
+    budget['chars'] -= len(text)
+
+
+def extract_text(raw_email, snippet_chars: int = 1000, max_scan_bytes: int = 8 * 1024 * 1024,
+                 max_parts: int = 100):
+    """
+    Parse the headers and the leading body text of an email (bytes or str).
+    Returns (headers Message, body text of at most snippet_chars characters).
+    """
+    data = raw_email.encode('utf-8', errors='ignore') if isinstance(raw_email, str) else raw_email
+    end = min(len(data), max_scan_bytes)
+    headers, body_start = parse_headers(data, 0, end)
+
+    out = []
+    budget = {'chars': snippet_chars, 'parts': max_parts, 'html': None}
+    _collect(data, body_start, end, headers, out, budget, top_level=True)
+    if not out and budget['html'] is not None:
+        part_start, part_end, encoding = budget['html']
+        return headers, html_to_text(_iter_decoded(data, part_start, part_end, encoding, HTML_CHUNK_BYTES),
+                                     snippet_chars)
+    return headers, ''.join(out)[:snippet_chars]
@@ -0,0 +1,150 @@
+"""
+Near-duplicate index over parsed email text (MinHash with banded LSH lookup).
+
+One campaign sent to many mailboxes arrives with a different Message-ID per
+copy, so Message-ID deduplication misses it. Each text gets a MinHash
+signature of its word 3-gram shingles; the signature is split into bands and
+every band is indexed, so texts with high Jaccard similarity share at least
+one band with near certainty. Candidates are then verified by the fraction of
+agreeing signature values (an estimate of Jaccard similarity). A hit returns
+the stored DistilBERT embedding and base probabilities of the earlier copy.
+
+Shingles are hashed with Python's built-in string hash, which is randomized
+per process - signatures are only meaningful inside the process that made
+them, which is all an in-memory index needs.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'\w+')
+NUM_PERMUTATIONS = 64
+ROWS_PER_BAND = 4
+
+# Multiply-shift hash family standing in for random permutations
+_rng = np.random.RandomState(0)
+_SEEDS = _rng.randint(0, 2 ** 62, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64)[:, None]
+_MULTIPLIERS = (_rng.randint(0, 2 ** 62, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64) * 2 + 1)[:, None]
+
+
+def minhash(text: str, shingle_size: int = 3, min_tokens: int = 8):
+    """MinHash signature of the text's word shingles, or None for texts too short to compare reliably"""
+    tokens = TOKEN_PATTERN.findall((text or '').lower())
+    if len(tokens) < min_tokens:
+        return None
+
+    shingles = {' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)}
+    hashes = np.fromiter((hash(s) for s in shingles), dtype=np.int64, count=len(shingles)).view(np.uint64)
+    with np.errstate(over='ignore'):
+        permuted = ((hashes[None, :] ^ _SEEDS) * _MULTIPLIERS) >> np.uint64(32)
+    return permuted.min(axis=1)
+
+
+class NearDuplicateIndex:
+    def __init__(self, max_entries: int = 5000, min_similarity: float = 0.8):
+        self.max_entries = max(1, max_entries)
+        self.min_similarity = min_similarity
+        self.bands = NUM_PERMUTATIONS // ROWS_PER_BAND
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()                   # entry id -> entry, least recently used first
+        self._buckets = [{} for _ in range(self.bands)] # per band: band bytes -> set of entry ids
+        self._next_id = 0
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._signature_time = 0.0
+        self._signatures = 0
+
+    def _band_keys(self, signature):
+        return [signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+                for band in range(self.bands)]
+
+    def signature(self, text: str):
+        """MinHash signature of a text, timed for the stats"""
+        start = time.perf_counter()
+        signature = minhash(text)
+        with self._lock:
+            self._signature_time += time.perf_counter() - start
+            self._signatures += 1
+        return signature
+
+    def lookup(self, signature):
+        """Return the most similar stored entry at or above min_similarity, or None"""
+        if signature is None:
+            return None
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(key, ()))
+
+            best, best_similarity = None, self.min_similarity
+            for entry_id in candidates:
+                similarity = float(np.mean(self._entries[entry_id]['signature'] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = entry_id, similarity
+
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best]
+
+    def add(self, signature, features, probabilities, model_version: int):
+        """Store the embedding (may be None) and base probabilities for a text's signature"""
+        if signature is None:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                'signature': signature,
+                'features': features,
+                'probabilities': np.asarray(probabilities, dtype=np.float64),
+                'model_version': model_version,
+            }
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(key, set()).add(entry_id)
+
+    def update(self, entry: dict, probabilities, model_version: int):
+        """Refresh a stored entry's probabilities after rescoring its embedding with a newer model"""
+        with self._lock:
+            entry['probabilities'] = np.asarray(probabilities, dtype=np.float64)
+            entry['model_version'] = model_version
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for band, key in enumerate(self._band_keys(entry['signature'])):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets = [{} for _ in range(self.bands)]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'min_similarity': self.min_similarity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'avg_signature_ms': (self._signature_time / self._signatures * 1000) if self._signatures else None,
+            }
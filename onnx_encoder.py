@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime backend for DistilBERT feature extraction.
+
+The locally cached distilbert-base-uncased is exported to ONNX once and
+stored under MODEL_DIR. Embeddings are then served by onnxruntime's CPU
+execution provider with all graph optimizations enabled, without keeping
+the PyTorch model in memory.
+
+Usage:
+    python onnx_encoder.py export   # (re-)export the ONNX model
+"""
+import os
+import sys
+import numpy as np
+
+OUTPUT_NAME = 'cls_embedding'
+
+
+def export_onnx(model, tokenizer, path: str, opset: int = 14):
+    """Export a DistilBERT model to ONNX, returning only the [CLS] embedding"""
+    import torch
+    from traced_encoder import ClsEncoder
+
+    sample = tokenizer(['export sample text', 'a longer export sample text for padding'],
+                       return_tensors='pt', padding=True)
+    encoder = ClsEncoder(model).eval()
+
+    # Write to a temporary file first so a crash never leaves a partial export
+    tmp_path = path + '.tmp'
+    with torch.no_grad():
+        torch.onnx.export(
+            encoder,
+            (sample['input_ids'], sample['attention_mask']),
+            tmp_path,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=[OUTPUT_NAME],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                OUTPUT_NAME: {0: 'batch'},
+            },
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    os.replace(tmp_path, path)
+
+
+class OnnxEncoder:
+    def __init__(self, model_path: str, num_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+
+    def encode(self, input_ids, attention_mask) -> np.ndarray:
+        """Return [CLS] embeddings for a tokenized, padded batch"""
+        feeds = {
+            'input_ids': np.asarray(input_ids, dtype=np.int64),
+            'attention_mask': np.asarray(attention_mask, dtype=np.int64),
+        }
+        return self.session.run([OUTPUT_NAME], feeds)[0]
+
+    def encode_texts(self, tokenizer, texts: list, max_length: int) -> np.ndarray:
+        """Tokenize texts and return their [CLS] embeddings"""
+        inputs = tokenizer(texts, return_tensors='np', truncation=True,
+                           max_length=max_length, padding=True)
+        return self.encode(inputs['input_ids'], inputs['attention_mask'])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'export':
+        print(__doc__)
+        sys.exit(1)
+
+    from transformers import AutoTokenizer, AutoModel
+    import config
+    from classifier import EmailClassifier
+
+    os.makedirs(config.MODEL_DIR, exist_ok=True)
+    print(f"Exporting {EmailClassifier.MODEL_NAME} to {config.ONNX_MODEL_PATH}...")
+    export_onnx(AutoModel.from_pretrained(EmailClassifier.MODEL_NAME).eval(),
+                AutoTokenizer.from_pretrained(EmailClassifier.MODEL_NAME),
+                config.ONNX_MODEL_PATH)
+    print("Export complete")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Feature projection report
+
+Measures what projecting training embeddings costs in accuracy and what it
+saves in fit time and feature memory. Embeddings of a training_data sample
+(read from the embedding cache, encoding any that are missing) are split into
+train and holdout sets. The logistic regression layer is fitted on the full
+float32 embeddings and on each projection stored as float16, and each fit is
+scored on the holdout.
+
+With --store, the saved feature store (FEATURE_PROJECTION training) is
+evaluated directly from its memory-mapped float16 array instead.
+
+Usage:
+    python projection_report.py --dims 64,128,256 --limit 2000
+    python projection_report.py --store
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+import config
+from encoder_report import load_training_sample
+from feature_store import PROJECTIONS, FeatureProjection, FeatureStore
+from training_worker import _fit
+
+
+def holdout_split(num_samples: int, holdout_fraction: float = 0.2, seed: int = 0):
+    """(train rows, holdout rows), each sorted"""
+    order = np.random.RandomState(seed).permutation(num_samples)
+    split = max(1, int(num_samples * holdout_fraction))
+    return np.sort(order[split:]), np.sort(order[:split])
+
+
+def fit_and_score(train_X, train_y, test_X, test_y) -> dict:
+    """Fit the classifier layer as training does and score it on the holdout"""
+    start = time.perf_counter()
+    model, iterations = _fit(train_X, train_y, lambda done, total: None)
+    fit_seconds = time.perf_counter() - start
+    return {
+        'accuracy': float(np.mean(model.predict(test_X) == test_y)),
+        'fit_seconds': fit_seconds,
+        'fit_iterations': iterations,
+    }
+
+
+def compare_projections(embeddings: np.ndarray, labels: list, kinds: list, dims: list,
+                        holdout_fraction: float = 0.2, seed: int = 0) -> dict:
+    """Holdout accuracy, fit time and feature bytes of each projection against full embeddings"""
+    labels = np.asarray(labels)
+    if len(labels) < 10 or len(set(labels)) < 2:
+        return {'error': 'Not enough labelled training data for an accuracy comparison'}
+
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    train, test = holdout_split(len(labels), holdout_fraction, seed)
+    full = fit_and_score(embeddings[train], labels[train], embeddings[test], labels[test])
+    full['feature_bytes'] = int(embeddings.nbytes)
+
+    projections = []
+    for kind in kinds:
+        for dim in dims:
+            projection = FeatureProjection.fit(kind, embeddings[train[:config.FEATURE_PROJECTION_FIT_SAMPLES]],
+                                               dim, seed)
+            projected = projection.transform(embeddings).astype(np.float16)
+            result = fit_and_score(projected[train], labels[train], projected[test], labels[test])
+            result.update({
+                'kind': kind,
+                'dim': projection.dim,
+                'feature_bytes': int(projected.nbytes),
+                'accuracy_change': result['accuracy'] - full['accuracy'],
+                'fit_speedup': full['fit_seconds'] / max(result['fit_seconds'], 1e-9),
+                'explained_variance': projection.metadata.get('explained_variance'),
+            })
+            projections.append(result)
+
+    return {
+        'num_emails': int(len(labels)),
+        'holdout_samples': int(len(test)),
+        'full': full,
+        'projections': projections,
+    }
+
+
+def evaluate_store(store: FeatureStore, holdout_fraction: float = 0.2, seed: int = 0) -> dict:
+    """Holdout accuracy of the classifier layer fitted on the saved float16 store"""
+    labels = np.asarray(store.labels)
+    if len(labels) < 10 or len(set(labels)) < 2:
+        return {'error': 'Not enough samples in the feature store for a holdout evaluation'}
+    train, test = holdout_split(len(labels), holdout_fraction, seed)
+    result = fit_and_score(store.features[train], labels[train], store.features[test], labels[test])
+    result.update({
+        'num_emails': int(len(labels)),
+        'holdout_samples': int(len(test)),
+        'projection': store.metadata['projection'],
+        'feature_bytes': int(store.features.nbytes),
+        'saved_at': store.metadata.get('saved_at'),
+    })
+    return result
+
+
+def print_report(report: dict):
+    if 'error' in report:
+        print(report['error'])
+        return
+    full = report['full']
+    print(f"\n=== Feature Projection Comparison ({report['num_emails']} emails, "
+          f"{report['holdout_samples']} holdout) ===")
+    print(f"{'features':<16} {'accuracy':>9} {'change':>8} {'fit':>8} {'speedup':>8} {'bytes':>12}")
+    print(f"{'768 x float32':<16} {full['accuracy']*100:>8.1f}% {'':>8} {full['fit_seconds']:>7.2f}s "
+          f"{'':>8} {full['feature_bytes']:>12,}")
+    for p in report['projections']:
+        name = f"{p['kind']} {p['dim']} x f16"
+        print(f"{name:<16} {p['accuracy']*100:>8.1f}% {p['accuracy_change']*100:>+7.1f}p {p['fit_seconds']:>7.2f}s "
+              f"{p['fit_speedup']:>7.1f}x {p['feature_bytes']:>12,}")
+
+
+def run_report(kinds: list, dims: list, limit: int = 2000) -> dict:
+    """Compare projections on stored training data and save the report"""
+    from classifier import EmailClassifier
+
+    texts, labels = load_training_sample(limit)
+    if not texts:
+        print("No training data available - run training first")
+        return None
+
+    classifier = EmailClassifier()
+    embeddings = classifier.get_training_features(texts)
+    report = compare_projections(embeddings, labels, kinds, dims)
+    print_report(report)
+
+    report_path = os.path.join(config.MODEL_DIR, 'projection_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to {report_path}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the accuracy impact of projecting training features')
+    parser.add_argument('--kinds', default=','.join(PROJECTIONS), help='Projections to compare')
+    parser.add_argument('--dims', default='64,128,256', help='Projected dimensions to compare')
+    parser.add_argument('--limit', type=int, default=2000, help='Number of training emails to compare on')
+    parser.add_argument('--store', action='store_true', help='Evaluate the saved feature store instead')
+    args = parser.parse_args()
+
+    if args.store:
+        result = evaluate_store(FeatureStore.load(os.path.join(config.MODEL_DIR, 'features.json')))
+        print(json.dumps(result, indent=2))
+    else:
+        config.init_db()
+        run_report(args.kinds.split(','), [int(dim) for dim in args.dims.split(',')], args.limit)
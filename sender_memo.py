@@ -0,0 +1,138 @@
+"""
+In-memory memo of recent classification outcomes per bulk sender.
+
+Entries are keyed by sender domain plus a normalized subject template (case
+folded, reply/forward prefixes removed, digit runs replaced), so "Your order
+#1234 has shipped" and "Your order #5678 has shipped" from the same retailer
+share one entry. An entry only answers once the same category has been seen
+min_observations times in a row at high confidence; it expires after a TTL,
+the least recently used entries are evicted when full, and a user correction
+for the sender drops all of that sender's entries.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+REPLY_PREFIX = re.compile(r'^\s*((re|fwd?|aw|wg)\s*(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+DIGITS = re.compile(r'\d+')
+WHITESPACE = re.compile(r'\s+')
+
+
+def subject_template(subject: str) -> str:
+    """Normalize a subject so messages from the same template map to the same key"""
+    template = REPLY_PREFIX.sub('', (subject or '').lower())
+    template = DIGITS.sub('#', template)
+    return WHITESPACE.sub(' ', template).strip()[:200]
+
+
+class SenderMemo:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 3600,
+                 min_confidence: float = 0.9, min_observations: int = 3):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.min_confidence = min_confidence
+        self.min_observations = max(1, min_observations)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> entry dict, least recently used first
+        self._keys_by_domain = {}       # sender domain -> set of keys
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(sender_domain: str, subject: str):
+        """Memo key for an email, or None when the sender is unknown"""
+        if not sender_domain:
+            return None
+        return sender_domain, subject_template(subject)
+
+    def _remove(self, key):
+        del self._entries[key]
+        keys = self._keys_by_domain.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_domain[key[0]]
+
+    def get(self, key):
+        """Return (category, probabilities) for a stable sender template, or None"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['created_at'] > self.ttl_seconds:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None or entry['observations'] < self.min_observations:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            entry['hits'] += 1
+            self.hits += 1
+            return entry['category'], entry['probabilities']
+
+    def observe(self, key, category: str, probabilities):
+        """Record a fresh classification outcome; low-confidence or disagreeing outcomes reset the entry"""
+        if key is None:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if max(probabilities) < self.min_confidence:
+                if entry is not None:
+                    self._remove(key)
+                return
+
+            if entry is None or entry['category'] != category:
+                if entry is None and len(self._entries) >= self.max_entries:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+                entry = {'category': category, 'observations': 0, 'hits': 0, 'created_at': time.time()}
+                self._entries[key] = entry
+                self._keys_by_domain.setdefault(key[0], set()).add(key)
+
+            entry['observations'] += 1
+            entry['probabilities'] = list(probabilities)
+            self._entries.move_to_end(key)
+
+    def invalidate_sender(self, sender_domain: str) -> int:
+        """Drop every entry for a sender (after a user correction); returns the number removed"""
+        with self._lock:
+            keys = list(self._keys_by_domain.get(sender_domain, ()))
+            for key in keys:
+                self._remove(key)
+            if keys:
+                self.invalidations += 1
+            return len(keys)
+
+    def clear(self):
+        """Drop all entries (the model they came from has been replaced)"""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_domain.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'stable_entries': sum(1 for e in self._entries.values()
+                                      if e['observations'] >= self.min_observations),
+                'senders': len(self._keys_by_domain),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,248 @@
+"""
+Data-driven sender rules applied to classification probabilities.
+
+A rule matches a sender domain by suffix (".gov") or by keyword anywhere in
+the domain ("county"), and moves a fraction of one category's probability to
+another. Rules come from a JSON file (SENDER_RULES_PATH), falling back to the
+built-in civic rule:
+
+    {"rules": [{"name": "civic",
+                "suffixes": [".gov", ".edu"],
+                "keywords": ["county", "municipal"],
+                "move": {"from": "shopping", "to": "personal", "fraction": 0.8},
+                "reason": "Sender domain '{domain}' is ... - shopping probability was reduced."}]}
+
+All suffixes are compiled into one reversed-character trie and all keywords
+into one Aho-Corasick automaton, so matching a domain costs one pass over its
+characters however many rules there are. Each rule fires at most once per
+email; adjustments are applied to a whole batch of rows at once, in rule
+order, and every firing is counted. A malformed rule is skipped, and a reason
+that cannot be formatted is replaced by a generic one, rather than failing
+startup; both are logged and listed under errors in get_stats().
+"""
+import json
+import os
+import threading
+from collections import deque
+import numpy as np
+
+DEFAULT_RULES = [
+    {
+        'name': 'civic',
+        'suffixes': ['.gov', '.edu', '.org'],
+        'keywords': ['government', 'county', 'city', 'state', 'municipal', 'district', 'commissioner'],
+        # Government and civic organization emails should be classified as personal, not shopping
+        'move': {'from': 'shopping', 'to': 'personal', 'fraction': 0.8},
+        'reason': "Sender domain '{domain}' is a civic/institutional domain - shopping probability was reduced.",
+    },
+]
+
+
+DEFAULT_REASON = "Sender rule '{name}' matched '{domain}'."
+
+
+def sender_domain_of(from_addr: str) -> str:
+    """Lowercased domain of an address, or '' when there is none"""
+    return from_addr.lower().split('@')[-1] if from_addr and '@' in from_addr else ''
+
+
+class _SuffixTrie:
+    """Character trie over reversed suffixes; one walk finds every suffix of a string"""
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, suffix: str, rule: int):
+        node = self._root
+        for char in reversed(suffix):
+            node = node.setdefault(char, {})
+        node.setdefault(None, set()).add(rule)
+
+    def match(self, text: str) -> set:
+        found = set()
+        node = self._root
+        for char in reversed(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found |= node[None]
+        return found
+
+
+class _KeywordAutomaton:
+    """Aho-Corasick automaton reporting every keyword that occurs in a string"""
+
+    def __init__(self, keywords: list):
+        # keywords: (keyword, rule) pairs
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [frozenset()]
+
+        outputs = [set()]
+        for keyword, rule in keywords:
+            state = 0
+            for char in keyword:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    outputs.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            outputs[state].add(rule)
+
+        # Breadth-first: each state's fail link points at its longest proper suffix in the trie
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                outputs[child] |= outputs[self._fail[child]]
+        self._out = [frozenset(out) for out in outputs]
+
+    def match(self, text: str) -> set:
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class SenderRules:
+    def __init__(self, rules: list, categories: list):
+        self.categories = list(categories)
+        self.rules = []
+        self._suffixes = _SuffixTrie()
+        keywords = []
+
+        self.errors = []                     # Why each malformed rule was skipped or altered
+        for position, rule in enumerate(rules):
+            try:
+                compiled = self._compile(rule, f'rule-{len(self.rules)}')
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                self._warn(f"Sender rule #{position} skipped: {e!r}")
+                continue
+            if compiled is None:
+                continue
+            index = len(self.rules)
+            self.rules.append(compiled)
+            for suffix in compiled['suffixes']:
+                self._suffixes.add(suffix, index)
+            keywords.extend((keyword, index) for keyword in compiled['keywords'] if keyword)
+        self._keywords = _KeywordAutomaton(keywords)
+
+        self._lock = threading.Lock()
+        self.hits = np.zeros(len(self.rules), dtype=np.int64)
+        self.emails_checked = 0
+
+    def _warn(self, error: str):
+        print(f"⚠️  {error}")
+        self.errors.append(error)
+
+    def _compile(self, rule: dict, default_name: str):
+        """A rule in matching form, or None for a rule naming categories this deployment does not have"""
+        move = rule.get('move', {})
+        if move.get('from') not in self.categories or move.get('to') not in self.categories:
+            # Rules for categories this deployment does not have are inert
+            return None
+        name = str(rule.get('name', default_name))
+        reason = rule.get('reason', DEFAULT_REASON)
+        try:
+            reason.format(domain='example.com', name=name)
+        except (AttributeError, IndexError, KeyError, ValueError) as e:
+            # A stray {} or unknown {field} would otherwise fail every explanation of this rule
+            self._warn(f"Sender rule '{name}' has an unusable reason ({e!r}); using the default")
+            reason = DEFAULT_REASON
+        fraction = float(move.get('fraction', 1.0))
+        if not 0 <= fraction <= 1:
+            # Moving more than all (or less than none) of the probability would make it negative
+            raise ValueError(f"fraction {fraction} is outside [0, 1]")
+        suffixes = rule.get('suffixes', [])
+        keywords = rule.get('keywords', [])
+        if isinstance(suffixes, str) or isinstance(keywords, str):
+            raise TypeError("suffixes and keywords must be lists")
+        return {
+            'name': name,
+            'from_idx': self.categories.index(move['from']),
+            'to_idx': self.categories.index(move['to']),
+            'fraction': fraction,
+            'reason': reason,
+            'suffixes': [s.lower() for s in suffixes],
+            'keywords': [k.lower() for k in keywords],
+        }
+
+    @classmethod
+    def load(cls, path: str, categories: list):
+        """
+        Rules from a JSON file, or the built-in rules when the file does not
+        exist or cannot be read. Malformed rules are skipped and listed in errors.
+        """
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                rules = data['rules'] if isinstance(data, dict) else data
+                if not isinstance(rules, list):
+                    raise TypeError("expected a list of rules")
+            except (OSError, KeyError, TypeError, ValueError) as e:
+                error = f"Unreadable sender rules file {path} ({e!r}); using the built-in rules"
+                print(f"⚠️  {error}")
+                engine = cls(DEFAULT_RULES, categories)
+                engine.errors.insert(0, error)
+                return engine
+            print(f"✓ Loaded {len(rules)} sender rules from {path}")
+            return cls(rules, categories)
+        return cls(DEFAULT_RULES, categories)
+
+    def match(self, sender_domain: str) -> list:
+        """Indices of the rules a sender domain matches, in rule order"""
+        if not sender_domain:
+            return []
+        return sorted(self._suffixes.match(sender_domain) | self._keywords.match(sender_domain))
+
+    def apply_batch(self, sender_domains: list, probabilities) -> np.ndarray:
+        """Apply matching rules to a (num_emails, num_categories) probability matrix and count the hits"""
+        adjusted = np.array(probabilities, dtype=np.float64)
+        fired = np.zeros((len(sender_domains), len(self.rules)), dtype=bool)
+        for row, domain in enumerate(sender_domains):
+            fired[row, self.match(domain)] = True
+
+        counts = fired.sum(axis=0)
+        with self._lock:
+            self.hits += counts
+            self.emails_checked += len(sender_domains)
+
+        for index in np.flatnonzero(counts):
+            rule = self.rules[index]
+            rows = fired[:, index]
+            moved = adjusted[rows, rule['from_idx']] * rule['fraction']
+            adjusted[rows, rule['from_idx']] -= moved
+            adjusted[rows, rule['to_idx']] += moved
+            adjusted[rows] /= adjusted[rows].sum(axis=1, keepdims=True)
+        return adjusted
+
+    def explain(self, sender_domain: str) -> list:
+        """Explanation sentences for the rules a sender domain matches (not counted as hits)"""
+        return [self.rules[i]['reason'].format(domain=sender_domain, name=self.rules[i]['name'])
+                for i in self.match((sender_domain or '').lower())]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'emails_checked': self.emails_checked,
+                'errors': list(self.errors),
+                'rules': [{'name': rule['name'],
+                           'suffixes': len(rule['suffixes']),
+                           'keywords': len(rule['keywords']),
+                           'hits': int(hits)}
+                          for rule, hits in zip(self.rules, self.hits)],
+            }
@@ -1,7 +1,7 @@
 import asyncio
+import time
 from aiosmtpd.controller import Controller
 from aiosmtpd.smtp import SMTP as SMTPProtocol
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email import message_from_string
@@ -9,6 +9,9 @@ from email.generator import Generator
 from io import StringIO
 import config
 from classifier import EmailClassifier
+from delivery_pool import SMTPConnectionPool
+from delivery_spool import DeliverySpool
+from executors import EventLoopLagMonitor, StageExecutor
 
 
 def create_footer_text(classification_id, category, confidence):
@@ -141,66 +144,93 @@ def message_to_string(msg):
     return fp.getvalue()
 
 class ClassifierHandler:
-    def __init__(self, classifier: EmailClassifier):
+    def __init__(self, classifier: EmailClassifier, classify_executor: StageExecutor = None,
+                 io_executor: StageExecutor = None, delivery_pool: SMTPConnectionPool = None,
+                 spool: DeliverySpool = None):
         self.classifier = classifier
-    
-    async def handle_DATA(self, server, session, envelope):
-        """Handle incoming email for classification"""
-        print(f"\nReceived email from {envelope.mail_from} to {envelope.rcpt_tos}")
-
-        # Get raw email content
-        raw_email = envelope.content.decode('utf-8', errors='ignore')
-
-        # Determine user email from recipient
-        user_email = envelope.rcpt_tos[0] if envelope.rcpt_tos else None
-
-        # First, parse the email to extract message_id for deduplication check
-        text, subject, from_addr, message_id, msg = self.classifier.parse_email(raw_email)
-
-        # Check if this message has already been classified
+        # Blocking stages run off the event loop so one slow email never stalls other sessions
+        if classify_executor is None:
+            workers = config.SMTP_CLASSIFY_WORKERS or (config.INFERENCE_MAX_BATCH_SIZE *
+                                                       max(1, config.INFERENCE_WORKERS))
+            classify_executor = StageExecutor('classify', workers)
+        self.classify_executor = classify_executor
+        self.io_executor = io_executor or StageExecutor('io', config.SMTP_IO_WORKERS)
+        self.delivery_pool = delivery_pool or SMTPConnectionPool(
+            config.DELIVERY_HOST, config.DELIVERY_PORT, config.DELIVERY_USE_TLS,
+            config.DELIVERY_USER, config.DELIVERY_PASSWORD,
+            max_connections=config.DELIVERY_POOL_SIZE, max_idle_seconds=config.DELIVERY_POOL_IDLE_SECONDS,
+            retries=config.DELIVERY_RETRIES, timeout=config.DELIVERY_TIMEOUT)
+        self.spool = spool  # When set, mail is spooled and acknowledged before delivery
+
+    async def classify_admitted(self, raw_email, user_email):
+        """
+        Classify on the classify executor, where concurrent sessions can be batched
+        together by the classifier's inference engine. Returns None when the
+        classification overran ADMISSION_MAX_WAIT_MS (it finishes in the
+        background, holding its slot) or failed; the overload policy then applies.
+        """
+        admission = self.classifier.admission
+        submitted = time.perf_counter()
+
+        def run():
+            admission.record_wait(time.perf_counter() - submitted)
+            return self.classifier.classify(raw_email, user_email)
+
+        def finished(future):
+            admission.release()
+            if not future.cancelled():
+                future.exception()  # Retrieved here so an abandoned failure is not reported twice
+
+        future = self.classify_executor.submit(run)
+        future.add_done_callback(finished)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), admission.max_wait)
+        except Exception as e:
+            if future.done():
+                # The classification itself failed (e.g. INFERENCE_TIMEOUT_SECONDS expired)
+                print(f"  ✗ Classification failed: {e}")
+                admission.record_error()
+            else:
+                admission.record_timeout()
+            return None
+
+    def find_existing(self, message_id, user_email):
+        """Earlier classification of this message for this user and its ID (blocking: SQLite)"""
         existing = config.get_existing_classification(message_id, user_email)
-
-        if existing:
-            # Use existing classification to avoid duplicate processing
-            category = existing['category']
-            confidence = existing['confidence']
-            proc_time = existing['processing_time']
-            print(f"  ✓ Using existing classification (deduplication)")
-            print(f"  Classification: {category} (confidence: {confidence:.2f}, cached)")
-            print(f"  Subject: {subject}")
-
-            # For existing classifications, get the classification ID from the database
-            classification_id = None
-            conn = config.get_db()
-            c = conn.cursor()
-            c.execute('''SELECT id FROM classifications
-                        WHERE message_id = ? AND user_email = ?
-                        ORDER BY timestamp DESC LIMIT 1''',
-                      (message_id, user_email))
-            row = c.fetchone()
-            if row:
-                classification_id = row[0]
-            conn.close()
-        else:
-            # Classify the email
-            category, confidence, proc_time, message_id, subject, probabilities, sender_domain = self.classifier.classify(
-                raw_email, user_email
-            )
-
-            print(f"  Classification: {category} (confidence: {confidence:.2f}, time: {proc_time:.3f}s)")
-            print(f"  Subject: {subject}")
-
-            # Log classification (only for new classifications) with full probability breakdown
-            classification_id = config.log_classification(
-                message_id, user_email or 'unknown', subject,
-                category, confidence, proc_time,
-                probabilities, sender_domain
-            )
-
-            # Add to training data so reclassifications can be detected
-            config.add_to_training_data(
-                message_id, user_email or 'unknown', subject, text, category
-            )
+        if not existing:
+            return None, None
+
+        classification_id = None
+        conn = config.get_db()
+        c = conn.cursor()
+        c.execute('''SELECT id FROM classifications
+                    WHERE message_id = ? AND user_email = ?
+                    ORDER BY timestamp DESC LIMIT 1''',
+                  (message_id, user_email))
+        row = c.fetchone()
+        if row:
+            classification_id = row[0]
+        conn.close()
+        return existing, classification_id
+
+    def record_classification(self, result, user_email, text):
+        """Log a new classification and its training text; returns the classification ID (blocking: SQLite)"""
+        category, confidence, proc_time, message_id, subject, probabilities, sender_domain, details = result
+        classification_id = config.log_classification(
+            message_id, user_email or 'unknown', subject,
+            category, confidence, proc_time,
+            probabilities, sender_domain, details['stage'], details['exit_layer']
+        )
+
+        # Add to training data so reclassifications can be detected
+        config.add_to_training_data(
+            message_id, user_email or 'unknown', subject, text, category
+        )
+        return classification_id
+
+    def deliver(self, envelope, category, confidence, proc_time, classification_id) -> str:
+        """Add classification headers and footer and spool the email or hand it to the mail server (blocking)"""
+        raw_email = envelope.content.decode('utf-8', errors='ignore')
 
         # Add classification headers to email
         lines = raw_email.split('\n')
@@ -212,8 +242,9 @@ class ClassifierHandler:
 
         # Insert classification headers
         lines.insert(header_end, f'X-Email-Category: {category}')
-        lines.insert(header_end + 1, f'X-Classification-Confidence: {confidence:.3f}')
-        lines.insert(header_end + 2, f'X-Classifier-Time: {proc_time:.3f}')
+        if confidence is not None:
+            lines.insert(header_end + 1, f'X-Classification-Confidence: {confidence:.3f}')
+            lines.insert(header_end + 2, f'X-Classifier-Time: {proc_time:.3f}')
 
         modified_email = '\n'.join(lines)
 
@@ -231,50 +262,143 @@ class ClassifierHandler:
                 print(f"  ✓ Added classifier footer with link to classification #{classification_id}")
             except Exception as e:
                 print(f"  Warning: Could not add footer to email: {e}")
-        
-        # Deliver via SMTP to mail server
+
+        # Spool for background delivery, or deliver via SMTP to mail server over a pooled connection
         try:
-            smtp = smtplib.SMTP(config.DELIVERY_HOST, config.DELIVERY_PORT)
-            
-            # Use STARTTLS if configured
-            if config.DELIVERY_USE_TLS:
-                smtp.starttls()
-            
-            # Authenticate if credentials provided
-            if config.DELIVERY_USER and config.DELIVERY_PASSWORD:
-                smtp.login(config.DELIVERY_USER, config.DELIVERY_PASSWORD)
-            
-            # Send the classified email
-            smtp.sendmail(
-                envelope.mail_from,
-                envelope.rcpt_tos,
-                modified_email.encode('utf-8')
-            )
-            smtp.quit()
-            
+            if self.spool is not None:
+                spool_id = self.spool.enqueue(envelope.mail_from, envelope.rcpt_tos, modified_email.encode('utf-8'))
+                print(f"  ✓ Spooled as {spool_id} for delivery to {config.DELIVERY_HOST}:{config.DELIVERY_PORT}")
+                return '250 Message accepted for delivery'
+
+            self.delivery_pool.send(envelope.mail_from, envelope.rcpt_tos, modified_email.encode('utf-8'))
             print(f"  ✓ Delivered to {config.DELIVERY_HOST}:{config.DELIVERY_PORT}")
             return '250 Message accepted for delivery'
-            
+
         except Exception as e:
             print(f"  ✗ Delivery error: {e}")
             return f'451 Temporary failure: {str(e)}'
 
+    async def handle_DATA(self, server, session, envelope):
+        """Handle incoming email for classification"""
+        print(f"\nReceived email from {envelope.mail_from} to {envelope.rcpt_tos}")
+        start_time = time.perf_counter()
+        timings = None  # Per-stage seconds, recorded for new classifications only
+        io = self.io_executor
+
+        # Determine user email from recipient
+        user_email = envelope.rcpt_tos[0] if envelope.rcpt_tos else None
+
+        # First, parse the email to extract message_id for deduplication check
+        # (bounded parse of the raw bytes: headers plus the text snippet only)
+        text, subject, from_addr, message_id, msg = await io.run(self.classifier.parse_email, envelope.content)
+
+        # Check if this message has already been classified
+        existing, classification_id = await io.run(self.find_existing, message_id, user_email)
+
+        if existing:
+            # Use existing classification to avoid duplicate processing
+            category = existing['category']
+            confidence = existing['confidence']
+            proc_time = existing['processing_time']
+            print(f"  ✓ Using existing classification (deduplication)")
+            print(f"  Classification: {category} (confidence: {confidence:.2f}, cached)")
+            print(f"  Subject: {subject}")
+        else:
+            # Bounded queue: beyond it (or past its wait limit) the overload policy applies
+            admission = self.classifier.admission
+            result = None
+            if admission.try_admit():
+                result = await self.classify_admitted(envelope.content, user_email)
+            if result is None:
+                admission.record_outcome()
+                if admission.policy == 'defer':
+                    print("  ⏸️  Classifier overloaded - deferring with 451")
+                    return '451 4.3.2 Classifier overloaded, try again later'
+                if admission.policy == 'degrade':
+                    print("  ⚠️  Classifier overloaded - classifying from subject and sender only")
+                    result = await io.run(self.classifier.classify_degraded, envelope.content, user_email)
+
+            if result is None:
+                # Passthrough: deliver unclassified, nothing is logged
+                print("  ⚠️  Classifier overloaded - delivering unclassified")
+                category, confidence, proc_time, classification_id = 'unclassified', None, None, None
+            else:
+                category, confidence, proc_time, message_id, subject, probabilities, sender_domain, details = result
+
+                print(f"  Classification: {category} (confidence: {confidence:.2f}, time: {proc_time:.3f}s, stage: {details['stage']})")
+                print(f"  Subject: {subject}")
+                timings = dict(details['timings'])
+
+                # Log classification (only for new classifications) with full probability breakdown
+                db_start = time.perf_counter()
+                classification_id = await io.run(self.record_classification, result, user_email, text)
+                timings['db'] = time.perf_counter() - db_start
+
+        deliver_start = time.perf_counter()
+        response = await io.run(self.deliver, envelope, category, confidence, proc_time, classification_id)
+
+        if timings is not None and config.STAGE_TIMINGS_ENABLED:
+            timings['deliver'] = time.perf_counter() - deliver_start
+            timings['total'] = time.perf_counter() - start_time
+            try:
+                await io.run(config.log_stage_timings, classification_id, details['stage'], details['model_id'],
+                             timings)
+            except Exception as e:
+                print(f"  Warning: Could not record stage timings: {e}")
+        return response
+
+    def get_stats(self) -> dict:
+        return {'classify': self.classify_executor.get_stats(), 'io': self.io_executor.get_stats()}
+
 class ClassifierSMTP:
     def __init__(self, classifier: EmailClassifier, host='0.0.0.0', port=2525):
         self.classifier = classifier
         self.host = host
         self.port = port
         self.controller = None
+        self.handler = None
+        self.loop_monitor = EventLoopLagMonitor(config.EVENT_LOOP_LAG_INTERVAL_MS)
     
     def start(self):
-        """Start the SMTP server"""
-        handler = ClassifierHandler(self.classifier)
-        self.controller = Controller(handler, hostname=self.host, port=self.port)
+        """Start the SMTP server (after warming up the encoder, so the first email is not slow)"""
+        if config.ENCODER_WARMUP_ENABLED:
+            try:
+                self.classifier.warmup()
+            except Exception as e:
+                print(f"⚠️  Encoder warmup failed: {e}")
+        self.handler = ClassifierHandler(self.classifier)
+        if config.DELIVERY_SPOOL_ENABLED:
+            # Mail spooled before a restart is picked up again before new mail is accepted
+            self.handler.spool = DeliverySpool(
+                config.DELIVERY_SPOOL_DIR, self.handler.delivery_pool, config.DELIVERY_SPOOL_WORKERS,
+                config.DELIVERY_RETRY_BASE_SECONDS, config.DELIVERY_RETRY_MAX_SECONDS,
+                config.DELIVERY_MAX_AGE_HOURS)
+            self.handler.spool.start()
+        self.controller = Controller(self.handler, hostname=self.host, port=self.port)
         self.controller.start()
+        self.loop_monitor.start(self.controller.loop)
+        self.classifier.readiness['ready'] = True
         print(f"SMTP classifier listening on {self.host}:{self.port}")
         print(f"Delivering to {config.DELIVERY_HOST}:{config.DELIVERY_PORT}")
+
+    def get_stats(self) -> dict:
+        """Event-loop lag, executor load, delivery pool usage and spool depth of the running server"""
+        return {
+            'event_loop': self.loop_monitor.get_stats(),
+            'executors': self.handler.get_stats() if self.handler is not None else None,
+            'delivery': self.handler.delivery_pool.get_stats() if self.handler is not None else None,
+            'spool': (self.handler.spool.get_stats()
+                      if self.handler is not None and self.handler.spool is not None else None),
+        }
     
     def stop(self):
         """Stop the SMTP server"""
+        self.loop_monitor.stop()
         if self.controller:
             self.controller.stop()
+        if self.handler is not None:
+            self.handler.classify_executor.shutdown()
+            self.handler.io_executor.shutdown()
+            if self.handler.spool is not None:
+                self.handler.spool.stop()
+            self.handler.delivery_pool.close()
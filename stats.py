@@ -0,0 +1,10 @@
+"""
+Small statistics helpers shared by the runtime stats classes.
+"""
+
+
+def percentile(values: list, p: float, scale: float = 1):
+    """p-th percentile (nearest rank) of sorted values, times scale; None when empty"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))] * scale
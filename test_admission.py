@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Unit test for SMTP admission control
+"""
+import asyncio
+import time
+from admission import AdmissionController
+from smtp_server import ClassifierHandler
+
+
+class SlowClassifier:
+    """Stands in for EmailClassifier: classify() takes a fixed time"""
+
+    def __init__(self, admission, seconds):
+        self.admission = admission
+        self.seconds = seconds
+
+    def classify(self, raw_email, user_email=None):
+        time.sleep(self.seconds)
+        return ('personal', 0.9, self.seconds, '<id>', 'subject', {}, 'example.com', {'stage': 'bert'})
+
+
+def test_queue_bound_and_stats():
+    """Arrivals beyond max_queue are refused until a slot is released"""
+    admission = AdmissionController(max_queue=2, policy='defer')
+    assert admission.try_admit() and admission.try_admit()
+    assert not admission.try_admit()
+    admission.record_outcome()
+    admission.release()
+    assert admission.try_admit()
+
+    stats = admission.get_stats()
+    assert stats['depth'] == 2 and stats['peak_depth'] == 2 and stats['admitted'] == 3
+    assert stats['overloaded']['queue_full'] == 1 and stats['outcomes']['defer'] == 1
+    assert stats['p95_depth'] == 2 and stats['last_overload'] is not None
+    print("✓ PASS: bounded queue")
+
+    assert AdmissionController(policy='bogus').policy == 'degrade'
+    assert AdmissionController(max_queue=0).try_admit(), "0 means unbounded"
+    print("✓ PASS: policy and unbounded defaults")
+
+
+def test_wait_limit_abandons_slow_classification():
+    """A classification past max_wait_ms returns None but keeps its slot until it finishes"""
+    admission = AdmissionController(max_queue=4, policy='passthrough', max_wait_ms=50)
+    handler = ClassifierHandler(SlowClassifier(admission, 0.3))
+
+    async def run():
+        assert admission.try_admit()
+        start = time.perf_counter()
+        result = await handler.classify_admitted(b'raw', 'user@example.com')
+        elapsed = time.perf_counter() - start
+        depth_after_timeout = admission.depth
+        await asyncio.sleep(0.4)
+        return result, elapsed, depth_after_timeout
+
+    result, elapsed, depth_after_timeout = asyncio.run(run())
+    print(f"Returned after {elapsed*1000:.0f}ms")
+    assert result is None and elapsed < 0.25
+    assert depth_after_timeout == 1 and admission.depth == 0
+    assert admission.get_stats()['overloaded']['timeout'] == 1
+    print("✓ PASS: wait limit")
+
+    # Fast enough: the result comes back and the slot is freed
+    handler = ClassifierHandler(SlowClassifier(admission, 0.0))
+
+    async def run_fast():
+        assert admission.try_admit()
+        return await handler.classify_admitted(b'raw', None)
+
+    assert asyncio.run(run_fast())[0] == 'personal' and admission.depth == 0
+    print("✓ PASS: admitted classification")
+
+
+class FailingClassifier(SlowClassifier):
+    """classify() fails the way it does when an inference worker never answers"""
+
+    def classify(self, raw_email, user_email=None):
+        raise TimeoutError("Inference worker did not answer within 30s")
+
+
+def test_failed_classification_gets_overload_policy():
+    """A classification that raises returns None (overload policy) and frees its slot"""
+    admission = AdmissionController(max_queue=4, policy='degrade')
+    handler = ClassifierHandler(FailingClassifier(admission, 0))
+
+    async def run():
+        assert admission.try_admit()
+        result = await handler.classify_admitted(b'raw', None)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) is None
+    stats = admission.get_stats()
+    assert stats['overloaded'] == {'queue_full': 0, 'timeout': 0, 'error': 1}
+    assert admission.depth == 0
+    print("✓ PASS: failed classification")
+
+
+if __name__ == '__main__':
+    test_queue_bound_and_stats()
+    test_wait_limit_abandons_slow_classification()
+    test_failed_classification_gets_overload_policy()
+    print("\nTest complete!")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Unit test for the pooled SMTP delivery connections
+"""
+import asyncio
+import smtplib
+import threading
+import pytest
+from aiosmtpd.controller import Controller
+from delivery_pool import DeliveryError, SMTPConnectionPool
+
+MESSAGE = b"From: a@example.com\r\nTo: b@example.com\r\nSubject: hi\r\n\r\nhello\r\n"
+
+
+class RecordingHandler:
+    """Accepts mail, remembering which connection (peer) delivered it"""
+
+    def __init__(self, replies=None, delay=0):
+        self.peers = []
+        self.replies = list(replies or [])   # Replies for the first messages, then 250
+        self.delay = delay
+        self.active = 0
+        self.peak_active = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        self.peers.append(session.peer)
+        return self.replies.pop(0) if self.replies else '250 OK'
+
+
+def start_server(handler, port):
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    return controller
+
+
+def test_connections_are_reused():
+    """Sequential messages share one connection"""
+    handler = RecordingHandler()
+    controller = start_server(handler, 2541)
+    pool = SMTPConnectionPool('127.0.0.1', 2541, max_connections=2)
+    try:
+        for _ in range(5):
+            pool.send('a@example.com', ['b@example.com'], MESSAGE)
+        stats = pool.get_stats()
+        print(f"Stats: {stats}")
+        assert len(handler.peers) == 5
+        assert len(set(handler.peers)) == 1
+        assert stats['connections_opened'] == 1
+        assert stats['connections_reused'] == 4
+        assert stats['hit_rate'] == pytest.approx(0.8)
+        assert stats['p50_latency_ms'] is not None
+        print("✓ PASS: one connection for five messages")
+    finally:
+        pool.close()
+        controller.stop()
+
+
+def test_failed_noop_opens_fresh_connection():
+    """A pooled connection that no longer answers NOOP is replaced"""
+    handler = RecordingHandler()
+    controller = start_server(handler, 2542)
+    pool = SMTPConnectionPool('127.0.0.1', 2542)
+    try:
+        pool.send('a@example.com', ['b@example.com'], MESSAGE)
+        pool._idle[0][0].close()   # Dropped underneath the pool
+        pool.send('a@example.com', ['b@example.com'], MESSAGE)
+        stats = pool.get_stats()
+        assert stats['noop_failures'] == 1
+        assert stats['connections_opened'] == 2
+        assert stats['delivered'] == 2
+        assert len(set(handler.peers)) == 2
+        print("✓ PASS: dead connection replaced")
+    finally:
+        pool.close()
+        controller.stop()
+
+
+def test_transient_failure_retried():
+    """4xx is retried on a fresh connection; 5xx is not"""
+    handler = RecordingHandler(replies=['451 4.3.0 Try again later'])
+    controller = start_server(handler, 2543)
+    pool = SMTPConnectionPool('127.0.0.1', 2543, retries=1)
+    try:
+        pool.send('a@example.com', ['b@example.com'], MESSAGE)
+        stats = pool.get_stats()
+        assert stats['retried'] == 1
+        assert stats['delivered'] == 1
+        assert len(set(handler.peers)) == 2
+        print("✓ PASS: 451 retried on a new connection")
+
+        handler.replies = ['554 5.7.1 Rejected']
+        with pytest.raises(smtplib.SMTPDataError):
+            pool.send('a@example.com', ['b@example.com'], MESSAGE)
+        stats = pool.get_stats()
+        assert stats['retried'] == 1
+        assert stats['failed'] == 1
+        print("✓ PASS: 554 not retried")
+    finally:
+        pool.close()
+        controller.stop()
+
+
+def test_concurrent_connections_bounded():
+    """Concurrent senders never open more than max_connections"""
+    handler = RecordingHandler(delay=0.05)
+    controller = start_server(handler, 2544)
+    pool = SMTPConnectionPool('127.0.0.1', 2544, max_connections=2)
+    try:
+        threads = [threading.Thread(target=pool.send, args=('a@example.com', ['b@example.com'], MESSAGE))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = pool.get_stats()
+        print(f"Peak concurrent sessions: {handler.peak_active}, opened: {stats['connections_opened']}")
+        assert stats['delivered'] == 8
+        assert handler.peak_active <= 2
+        assert stats['connections_opened'] <= 2
+        print("✓ PASS: connections bounded")
+    finally:
+        pool.close()
+        controller.stop()
+
+
+def test_idle_connections_reaped():
+    """Connections idle past max_idle_seconds are closed"""
+    handler = RecordingHandler()
+    controller = start_server(handler, 2545)
+    pool = SMTPConnectionPool('127.0.0.1', 2545, max_idle_seconds=0.05)
+    try:
+        pool.send('a@example.com', ['b@example.com'], MESSAGE)
+        assert pool.get_stats()['idle_connections'] == 1
+        threading.Event().wait(0.1)
+        assert pool.reap() == 1
+        stats = pool.get_stats()
+        assert stats['idle_connections'] == 0
+        assert stats['reaped'] == 1
+        print("✓ PASS: idle connection reaped")
+    finally:
+        pool.close()
+        controller.stop()
+
+
+def test_unreachable_host_fails():
+    """Connection refused surfaces after the retries"""
+    pool = SMTPConnectionPool('127.0.0.1', 2549, retries=1, timeout=2)
+    with pytest.raises((OSError, DeliveryError)):
+        pool.send('a@example.com', ['b@example.com'], MESSAGE)
+    stats = pool.get_stats()
+    assert stats['retried'] == 1
+    assert stats['failed'] == 1
+    print("✓ PASS: unreachable host reported")
+    pool.close()
+
+
+if __name__ == '__main__':
+    test_connections_are_reused()
+    test_failed_noop_opens_fresh_connection()
+    test_transient_failure_retried()
+    test_concurrent_connections_bounded()
+    test_idle_connections_reaped()
+    test_unreachable_host_fails()
+    print("\nTest complete!")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Unit test for the durable delivery spool
+"""
+import json
+import os
+import smtplib
+import tempfile
+import threading
+import time
+from delivery_spool import DeliverySpool
+
+MESSAGE = b"From: a@example.com\r\nTo: b@example.com\r\nSubject: hi\r\n\r\nhello\r\n"
+
+
+class FakePool:
+    """Stands in for SMTPConnectionPool: raises the queued errors, then accepts, refusing the queued recipients"""
+
+    def __init__(self, errors=None, refusals=None):
+        self.errors = list(errors or [])
+        self.refusals = list(refusals or [])
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, mail_from, rcpt_tos, data):
+        with self.lock:
+            if self.errors:
+                raise self.errors.pop(0)
+            self.sent.append((mail_from, rcpt_tos, data))
+            return self.refusals.pop(0) if self.refusals else {}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def spool_files(spool_dir):
+    return sorted(name for name in os.listdir(spool_dir) if name != 'failed')
+
+
+def test_spooled_message_delivered():
+    """A spooled message is on disk until the workers deliver it"""
+    with tempfile.TemporaryDirectory() as spool_dir:
+        pool = FakePool()
+        spool = DeliverySpool(spool_dir, pool, workers=1)
+        message_id = spool.enqueue('a@example.com', ['b@example.com'], MESSAGE)
+        assert spool_files(spool_dir) == [f"{message_id}.eml", f"{message_id}.json"]
+        print("✓ PASS: message and envelope written before delivery")
+
+        spool.start()
+        try:
+            assert wait_for(lambda: spool.get_stats()['delivered'] == 1)
+            assert pool.sent == [('a@example.com', ['b@example.com'], MESSAGE)]
+            assert spool_files(spool_dir) == []
+            stats = spool.get_stats()
+            assert stats['depth'] == 0
+            assert stats['p50_write_ms'] is not None
+            print("✓ PASS: delivered and removed from the spool")
+        finally:
+            spool.stop()
+
+
+def test_transient_failure_backs_off():
+    """A 4xx reply or dropped connection is retried with exponential backoff"""
+    with tempfile.TemporaryDirectory() as spool_dir:
+        pool = FakePool([smtplib.SMTPServerDisconnected('gone'),
+                         smtplib.SMTPDataError(451, b'Try again later')])
+        spool = DeliverySpool(spool_dir, pool, workers=1, retry_base_seconds=0.05, retry_max_seconds=1)
+        assert [spool.backoff(n) for n in (1, 2, 3, 6)] == [0.05, 0.1, 0.2, 1]
+        spool.start()
+        try:
+            start = time.time()
+            spool.enqueue('a@example.com', ['b@example.com'], MESSAGE)
+            assert wait_for(lambda: spool.get_stats()['delivered'] == 1)
+            elapsed = time.time() - start
+            stats = spool.get_stats()
+            print(f"Delivered after {elapsed*1000:.0f}ms, {stats['deferred']} deferrals")
+            assert stats['deferred'] == 2
+            assert elapsed >= 0.15
+            assert spool_files(spool_dir) == []
+            print("✓ PASS: retried after 50ms and 100ms")
+        finally:
+            spool.stop()
+
+
+def test_rejected_message_moved_to_failed():
+    """A 5xx reply to the message is final"""
+    with tempfile.TemporaryDirectory() as spool_dir:
+        pool = FakePool([smtplib.SMTPDataError(554, b'Rejected')])
+        spool = DeliverySpool(spool_dir, pool, workers=1)
+        spool.start()
+        try:
+            message_id = spool.enqueue('a@example.com', ['b@example.com'], MESSAGE)
+            assert wait_for(lambda: spool.get_stats()['failed'] == 1)
+            assert spool_files(spool_dir) == []
+            failed = sorted(os.listdir(os.path.join(spool_dir, 'failed')))
+            assert failed == [f"{message_id}.eml", f"{message_id}.json"]
+            assert '554' in spool.get_stats()['last_error']
+            print("✓ PASS: rejected message kept in failed/")
+        finally:
+            spool.stop()
+
+
+def test_missing_message_file_moved_to_failed():
+    """A spool entry whose .eml has gone is dead-lettered, not retried forever"""
+    with tempfile.TemporaryDirectory() as spool_dir:
+        pool = FakePool()
+        spool = DeliverySpool(spool_dir, pool, workers=1)
+        message_id = spool.enqueue('a@example.com', ['b@example.com'], MESSAGE)
+        os.remove(os.path.join(spool_dir, f"{message_id}.eml"))
+        spool.start()
+        try:
+            assert wait_for(lambda: spool.get_stats()['failed'] == 1)
+            assert pool.sent == []
+            assert spool_files(spool_dir) == []
+            assert os.listdir(os.path.join(spool_dir, 'failed')) == [f"{message_id}.json"]
+            assert spool.get_stats()['depth'] == 0
+            print("✓ PASS: entry without a message file moved to failed/")
+        finally:
+            spool.stop()
+
+
+def test_refused_recipients_requeued_or_failed():
+    """Recipients refused while others accepted: 4xx ones are retried alone, 5xx ones dead-lettered"""
+    with tempfile.TemporaryDirectory() as spool_dir:
+        pool = FakePool(refusals=[{'busy@example.com': (450, b'Mailbox busy'),
+                                   'gone@example.com': (550, b'No such user')}])
+        spool = DeliverySpool(spool_dir, pool, workers=1, retry_base_seconds=0.05)
+        spool.start()
+        try:
+            message_id = spool.enqueue('a@example.com', ['b@example.com', 'busy@example.com',
+                                                         'gone@example.com'], MESSAGE)
+            assert wait_for(lambda: spool.get_stats()['delivered'] == 1)
+            assert [rcpt for _, rcpt, _ in pool.sent] == [
+                ['b@example.com', 'busy@example.com', 'gone@example.com'], ['busy@example.com']]
+            assert spool_files(spool_dir) == []
+
+            stats = spool.get_stats()
+            assert stats['deferred'] == 1
+            assert stats['refused_recipients'] == 1
+            assert stats['failed'] == 0
+            failed = sorted(os.listdir(os.path.join(spool_dir, 'failed')))
+            assert failed == [f"{message_id}-refused-1.eml", f"{message_id}-refused-1.json"]
+            with open(os.path.join(spool_dir, 'failed', failed[1])) as f:
+                assert json.load(f)['rcpt_tos'] == ['gone@example.com']
+            print("✓ PASS: 450 recipient retried, 550 recipient kept in failed/")
+        finally:
+            spool.stop()
+
+
+def test_all_recipients_refused_with_mixed_codes():
+    """When every recipient is refused, 4xx ones are still retried and only 5xx ones dead-lettered"""
+    with tempfile.TemporaryDirectory() as spool_dir:
+        refused = {'busy@example.com': (450, b'Mailbox busy'), 'gone@example.com': (550, b'No such user')}
+        pool = FakePool([smtplib.SMTPRecipientsRefused(refused)])
+        spool = DeliverySpool(spool_dir, pool, workers=1, retry_base_seconds=0.05)
+        spool.start()
+        try:
+            message_id = spool.enqueue('a@example.com', ['busy@example.com', 'gone@example.com'], MESSAGE)
+            assert wait_for(lambda: spool.get_stats()['delivered'] == 1)
+            assert [rcpt for _, rcpt, _ in pool.sent] == [['busy@example.com']]
+            assert spool_files(spool_dir) == []
+
+            stats = spool.get_stats()
+            assert stats['deferred'] == 1 and stats['refused_recipients'] == 1 and stats['failed'] == 0
+            failed = sorted(os.listdir(os.path.join(spool_dir, 'failed')))
+            assert failed == [f"{message_id}-refused-1.eml", f"{message_id}-refused-1.json"]
+            with open(os.path.join(spool_dir, 'failed', failed[1])) as f:
+                assert json.load(f)['rcpt_tos'] == ['gone@example.com']
+            print("✓ PASS: 450 recipient retried although every recipient was refused")
+        finally:
+            spool.stop()
+
+        # Only 5xx refusals: the whole message is final
+        pool = FakePool([smtplib.SMTPRecipientsRefused({'gone@example.com': (550, b'No such user')})])
+        spool = DeliverySpool(spool_dir, pool, workers=1)
+        spool.start()
+        try:
+            spool.enqueue('a@example.com', ['gone@example.com'], MESSAGE)
+            assert wait_for(lambda: spool.get_stats()['failed'] == 1)
+            assert spool.get_stats()['deferred'] == 0 and pool.sent == []
+            print("✓ PASS: message refused for every recipient with 5xx moved to failed/")
+        finally:
+            spool.stop()
+
+
+def test_spool_survives_restart():
+    """Messages spooled before a restart are delivered after it"""
+    with tempfile.TemporaryDirectory() as spool_dir:
+        # Spooled, but the process stops before any worker runs
+        before = DeliverySpool(spool_dir, FakePool(), workers=1)
+        for i in range(3):
+            before.enqueue('a@example.com', [f'user{i}@example.com'], MESSAGE)
+        # Debris of a crash mid-enqueue: never acknowledged, so discarded
+        with open(os.path.join(spool_dir, 'orphan.eml'), 'wb') as f:
+            f.write(MESSAGE)
+        with open(os.path.join(spool_dir, 'half.json.tmp'), 'w') as f:
+            f.write('{')
+
+        pool = FakePool()
+        after = DeliverySpool(spool_dir, pool, workers=2)
+        after.start()
+        try:
+            assert after.get_stats()['recovered'] == 3
+            assert wait_for(lambda: after.get_stats()['delivered'] == 3)
+            assert sorted(rcpt[0] for _, rcpt, _ in pool.sent) == [f'user{i}@example.com' for i in range(3)]
+            assert spool_files(spool_dir) == []
+            print("✓ PASS: 3 messages recovered and delivered, crash debris removed")
+        finally:
+            after.stop()
+
+
+if __name__ == '__main__':
+    test_spooled_message_delivered()
+    test_transient_failure_backs_off()
+    test_rejected_message_moved_to_failed()
+    test_missing_message_file_moved_to_failed()
+    test_refused_recipients_requeued_or_failed()
+    test_all_recipients_refused_with_mixed_codes()
+    test_spool_survives_restart()
+    print("\nTest complete!")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Unit test for the early-exit encoder heads
+"""
+import os
+import tempfile
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+TEXTS = [
+    'Re: Meeting tomorrow Hi John, yes I can make the meeting at 3pm.',
+    'Your Amazon Order Has Shipped Your order #123-456789 has been shipped.',
+    'URGENT: Claim your prize NOW!!! You have won $1,000,000!',
+    'Hi',
+]
+
+
+def test_early_exit_heads():
+    """Heads exit confident rows early, never change full-depth rows, and round-trip through disk"""
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+    from classifier import EmailClassifier
+    from early_exit import EarlyExit, EarlyExitHeads, fit_heads, layer_features
+
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(EmailClassifier.MODEL_NAME)
+        model = AutoModel.from_pretrained(EmailClassifier.MODEL_NAME).eval()
+    except OSError:
+        pytest.skip('DistilBERT model is not available locally')
+
+    num_layers = len(model.transformer.layer)
+    inputs = tokenizer(TEXTS, return_tensors='pt', truncation=True, max_length=64, padding=True)
+    with torch.no_grad():
+        expected = model(**inputs).last_hidden_state[:, 0, :].numpy()
+        by_layer = layer_features(model, inputs['input_ids'], inputs['attention_mask'], [2, 4])
+
+    categories = ['personal', 'shopping', 'spam']
+    labels = ['personal', 'shopping', 'spam', 'personal']
+    fit = lambda X, y: LogisticRegression(max_iter=200).fit(X, y)
+    heads = fit_heads(by_layer, expected, labels, [2, 4], num_layers, categories, 'test-encoder', fit,
+                      thresholds=[0.5, 1.1])
+    evaluation = heads.metadata['evaluation']
+    assert [policy['threshold'] for policy in evaluation['thresholds']] == [0.5, 1.1]
+    assert evaluation['thresholds'][1]['mean_layers'] == num_layers
+    print("✓ PASS: holdout evaluation recorded")
+
+    with torch.no_grad():
+        # A threshold no head can reach runs every row to the last layer
+        results = heads.run(model, inputs['input_ids'], inputs['attention_mask'], threshold=1.1)
+        assert not any(isinstance(result, EarlyExit) for result in results)
+        max_diff = float(np.abs(np.stack(results) - expected).max())
+        assert max_diff < 1e-5, f"Full-depth embeddings differ by {max_diff:.2e}"
+        print("✓ PASS: full-depth rows match the plain encoder")
+
+        # Any head is confident enough at threshold 0
+        results = heads.run(model, inputs['input_ids'], inputs['attention_mask'], threshold=0.0)
+        assert all(isinstance(result, EarlyExit) and result.layer == 2 for result in results)
+        assert np.allclose([result.probabilities.sum() for result in results], 1.0)
+        print("✓ PASS: confident rows exit at the first head")
+
+        # A spent latency budget sends every row out at the next head
+        results = heads.run(model, inputs['input_ids'], inputs['attention_mask'], threshold=1.1, deadline=0)
+        assert all(isinstance(result, EarlyExit) for result in results)
+        print("✓ PASS: deadline forces an exit")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'early_exit.npz')
+        heads.save(path)
+        loaded = EarlyExitHeads.load(path)
+        assert loaded.layers == [2, 4] and loaded.encoder_identity == 'test-encoder'
+        assert loaded.metadata['evaluation'] == evaluation
+        assert np.allclose(loaded.heads[4].predict_proba(by_layer[:, 1]),
+                           heads.heads[4].predict_proba(by_layer[:, 1]), atol=1e-5)
+        print("✓ PASS: heads round-trip through disk")
+
+
+if __name__ == '__main__':
+    test_early_exit_heads()
+    print("\nTest complete!")
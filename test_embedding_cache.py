@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Unit test for the persistent embedding cache
+"""
+import fcntl
+import tempfile
+import threading
+import numpy as np
+from embedding_cache import EmbeddingCache
+
+
+def test_round_trip_and_retention():
+    """Stored embeddings come back unchanged, and retain() evicts and reuses slots"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache(cache_dir, 'test-model|max_length=512', dim=4)
+        texts = ['order shipped', 'meeting tomorrow', 'claim your prize']
+        vectors = [np.full(4, i, dtype=np.float32) for i in range(len(texts))]
+
+        assert cache.get_many(texts) == [None, None, None]
+        cache.put_many(texts, vectors)
+
+        cached = cache.get_many(texts + ['unseen text'])
+        for i in range(len(texts)):
+            assert np.array_equal(cached[i], vectors[i]), f"Wrong vector for {texts[i]!r}"
+        assert cached[3] is None
+        print("✓ PASS: round trip")
+
+        # Evict everything except the first text, then add a new one into the freed slot
+        evicted = cache.retain(texts[:1])
+        assert evicted == 2
+        cache.put_many(['new newsletter'], [np.full(4, 9, dtype=np.float32)])
+        stats = cache.get_stats()
+        assert stats['entries'] == 2
+        assert stats['slots'] == 3, "Freed slots should be reused before the file grows"
+        cached = cache.get_many([texts[0], texts[1], 'new newsletter'])
+        assert np.array_equal(cached[0], vectors[0])
+        assert cached[1] is None
+        assert cached[2][0] == 9
+        print("✓ PASS: retention")
+
+        # A different encoder identity must not see the old entries
+        other = EmbeddingCache(cache_dir, 'test-model|max_length=128', dim=4)
+        assert other.get_many(texts[:1]) == [None]
+        print("✓ PASS: identity isolation")
+
+
+def test_compaction_keeps_entries():
+    """Compaction shrinks the vector file without changing stored vectors"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache(cache_dir, 'test-model', dim=2)
+        texts = [f'text {i}' for i in range(1200)]
+        cache.put_many(texts, [np.array([i, -i], dtype=np.float32) for i in range(1200)])
+
+        cache.retain(texts[:10])
+        assert cache.get_stats()['slots'] == 10
+        cached = cache.get_many(texts[:10])
+        for i in range(10):
+            assert np.array_equal(cached[i], [i, -i])
+        print("✓ PASS: compaction")
+
+
+def test_reads_wait_for_writers():
+    """get_many holds a shared lock, so it cannot read slots another process is compacting"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache(cache_dir, 'test-model', dim=2)
+        cache.put_many(['a'], [np.array([1, 2], dtype=np.float32)])
+        results = []
+        reader = threading.Thread(target=lambda: results.append(cache.get_many(['a'])))
+
+        # A separate open file description stands in for a writer in another process
+        with open(cache.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            reader.start()
+            reader.join(0.2)
+            assert reader.is_alive(), "get_many read while a writer held the lock"
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        reader.join(5)
+        assert np.array_equal(results[0][0], [1, 2])
+
+        # Shared locks do not exclude each other
+        with open(cache.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            assert np.array_equal(cache.get_many(['a'])[0], [1, 2])
+        print("✓ PASS: reads wait for writers, not for other readers")
+
+
+def test_float16_storage():
+    """A float16 cache is half the size, returns float32, and switching dtype clears it"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        vectors = [np.array([0.1, -2.5, 3.0, 1e-3], dtype=np.float32) * i for i in range(1, 4)]
+        texts = ['a', 'b', 'c']
+        cache = EmbeddingCache(cache_dir, 'test-model', dim=4, dtype='float16')
+        cache.put_many(texts, vectors)
+        cached = cache.get_many(texts)
+        assert all(v.dtype == np.float32 for v in cached)
+        assert all(np.allclose(v, w, rtol=1e-3) for v, w in zip(cached, vectors))
+        assert cache.get_stats()['size_bytes'] == 3 * 4 * 2
+        print("✓ PASS: float16 round trip")
+
+        cache = EmbeddingCache(cache_dir, 'test-model', dim=4)
+        assert cache.get_many(texts) == [None, None, None]
+        print("✓ PASS: dtype change clears the cache")
+
+
+if __name__ == '__main__':
+    test_round_trip_and_retention()
+    test_compaction_keeps_entries()
+    test_reads_wait_for_writers()
+    test_float16_storage()
+    print("\nTest complete!")
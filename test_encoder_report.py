@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Unit test for the int8 quantized encoder and the encoder comparison report
+"""
+import json
+import os
+import tempfile
+import numpy as np
+from transformers import AutoModel
+import config
+from testing import config_overrides, temporary_classifier
+
+TEXTS = [
+    'Re: Meeting tomorrow Hi John, yes I can make the meeting at 3pm.',
+    'Your Amazon Order Has Shipped Your order #123-456789 has been shipped.',
+    'URGENT: Claim your prize NOW!!! You have won $1,000,000!',
+]
+
+
+def test_int8_encoder_close_to_fp32():
+    """ENCODER_QUANTIZATION=int8 loads a quantized encoder whose embeddings stay close to fp32"""
+    with temporary_classifier(ENCODER_QUANTIZATION='int8') as classifier:
+        assert classifier.quantization == 'int8' and classifier.encoder_backend == 'pytorch'
+        quantized = classifier.encode_batch(TEXTS)
+        reference = classifier.encode_batch(TEXTS, model=AutoModel.from_pretrained(classifier.MODEL_NAME).eval())
+
+    assert quantized.shape == reference.shape == (len(TEXTS), classifier.hidden_size)
+    cosine = np.sum(quantized * reference, axis=1) / (np.linalg.norm(quantized, axis=1) *
+                                                      np.linalg.norm(reference, axis=1))
+    print(f"int8 vs fp32 cosine: min {cosine.min():.5f}")
+    assert cosine.min() > 0.99
+    print("✓ PASS: int8 embeddings close to fp32")
+
+
+def test_report_on_small_sample():
+    """The int8 report runs on a few training emails and is saved next to the model"""
+    from encoder_report import run_report
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            config_overrides(MODEL_DIR=tmp_dir, DB_PATH=f'{tmp_dir}/classifier.db', EMBEDDING_CACHE_ENABLED=False,
+                             INFERENCE_BATCHING_ENABLED=False):
+        config.init_db()
+        categories = ['personal', 'shopping', 'spam']
+        for i in range(12):
+            config.add_to_training_data(f'<{i}@example.com>', 'user@example.com', f'Subject {i}',
+                                        f'{TEXTS[i % 3]} Number {i}', categories[i % 3])
+
+        report = run_report('int8', limit=12, latency_samples=2)
+        assert report['num_emails'] == 12 and report['candidate'] == 'int8'
+        assert report['drift']['mean_cosine'] > 0.99
+        assert 0 <= report['accuracy']['reference_accuracy'] <= 1
+        assert report['latency']['candidate']['samples'] == 2
+        with open(os.path.join(config.MODEL_DIR, 'encoder_report_int8.json')) as f:
+            assert json.load(f)['drift'] == report['drift']
+    print("✓ PASS: report on a small sample")
+
+
+if __name__ == '__main__':
+    test_int8_encoder_close_to_fp32()
+    test_report_on_small_sample()
+    print("\nTest complete!")
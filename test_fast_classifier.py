@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Unit test for the hashed n-gram cascade classifier
+"""
+import os
+import tempfile
+import numpy as np
+from fast_classifier import HashedNgramClassifier
+
+TEMPLATES = {
+    'shopping': ['Your order #{n} has shipped, track your package', 'Save {n}% on your next order today',
+                 'Your receipt for order {n}, thanks for shopping'],
+    'spam': ['Claim your free prize now {n}!', 'You won ${n} click here to claim',
+             'Cheap pills {n} no prescription limited offer'],
+    'personal': ['Hey, are we still meeting for lunch on day {n}?', 'Thanks for dinner last night, see you {n}',
+                 'Can you call me back about the kids {n}'],
+}
+
+
+def make_dataset():
+    texts, labels = [], []
+    for label, templates in TEMPLATES.items():
+        for n in range(40):
+            texts.append(templates[n % len(templates)].format(n=n))
+            labels.append(label)
+    return texts, labels
+
+
+def test_train_predict_and_reload():
+    """Formulaic emails are learned confidently and the model round-trips through save/load"""
+    texts, labels = make_dataset()
+    model = HashedNgramClassifier(n_features=2 ** 12)
+    stats = model.train(texts, labels, threshold=0.6, min_precision=0.9)
+    print(f"Holdout: {stats}")
+
+    assert model.classes == ['personal', 'shopping', 'spam']
+    assert model.enabled, "Separable data should enable the cascade stage"
+    probs = model.predict_proba('Your order #999 has shipped, track your package')
+    assert abs(probs.sum() - 1.0) < 1e-5
+    assert model.classes[int(np.argmax(probs))] == 'shopping'
+    print("✓ PASS: prediction")
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        path = os.path.join(model_dir, 'fast_model.npz')
+        model.save(path)
+        loaded = HashedNgramClassifier.load(path)
+        assert loaded.enabled and loaded.classes == model.classes
+        assert np.allclose(loaded.predict_proba('free prize'), model.predict_proba('free prize'))
+    print("✓ PASS: save/load")
+
+
+def test_disabled_without_holdout_data():
+    """Too little data to measure precision keeps the stage disabled"""
+    model = HashedNgramClassifier(n_features=2 ** 10)
+    model.train(['order shipped', 'free prize', 'lunch tomorrow'] * 3,
+                ['shopping', 'spam', 'personal'] * 3, threshold=0.9, min_precision=0.9)
+    assert not model.enabled
+    assert len(model.predict_proba('')) == 3
+    print("✓ PASS: disabled on small data")
+
+
+if __name__ == '__main__':
+    test_train_predict_and_reload()
+    test_disabled_without_holdout_data()
+    print("\nTest complete!")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Unit test for the projected float16 feature store
+"""
+import os
+import tempfile
+import numpy as np
+from feature_store import FeatureProjection, FeatureStore
+from linear_model import LinearSoftmaxModel
+from training_worker import _fit
+
+
+def make_corpus(num_samples=600, input_dim=64, seed=0):
+    """Three classes separated along a few directions of a wider embedding"""
+    rng = np.random.RandomState(seed)
+    labels = np.array(['personal', 'shopping', 'spam'])[np.arange(num_samples) % 3]
+    centers = 3 * rng.randn(3, input_dim)
+    embeddings = rng.randn(num_samples, input_dim) + centers[np.arange(num_samples) % 3] + 5
+    return embeddings.astype(np.float32), labels
+
+
+def test_projection_folds_into_raw_model():
+    """A model fitted on projected features, folded back, scores raw embeddings identically"""
+    embeddings, labels = make_corpus()
+    for kind in ['pca', 'random']:
+        projection = FeatureProjection.fit(kind, embeddings, 16)
+        projected = projection.transform(embeddings)
+        model = LinearSoftmaxModel.from_sklearn(_fit(projected, labels, lambda done, total: None)[0], 'enc')
+        folded = projection.fold(model)
+
+        assert folded.num_features == embeddings.shape[1]
+        assert np.allclose(folded.predict_proba(embeddings), model.predict_proba(projected), atol=1e-4)
+        accuracy = np.mean(folded.predict(embeddings) == labels)
+        print(f"  {kind}: 64 → 16 dims, training accuracy {accuracy*100:.1f}%")
+        assert accuracy > 0.95
+        assert folded.metadata['projection']['kind'] == kind
+    print("✓ PASS: folded model matches the projected model")
+
+
+def test_store_round_trip():
+    """Rows written in any order come back as float16 from the memory-mapped store"""
+    embeddings, labels = make_corpus(num_samples=50)
+    projection = FeatureProjection.fit('pca', embeddings, 8)
+    assert 0 < projection.metadata['explained_variance'] <= 1
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        path = os.path.join(model_dir, 'features.json')
+        store = FeatureStore.create(path, len(labels), labels, projection, 'enc')
+        for rows in [np.arange(25, 50), np.arange(0, 25)]:
+            store.write(rows, embeddings[rows])
+        size = store.commit(path)
+
+        loaded = FeatureStore.load(path)
+        assert isinstance(loaded.features, np.memmap) and loaded.features.dtype == np.float16
+        assert loaded.features.shape == (50, 8) and size > loaded.features.nbytes
+        assert np.allclose(loaded.features, projection.transform(embeddings), atol=1e-2, rtol=1e-2)
+        assert list(loaded.labels) == list(labels)
+        assert np.allclose(loaded.projection.transform(embeddings), projection.transform(embeddings))
+        print("✓ PASS: store round trip")
+
+        # A new store replaces the old one's files
+        FeatureStore.create(path, len(labels), labels, projection, 'enc').commit(path)
+        assert len([name for name in os.listdir(model_dir) if name.endswith('.npy')]) == 1
+        print("✓ PASS: superseded store removed")
+
+
+if __name__ == '__main__':
+    test_projection_folds_into_raw_model()
+    test_store_round_trip()
+    print("\nTest complete!")
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Unit test for the streaming HTML-to-text extractor
+"""
+from html_text import html_to_text
+
+NEWSLETTER = '''<html><head><title>Weekly deals</title>
+<style>p { color: red; } .hidden { display: none }</style></head>
+<body><div class="hidden">Big savings inside &zwnj;&nbsp;&zwnj;&nbsp;&zwnj;</div>
+<table><tr><td>Save&nbsp;50%</td><td>on <b>shoes</b></td></tr></table>
+<script>var tracking = "not text";</script>
+<p>Shop &amp; go<br>today</p></body></html>'''
+
+
+def test_visible_text_only():
+    """Script, style and head content is dropped; entities, blocks and whitespace are normalized"""
+    text = html_to_text(NEWSLETTER)
+    print(f"Text: {text!r}")
+    assert text == 'Big savings inside Save 50% on shoes Shop & go today'
+    print("✓ PASS: visible text")
+
+
+def test_stops_at_budget():
+    """Extraction stops once the snippet is full, even for chunked and very long input"""
+    chunks = iter([NEWSLETTER[:60], NEWSLETTER[60:]] + ['<p>more text</p>' * 1000] * 1000)
+    assert html_to_text(chunks, max_chars=20) == 'Big savings inside S'
+    assert next(chunks) == '<p>more text</p>' * 1000, "Chunks after the budget was filled should not be read"
+    print("✓ PASS: stops at budget")
+
+
+if __name__ == '__main__':
+    test_visible_text_only()
+    test_stops_at_budget()
+    print("\nTest complete!")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Unit test for the micro-batching inference engine
+"""
+import threading
+import time
+import numpy as np
+from inference_engine import BatchingInferenceEngine, EncoderPriorityGate
+
+
+def fake_encode(texts):
+    """Stand-in for a forward pass: fixed cost per batch, one row per text"""
+    time.sleep(0.02)
+    return np.array([[float(len(text)), float(i)] for i, text in enumerate(texts)])
+
+
+def test_concurrent_requests_are_batched():
+    """Concurrent requests should share batches and each get their own row back"""
+    engine = BatchingInferenceEngine(fake_encode, max_batch_size=8, max_wait_ms=20)
+    engine.start()
+
+    texts = ['x' * n for n in range(1, 17)]
+    results = {}
+
+    def worker(text):
+        results[text] = engine.encode(text, timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.stop()
+
+    stats = engine.get_stats()
+    print(f"Batches: {stats['total_batches']}, avg batch size: {stats['avg_batch_size']:.1f}, "
+          f"p99: {stats['p99_latency_ms']:.1f}ms")
+
+    for text in texts:
+        assert results[text][0] == len(text), f"Wrong embedding returned for {text!r}"
+    assert stats['total_requests'] == len(texts)
+    assert stats['total_batches'] < len(texts), "Requests were not batched"
+    assert stats['largest_batch'] <= 8
+    print("✓ PASS: concurrent requests batched")
+
+
+def test_errors_propagate_to_callers():
+    """A failing forward pass should raise in every waiting caller"""
+    def broken_encode(texts):
+        raise RuntimeError('model failure')
+
+    engine = BatchingInferenceEngine(broken_encode, max_batch_size=4, max_wait_ms=1)
+    engine.start()
+    try:
+        engine.encode('hello', timeout=5)
+        raise AssertionError('Expected RuntimeError')
+    except RuntimeError as e:
+        assert 'model failure' in str(e)
+    finally:
+        engine.stop()
+    print("✓ PASS: errors propagate")
+
+
+def test_background_work_yields_to_live_encodes():
+    """Training batches wait while a live encode runs, but never longer than max_wait_ms"""
+    gate = EncoderPriorityGate(idle_ms=5, max_wait_ms=200)
+    assert gate.wait_for_turn() < 0.05, "Idle encoder should not delay background work"
+
+    def live_encode(duration):
+        with gate.live():
+            time.sleep(duration)
+
+    live = threading.Thread(target=live_encode, args=(0.1,))
+    live.start()
+    time.sleep(0.01)
+    waited = gate.wait_for_turn()
+    live.join()
+    assert 0.05 < waited < 0.2, f"Background batch should wait for the live encode (waited {waited:.3f}s)"
+
+    live = threading.Thread(target=live_encode, args=(0.5,))
+    live.start()
+    time.sleep(0.01)
+    waited = gate.wait_for_turn()
+    live.join()
+    assert waited < 0.4, "Background batch should stop waiting at max_wait_ms"
+
+    stats = gate.get_stats()
+    print(f"Gate: {stats}")
+    assert stats['background_batches'] == 3 and stats['background_batches_delayed'] == 2
+    print("✓ PASS: background work yields to live encodes")
+
+
+if __name__ == '__main__':
+    test_concurrent_requests_are_batched()
+    test_errors_propagate_to_callers()
+    test_background_work_yields_to_live_encodes()
+    print("\nTest complete!")
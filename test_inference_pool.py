@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Unit test for the multi-process inference worker pool
+"""
+import os
+import time
+import numpy as np
+import pytest
+import config
+from inference_pool import InferencePool
+from linear_model import LinearSoftmaxModel
+from testing import temporary_classifier
+
+
+class StubClassifier:
+    """Stands in for EmailClassifier in the forked workers; 'crash' kills the worker"""
+    onnx_encoder = None
+
+    def encode_with_lengths(self, texts, max_length=None, timings=None, early_exit=None, deadline=None):
+        if 'crash' in texts:
+            os._exit(1)
+        return np.ones((len(texts), 4), dtype=np.float32), [len(text) for text in texts]
+
+
+def test_dead_worker_times_out():
+    """A worker killed mid-encode raises TimeoutError instead of hanging, and the pool keeps working"""
+    pool = InferencePool(StubClassifier(), num_workers=1, threads_per_worker=1)
+    try:
+        features, lengths, _ = pool.encode(['hello'], timeout=10)
+        assert features.shape == (1, 4) and lengths == [5]
+        print("✓ PASS: encode in worker")
+
+        start = time.perf_counter()
+        with pytest.raises(TimeoutError):
+            pool.encode(['crash'], timeout=1)
+        assert time.perf_counter() - start < 5
+        assert pool.get_stats()['timeouts'] == 1
+        print("✓ PASS: dead worker times out")
+
+        features, _, _ = pool.encode(['hello again'], timeout=10)
+        assert features.shape == (1, 4)
+        print("✓ PASS: replacement worker encodes")
+    finally:
+        pool.close()
+
+
+def test_workers_encode_like_the_main_process():
+    """Live encodes run in the forked workers and match an in-process encode; forking after one is refused"""
+    texts = ['Your order has shipped', 'Meeting tomorrow at 3pm', 'Claim your prize now!!!']
+    with temporary_classifier() as classifier:
+        classifier.start_inference_pool(2)
+        assert len(classifier.inference_pool.get_stats()['workers']) == 2
+        features, lengths, timings = classifier.inference_pool.encode(texts, 64, timeout=60)
+        live = classifier.extract_features_batch(texts, 64)
+        assert classifier.forward_passes == 0, "Live encode ran in the main process"
+        assert features.shape == (3, classifier.hidden_size) and 'forward' in timings
+        print("✓ PASS: encoded in worker processes")
+
+        classifier.inference_pool.close()
+        classifier.inference_pool = None
+        expected, expected_lengths = classifier.encode_with_lengths(texts, max_length=64)
+        assert lengths == expected_lengths
+        assert np.allclose(features, expected, atol=1e-5)
+        assert np.allclose(np.stack(live), expected, atol=1e-5)
+        print("✓ PASS: worker embeddings match the main process")
+
+        with pytest.raises(RuntimeError):
+            classifier.start_inference_pool(1)
+        assert classifier.inference_pool is None
+        print("✓ PASS: no fork after a forward pass")
+
+
+def test_online_update_encodes_in_workers():
+    """With the pool running, learning a correction runs no forward pass in the main process"""
+    with temporary_classifier() as classifier:
+        categories = np.array(['personal', 'shopping', 'spam'])
+        classifier.swap_model(LinearSoftmaxModel(np.zeros((3, classifier.hidden_size), dtype=np.float32),
+                                                 np.zeros(3), categories, classifier.encoder_identity),
+                              classifier.max_length)
+        config.add_to_training_data('<1@example.com>', 'user@example.com', 'Prize',
+                                    'Prize You have won a prize', 'personal')
+
+        classifier.start_inference_pool(1)
+        assert classifier.learn_correction('<1@example.com>', 'user@example.com', 'spam')
+        assert classifier.forward_passes == 0, "Correction was encoded in the main process"
+        assert classifier.embedding_cache.get_many(['Prize You have won a prize'])[0] is not None
+        print("✓ PASS: correction encoded by an inference worker")
+
+
+if __name__ == '__main__':
+    test_dead_worker_times_out()
+    test_workers_encode_like_the_main_process()
+    test_online_update_encodes_in_workers()
+    print("\nTest complete!")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Unit test for the NumPy logistic regression artifact and predictor
+"""
+import os
+import tempfile
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from linear_model import LinearSoftmaxModel, read_metadata
+
+
+def fit_sklearn(num_classes: int):
+    rng = np.random.RandomState(0)
+    X = rng.randn(90, 16).astype(np.float32)
+    labels = np.array(['personal', 'shopping', 'spam'][:num_classes])
+    y = labels[np.arange(90) % num_classes]
+    return X, LogisticRegression(max_iter=1000, multi_class='multinomial').fit(X, y)
+
+
+def test_matches_sklearn_and_round_trips():
+    """Probabilities match sklearn; the artifact reloads memory-mapped with its metadata"""
+    for num_classes in (3, 2):
+        X, sklearn_model = fit_sklearn(num_classes)
+        model = LinearSoftmaxModel.from_sklearn(sklearn_model, 'test-encoder')
+        assert np.abs(model.predict_proba(X) - sklearn_model.predict_proba(X)).max() < 1e-5
+        assert list(model.predict(X)) == list(sklearn_model.predict(X))
+    print("✓ PASS: matches sklearn (3 and 2 classes)")
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        meta_path = os.path.join(model_dir, 'classifier.json')
+        model.save(meta_path)
+        first_weights = read_metadata(meta_path)['weights_file']
+        model.save(meta_path)
+        model.save(meta_path)
+        weights_files = [f for f in os.listdir(model_dir) if f.endswith('.npy')]
+        assert len(weights_files) == 2, "Only the current and previous weights files are kept"
+        assert first_weights not in weights_files
+
+        loaded = LinearSoftmaxModel.load(meta_path)
+        assert isinstance(loaded.coef_, np.memmap)
+        assert loaded.encoder_identity == 'test-encoder'
+        assert np.allclose(loaded.predict_proba(X), model.predict_proba(X))
+    print("✓ PASS: save/load")
+
+
+def test_aligned_to_categories():
+    """Rows follow the configured category order; untrained categories get probability 0"""
+    X, sklearn_model = fit_sklearn(2)
+    model = LinearSoftmaxModel.from_sklearn(sklearn_model).aligned_to(['spam', 'personal', 'shopping'])
+    probs = model.predict_proba(X)
+    assert list(model.classes_) == ['spam', 'personal', 'shopping']
+    assert np.all(probs[:, 0] == 0)
+    assert np.allclose(probs[:, 1:], sklearn_model.predict_proba(X), atol=1e-5)
+    print("✓ PASS: category alignment")
+
+
+def test_partial_fit_applies_correction():
+    """A correction flips that sample's prediction, barely moves others and leaves the original intact"""
+    rng = np.random.RandomState(1)
+    labels = np.array(['personal', 'shopping', 'spam'])[np.arange(150) % 3]
+    centers = rng.randn(3, 64) * 2
+    X = (centers[np.arange(150) % 3] + rng.randn(150, 64)).astype(np.float32)
+    model = LinearSoftmaxModel.from_sklearn(LogisticRegression(max_iter=1000, multi_class='multinomial').fit(X, labels))
+    before = model.predict(X)
+    sample = X[0]
+    target = 'spam' if before[0] != 'spam' else 'shopping'
+
+    updated, steps = model.partial_fit([sample], [target])
+    print(f"Correction applied in {steps} steps")
+    assert updated.predict([sample])[0] == target
+    assert model.predict([sample])[0] == before[0], "Original model must not change"
+    assert updated.metadata['online_updates'] == 1
+    assert np.mean(updated.predict(X[1:]) == before[1:]) > 0.95
+    print("✓ PASS: online correction")
+
+    # A category missing from training can still be learned
+    X, sklearn_model = fit_sklearn(2)
+    model = LinearSoftmaxModel.from_sklearn(sklearn_model).aligned_to(['spam', 'personal', 'shopping'])
+    updated, _ = model.partial_fit([X[0]], ['spam'])
+    assert updated.predict([X[0]])[0] == 'spam'
+    assert np.all(np.isfinite(updated.coef_))
+    print("✓ PASS: correction to an untrained category")
+
+
+if __name__ == '__main__':
+    test_matches_sklearn_and_round_trips()
+    test_aligned_to_categories()
+    test_partial_fit_applies_correction()
+    print("\nTest complete!")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Unit test for the bounded streaming MIME parser
+"""
+import base64
+import quopri
+from email import message_from_string
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from mime_stream import extract_text, _iter_decoded
+
+
+def full_parse_body(raw_email: str) -> str:
+    """The previous classification path: full parse, every text/plain part decoded"""
+    msg = message_from_string(raw_email)
+    body = ''
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.get_content_type() == 'text/plain':
+                body += part.get_payload(decode=True).decode('utf-8', errors='ignore')
+    else:
+        body = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
+    return body[:1000]
+
+
+def with_headers(msg, subject='Your order has shipped'):
+    msg['Subject'] = subject
+    msg['From'] = 'Shop <orders@shop.com>'
+    msg['Message-ID'] = '<abc@shop.com>'
+    return msg.as_string()
+
+
+def quoted_printable(text: str):
+    msg = MIMEText('', 'plain')
+    msg.replace_header('Content-Transfer-Encoding', 'quoted-printable')
+    msg.set_payload(quopri.encodestring(text.encode('utf-8')).decode('ascii'))
+    return msg
+
+
+def sample_messages():
+    long_text = 'Tracking number 12345, estimated delivery Friday. Café ☃ ' * 40
+    alternative = MIMEMultipart('alternative')
+    alternative.attach(MIMEText(long_text, 'plain', 'utf-8'))
+    alternative.attach(MIMEText(f'<p>{long_text}</p>', 'html', 'utf-8'))
+
+    mixed = MIMEMultipart('mixed')
+    mixed.attach(alternative)
+    mixed.attach(MIMEApplication(b'%PDF' + bytes(range(256)) * 400, Name='invoice.pdf'))
+
+    return {
+        'plain 7bit': with_headers(MIMEText('Hey, lunch tomorrow?\r\nSee you then.')),
+        'plain base64': with_headers(MIMEText(long_text, 'plain', 'utf-8')),
+        'quoted-printable': with_headers(quoted_printable(long_text)),
+        'alternative': with_headers(alternative),
+        'nested with attachment': with_headers(mixed),
+    }
+
+
+def test_matches_full_parse():
+    """Text given to the encoder is unchanged from the full parse"""
+    for name, raw in sample_messages().items():
+        # SMTP delivers CRLF line endings; Python's generator writes LF
+        for line_ending, raw in (('LF', raw), ('CRLF', raw.replace('\n', '\r\n'))):
+            headers, body = extract_text(raw.encode('utf-8'))
+            assert headers.get('subject') == 'Your order has shipped', name
+            assert headers.get('message-id') == '<abc@shop.com>', name
+            assert body == full_parse_body(raw), f"Body differs for {name} ({line_ending})"
+        print(f"✓ PASS: {name}")
+
+
+def test_skips_attachments_and_caps_work():
+    """Attachment payloads are never decoded and text past the scan cap is ignored"""
+    message = MIMEMultipart('mixed')
+    message.attach(MIMEApplication(b'x' * 200000, Name='data.bin'))
+    attachment = MIMEText('secret attachment text', 'plain')
+    attachment.add_header('Content-Disposition', 'attachment', filename='notes.txt')
+    message.attach(attachment)
+    message.attach(MIMEText('the real message', 'plain'))
+    raw = with_headers(message).encode('utf-8')
+
+    _, body = extract_text(raw)
+    assert body == 'the real message'
+    print("✓ PASS: attachments skipped")
+
+    _, body = extract_text(raw, max_scan_bytes=100000)
+    assert body == '', "Parts beyond max_scan_bytes should not be read"
+    _, body = extract_text(raw, max_parts=1)
+    assert body == ''
+    print("✓ PASS: work caps")
+
+    _, body = extract_text(with_headers(quoted_printable('café ' * 500)), snippet_chars=20)
+    assert body == 'café ' * 4, repr(body)
+    _, body = extract_text(with_headers(MIMEText('é' * 5000, 'plain', 'utf-8')), snippet_chars=7)
+    assert body == 'é' * 7
+    print("✓ PASS: quoted-printable and snippet length")
+
+
+def test_html_only_messages():
+    """Without a text/plain part the snippet comes from the HTML, decoded in chunks"""
+    html = '<html><head><style>p {}</style></head><body>' + '<p>Flash sale &amp; free shipping</p>' * 5000
+    expected = ' '.join(['Flash sale & free shipping'] * 40)[:1000]
+
+    related = MIMEMultipart('related')
+    related.attach(MIMEText(html, 'html', 'utf-8'))
+    related.attach(MIMEApplication(b'\x89PNG' * 1000, Name='logo.png'))
+    for name, msg in (('single-part', MIMEText(html, 'html', 'utf-8')),
+                      ('quoted-printable', quoted_printable(html)),
+                      ('multipart', related)):
+        if name == 'quoted-printable':
+            msg.replace_header('Content-Type', 'text/html; charset="utf-8"')
+        _, body = extract_text(with_headers(msg))
+        assert body == expected, f"{name}: {body[:80]!r}"
+        print(f"✓ PASS: HTML-only {name}")
+
+    alternative = MIMEMultipart('alternative')
+    alternative.attach(MIMEText('plain version', 'plain'))
+    alternative.attach(MIMEText(html, 'html'))
+    assert extract_text(with_headers(alternative))[1] == 'plain version', "A plain part wins over HTML"
+    print("✓ PASS: plain part preferred")
+
+
+def test_chunked_decoding():
+    """Decoding in small chunks never splits a base64 quantum, QP escape or UTF-8 character"""
+    text = 'Café ☃ déjà vu, naïve résumé. ' * 50
+    for encoding, encoded in (('base64', base64.encodebytes(text.encode('utf-8'))),
+                              ('quoted-printable', quopri.encodestring(text.encode('utf-8'))),
+                              ('8bit', text.encode('utf-8'))):
+        for chunk_bytes in (5, 7, 64, 4096):
+            decoded = ''.join(_iter_decoded(encoded, 0, len(encoded), encoding, chunk_bytes))
+            assert decoded == text, f"{encoding} with {chunk_bytes}-byte chunks"
+    print("✓ PASS: chunked decoding")
+
+
+if __name__ == '__main__':
+    test_matches_full_parse()
+    test_skips_attachments_and_caps_work()
+    test_html_only_messages()
+    test_chunked_decoding()
+    print("\nTest complete!")
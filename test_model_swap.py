@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Unit test for serving-model swaps and their persistence
+"""
+import threading
+import numpy as np
+import pytest
+import config
+from linear_model import LinearSoftmaxModel
+from testing import temporary_classifier
+
+
+@pytest.fixture(scope='module')
+def classifier():
+    """One classifier for the module: loading DistilBERT dominates the run time"""
+    with temporary_classifier() as classifier:
+        yield classifier
+
+
+def make_model(classifier, value):
+    return LinearSoftmaxModel(np.full((3, classifier.hidden_size), value, dtype=np.float32), np.zeros(3),
+                              np.array(['personal', 'shopping', 'spam']), classifier.encoder_identity)
+
+
+def test_only_the_serving_model_is_saved(classifier):
+    """A swap persists its model; a stale online update neither swaps nor overwrites it"""
+    online_base = make_model(classifier, 1.0)
+    assert classifier.swap_model(online_base, classifier.max_length) > 0
+
+    # A retrain swaps in while an online update of online_base is in flight
+    retrained = make_model(classifier, 2.0)
+    classifier.swap_model(retrained, classifier.max_length)
+    stale = make_model(classifier, 3.0)
+    assert classifier.swap_model(stale, classifier.max_length, replaces=online_base) is None
+    assert classifier.classifier is retrained
+
+    on_disk = LinearSoftmaxModel.load(classifier.model_path)
+    assert np.array_equal(on_disk.coef_, retrained.coef_)
+    print("✓ PASS: saved model is the serving model")
+
+
+def test_non_finite_intercepts_rejected(classifier):
+    """validate_model accepts -inf intercepts (absent classes) but rejects +inf and nan"""
+    serving, classifier.classifier = classifier.classifier, None
+    try:
+        features = np.zeros((3, classifier.hidden_size), dtype=np.float32)
+        labels = ['personal', 'shopping', 'spam']
+
+        model = make_model(classifier, 0.0)
+        model.intercept_ = np.array([0.0, 0.0, -np.inf], dtype=np.float32)
+        assert classifier.validate_model(model, features, labels)
+        for bad in (np.inf, np.nan):
+            model.intercept_ = np.array([0.0, bad, 0.0], dtype=np.float32)
+            assert not classifier.validate_model(model, features, labels), f"{bad} intercept accepted"
+        print("✓ PASS: +inf and nan intercepts rejected, -inf accepted")
+    finally:
+        classifier.classifier = serving
+
+
+def test_corrections_learned_off_the_caller_thread(classifier):
+    """A reclassification listener only queues the correction; the update runs on the online-learning thread"""
+    threads = []
+    release = threading.Event()
+
+    def learn_correction(message_id, user_email, new_category):
+        threads.append(threading.current_thread().name)
+        release.wait(5)
+
+    classifier.learn_correction = learn_correction
+    try:
+        for i in range(3):
+            classifier._on_reclassification(f'<{i}@example.com>', 'user@example.com', None, 'spam', 'personal')
+        assert threads in ([], ['online-learning'])  # The caller never waits for the update
+        release.set()
+        classifier._corrections.join()
+        assert threads == ['online-learning'] * 3
+        print("✓ PASS: corrections learned in order on the online-learning thread")
+    finally:
+        del classifier.learn_correction
+
+
+def test_closed_classifier_stops_learning(classifier):
+    """close() unregisters the listener and stops the online-learning thread (closing again is harmless)"""
+    learner = classifier._learner
+    assert classifier._on_reclassification in config._reclassification_listeners
+    classifier.close()
+    assert classifier._on_reclassification not in config._reclassification_listeners
+    assert not learner.is_alive()
+    print("✓ PASS: closed classifier no longer receives corrections")
+
+
+if __name__ == '__main__':
+    with temporary_classifier() as shared:
+        test_only_the_serving_model_is_saved(shared)
+        test_non_finite_intercepts_rejected(shared)
+        test_corrections_learned_off_the_caller_thread(shared)
+        test_closed_classifier_stops_learning(shared)
+    print("\nTest complete!")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Unit test for the MinHash near-duplicate index
+"""
+import time
+import numpy as np
+from near_duplicate import NearDuplicateIndex, minhash
+
+CAMPAIGN = ("Autumn sale: take 30 percent off all jackets, boots and knitwear this weekend only. "
+            "Free shipping on orders over fifty dollars and free returns for members. New arrivals "
+            "in outerwear, hats and scarves are now in stock in every size and color. Visit your "
+            "nearest store or shop online before Sunday at midnight. You are receiving this email "
+            "because you subscribed to our newsletter. Manage preferences or unsubscribe here.")
+
+
+def test_near_duplicates_share_entry():
+    """Copies that differ in greeting or tracking id hit; unrelated text misses"""
+    index = NearDuplicateIndex(max_entries=10, min_similarity=0.8)
+    first = index.signature(f"Hi Alice, {CAMPAIGN} id=1001")
+    index.add(first, np.ones(4, dtype=np.float32), [0.1, 0.8, 0.1], model_version=1)
+
+    copy = index.lookup(index.signature(f"Hi Bob, {CAMPAIGN} id=2002"))
+    assert copy is not None, "Campaign copy should be found"
+    assert copy['model_version'] == 1 and np.allclose(copy['probabilities'], [0.1, 0.8, 0.1])
+    print("✓ PASS: campaign copy found")
+
+    other = ("Hey, are we still on for dinner with your parents on Friday? I can pick up the cake "
+             "on the way home and we could bring the kids along if they are not too tired after school.")
+    assert index.lookup(index.signature(other)) is None
+    assert minhash('too short to compare') is None
+    print("✓ PASS: unrelated and short texts miss")
+
+    index.update(copy, [0.2, 0.7, 0.1], model_version=2)
+    assert index.lookup(first)['model_version'] == 2
+
+    stats = index.get_stats()
+    assert stats['hits'] == 2 and stats['misses'] == 1
+    print(f"✓ PASS: stats {stats}")
+
+
+def test_signature_speed_and_eviction():
+    """Full-length texts are signed in well under a forward pass; LRU bounds the index"""
+    index = NearDuplicateIndex(max_entries=3)
+    texts = [f"{CAMPAIGN} {CAMPAIGN} variant {i}" for i in range(200)]
+    start = time.perf_counter()
+    for text in texts:
+        index.signature(text)
+    per_text_ms = (time.perf_counter() - start) / len(texts) * 1000
+    print(f"Signature time: {per_text_ms:.3f}ms per email")
+    assert per_text_ms < 5
+
+    for i in range(5):
+        index.add(minhash(f"message number {i} " * 10), None, [1.0, 0.0, 0.0], model_version=0)
+    stats = index.get_stats()
+    assert stats['entries'] == 3 and stats['evictions'] == 2
+    print("✓ PASS: eviction")
+
+
+if __name__ == '__main__':
+    test_near_duplicates_share_entry()
+    test_signature_speed_and_eviction()
+    print("\nTest complete!")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Unit test that ONNX Runtime embeddings match the PyTorch encoder
+"""
+import os
+import tempfile
+import numpy as np
+import pytest
+
+# Maximum allowed absolute difference between ONNX and PyTorch embeddings
+TOLERANCE = 1e-3
+
+TEXTS = [
+    'Re: Meeting tomorrow Hi John, yes I can make the meeting at 3pm.',
+    'Your Amazon Order Has Shipped Your order #123-456789 has been shipped. Track your package here.',
+    'URGENT: Claim your prize NOW!!! You have won $1,000,000! Click here immediately to claim.',
+    'Hi',
+]
+
+
+def test_onnx_matches_pytorch():
+    """Embeddings from the ONNX export should match PyTorch within TOLERANCE, padded or not"""
+    pytest.importorskip('onnxruntime')
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+    from classifier import EmailClassifier
+    from onnx_encoder import OnnxEncoder, export_onnx
+
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(EmailClassifier.MODEL_NAME)
+        model = AutoModel.from_pretrained(EmailClassifier.MODEL_NAME).eval()
+    except OSError:
+        pytest.skip('DistilBERT model is not available locally')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        onnx_path = os.path.join(tmp_dir, 'distilbert.onnx')
+        export_onnx(model, tokenizer, onnx_path)
+        onnx_encoder = OnnxEncoder(onnx_path)
+
+        # Batched (padded) and one at a time
+        for batch in [TEXTS] + [[text] for text in TEXTS]:
+            inputs = tokenizer(batch, return_tensors='pt', truncation=True,
+                               max_length=EmailClassifier.MAX_LENGTH, padding=True)
+            with torch.no_grad():
+                expected = model(**inputs).last_hidden_state[:, 0, :].numpy()
+            actual = onnx_encoder.encode_texts(tokenizer, batch, EmailClassifier.MAX_LENGTH)
+
+            assert actual.shape == expected.shape
+            max_diff = float(np.abs(actual - expected).max())
+            print(f"  batch of {len(batch)}: max abs diff {max_diff:.2e}")
+            assert max_diff < TOLERANCE, f"ONNX embeddings differ by {max_diff:.2e} (tolerance {TOLERANCE})"
+
+    print("✓ PASS: ONNX embeddings match PyTorch")
+
+
+if __name__ == '__main__':
+    test_onnx_matches_pytorch()
+    print("\nTest complete!")
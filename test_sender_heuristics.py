@@ -70,5 +70,97 @@ def test_sender_heuristics():
 
     print("\nTest complete!")
 
+def test_sender_heuristics_batch():
+    """The vectorized batch heuristics must match the per-email version row for row"""
+    classifier = EmailClassifier()
+
+    from_addrs = ['district7@info.miamidade.gov', 'sales@retailstore.com',
+                  'contact@countyoffice.com', 'user@personal.net']
+    probabilities = [[0.2, 0.7, 0.1], [0.1, 0.8, 0.1], [0.3, 0.3, 0.4], [0.6, 0.2, 0.2]]
+
+    batch = classifier.apply_sender_heuristics_batch(from_addrs, probabilities)
+    for i, from_addr in enumerate(from_addrs):
+        single = classifier.apply_sender_heuristics(from_addr, probabilities[i])
+        assert all(abs(a - b) < 1e-12 for a, b in zip(batch[i], single)), f"Mismatch for {from_addr}"
+        assert abs(sum(batch[i]) - 1.0) < 1e-9
+    assert list(batch[1]) == probabilities[1], "Commercial senders must be unchanged"
+    print("✓ PASS: batch heuristics match per-email heuristics")
+
+def test_compiled_rules_match_linear_scan():
+    """Trie and keyword automaton find exactly the rules a linear scan finds, and hits are counted"""
+    import json
+    import os
+    import random
+    import tempfile
+    from sender_rules import SenderRules
+
+    rng = random.Random(0)
+    word = lambda: ''.join(rng.choice('abcdeorgv.') for _ in range(rng.randint(2, 6)))
+    rules = [{'name': f'rule-{i}', 'suffixes': [word() for _ in range(3)], 'keywords': [word() for _ in range(3)],
+              'move': {'from': 'shopping', 'to': 'personal', 'fraction': 0.5}} for i in range(300)]
+    path = os.path.join(tempfile.mkdtemp(), 'sender_rules.json')
+    with open(path, 'w') as f:
+        json.dump({'rules': rules}, f)
+    engine = SenderRules.load(path, ['personal', 'shopping', 'spam'])
+
+    domains = [''.join(rng.choice('abcdeorgv.') for _ in range(rng.randint(3, 25))) for _ in range(500)]
+    for domain in domains:
+        expected = [i for i, rule in enumerate(rules)
+                    if any(domain.endswith(s) for s in rule['suffixes']) or any(k in domain for k in rule['keywords'])]
+        assert engine.match(domain) == expected, domain
+    print(f"✓ PASS: {len(rules)} compiled rules match a linear scan")
+
+    engine.apply_batch(domains, [[0.2, 0.7, 0.1]] * len(domains))
+    stats = engine.get_stats()
+    assert stats['emails_checked'] == len(domains)
+    assert [r['hits'] for r in stats['rules']] == [sum(i in engine.match(d) for d in domains) for i in range(len(rules))]
+    print("✓ PASS: rule hit counts")
+
+    civic = SenderRules.load(None, ['personal', 'shopping', 'spam'])
+    assert civic.explain('info.miamidade.gov') == [
+        "Sender domain 'info.miamidade.gov' is a civic/institutional domain - shopping probability was reduced."]
+    assert civic.explain('retailstore.com') == []
+    print("✓ PASS: shared explanation")
+
+def test_malformed_rules_skipped():
+    """Bad rules and reason templates are logged and skipped instead of failing startup or explain()"""
+    import json
+    import os
+    import tempfile
+    from sender_rules import SenderRules
+
+    categories = ['personal', 'shopping', 'spam']
+    move = {'from': 'shopping', 'to': 'personal', 'fraction': 0.5}
+    rules = [{'name': 'braces', 'suffixes': ['.gov'], 'move': move, 'reason': "Matched {} on {domain}"},
+             {'name': 'unknown-field', 'suffixes': ['.edu'], 'move': move, 'reason': "{sender} matched"},
+             {'name': 'bad-fraction', 'suffixes': ['.org'], 'move': dict(move, fraction='most')},
+             {'name': 'too-much', 'suffixes': ['.org'], 'move': dict(move, fraction=1.5)},
+             {'name': 'negative', 'suffixes': ['.org'], 'move': dict(move, fraction=-0.2)},
+             {'name': 'nan', 'suffixes': ['.org'], 'move': dict(move, fraction=float('nan'))},
+             {'name': 'bad-move', 'suffixes': ['.net'], 'move': 'shopping->personal'},
+             'not-a-rule',
+             {'name': 'good', 'keywords': ['county'], 'move': move, 'reason': "'{domain}' is civic"}]
+    engine = SenderRules(rules, categories)
+    assert [rule['name'] for rule in engine.rules] == ['braces', 'unknown-field', 'good']
+    assert len(engine.errors) == 8
+    assert engine.explain('city.gov') == ["Sender rule 'braces' matched 'city.gov'."]
+    assert engine.explain('state.edu') == ["Sender rule 'unknown-field' matched 'state.edu'."]
+    assert engine.explain('county.com') == ["'county.com' is civic"]
+    assert len(engine.get_stats()['errors']) == 8
+    assert (engine.apply_batch(['x.org', 'city.gov'], [[0.2, 0.7, 0.1]] * 2) >= 0).all()
+    print("✓ PASS: malformed rules and fractions outside [0, 1] skipped, unusable reasons replaced")
+
+    path = os.path.join(tempfile.mkdtemp(), 'sender_rules.json')
+    for content in ('{"rules": [', json.dumps({'rule': []}), json.dumps({'rules': 'civic'})):
+        with open(path, 'w') as f:
+            f.write(content)
+        engine = SenderRules.load(path, categories)
+        assert [rule['name'] for rule in engine.rules] == ['civic'], content
+        assert len(engine.errors) == 1
+    print("✓ PASS: unreadable rules file falls back to the built-in rules")
+
 if __name__ == '__main__':
     test_sender_heuristics()
+    test_sender_heuristics_batch()
+    test_compiled_rules_match_linear_scan()
+    test_malformed_rules_skipped()
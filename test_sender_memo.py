@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Unit test for the sender-domain classification memo
+"""
+import time
+from sender_memo import SenderMemo, subject_template
+
+
+def test_subject_template():
+    """Order numbers and reply prefixes do not split a sender's template"""
+    assert subject_template('Your order #1234 has shipped') == subject_template('RE: Your Order #98 has  shipped')
+    assert subject_template('Weekly deals') != subject_template('Password reset')
+    print("✓ PASS: subject templates")
+
+
+def test_gating_eviction_and_invalidation():
+    """Answers only after repeated confident outcomes; evicts LRU, expires and invalidates"""
+    memo = SenderMemo(max_entries=2, ttl_seconds=60, min_confidence=0.9, min_observations=2)
+    key = SenderMemo.make_key('shop.com', 'Your order #1 has shipped')
+    shipped = [0.02, 0.96, 0.02]
+
+    assert SenderMemo.make_key('', 'anything') is None
+    memo.observe(key, 'shopping', shipped)
+    assert memo.get(key) is None, "One observation is not enough"
+    memo.observe(key, 'shopping', shipped)
+    assert memo.get(SenderMemo.make_key('shop.com', 'Your order #2 has shipped')) == ('shopping', shipped)
+    print("✓ PASS: confidence gating")
+
+    # A low-confidence outcome resets the entry
+    memo.observe(key, 'shopping', [0.3, 0.5, 0.2])
+    assert memo.get(key) is None
+    memo.observe(key, 'shopping', shipped)
+    memo.observe(key, 'shopping', shipped)
+
+    # Least recently used entry goes first
+    other = SenderMemo.make_key('news.org', 'Newsletter')
+    third = SenderMemo.make_key('promo.com', 'Sale')
+    memo.observe(other, 'personal', [0.95, 0.03, 0.02])
+    memo.get(key)
+    memo.observe(third, 'spam', [0.01, 0.01, 0.98])
+    assert memo.get_stats()['evictions'] == 1
+    assert memo.get(key) is not None
+    print("✓ PASS: LRU eviction")
+
+    assert memo.invalidate_sender('shop.com') == 1
+    assert memo.get(key) is None
+    print("✓ PASS: invalidation")
+
+    memo.ttl_seconds = 0
+    time.sleep(0.01)
+    assert memo.get(third) is None
+    stats = memo.get_stats()
+    assert stats['expirations'] == 1 and stats['entries'] == 0
+    assert stats['hits'] == 3
+    print(f"✓ PASS: expiry ({stats})")
+
+
+if __name__ == '__main__':
+    test_subject_template()
+    test_gating_eviction_and_invalidation()
+    print("\nTest complete!")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Unit test for the adaptive sequence cap and length-bucketed encoding
+"""
+import json
+import numpy as np
+import pytest
+from linear_model import LinearSoftmaxModel
+from testing import config_overrides, temporary_classifier
+
+
+@pytest.fixture(scope='module')
+def classifier():
+    with temporary_classifier(MAX_SEQUENCE_LENGTH='auto', SEQUENCE_LENGTH_PERCENTILE=99) as classifier:
+        yield classifier
+
+
+def words(n):
+    """A text of n word tokens (n + 2 with [CLS] and [SEP])"""
+    return 'word ' * n
+
+
+def test_cap_from_token_lengths(classifier):
+    """The cap is the percentile rounded up to 32, clamped to 32..MAX_LENGTH"""
+    classifier.max_length = classifier.MAX_LENGTH
+    assert classifier.choose_sequence_length([words(60)] * 10) == 64
+    assert classifier.training_token_stats['p50'] == 62
+    assert classifier.choose_sequence_length([words(1)] * 10) == 32
+    classifier.max_length = 32
+    assert classifier.choose_sequence_length([words(1000)] * 3) == classifier.MAX_LENGTH
+    print("✓ PASS: cap rounded up to 32 and clamped")
+
+    with config_overrides(MAX_SEQUENCE_LENGTH='128'):
+        classifier.max_length = 128
+        assert classifier.choose_sequence_length([words(10)] * 10) == 128
+    print("✓ PASS: fixed cap is kept")
+
+
+def test_cap_does_not_flap(classifier):
+    """The current cap is kept while target <= cap <= 2 * target"""
+    texts = [words(60)] * 10  # target 64
+    for current, expected in ((64, 64), (96, 96), (128, 128), (160, 64), (32, 64)):
+        classifier.max_length = current
+        assert classifier.choose_sequence_length(texts) == expected, current
+    print("✓ PASS: no flapping inside the hysteresis band")
+
+
+def test_cap_persisted_and_reloaded(classifier):
+    """A swap at a new cap writes encoder_config.json and a new classifier starts at that cap"""
+    from classifier import EmailClassifier
+    classifier.max_length = classifier.MAX_LENGTH
+    model = LinearSoftmaxModel(np.zeros((3, classifier.hidden_size), dtype=np.float32), np.zeros(3),
+                               np.array(['personal', 'shopping', 'spam']), classifier.encoder_identity_for(64))
+    classifier.swap_model(model, 64)
+    with open(classifier.encoder_config_path) as f:
+        assert json.load(f) == {'max_length': 64}
+
+    reloaded = EmailClassifier()
+    try:
+        assert reloaded.max_length == 64
+        assert reloaded.encoder_identity == classifier.encoder_identity
+    finally:
+        reloaded.close()
+    print("✓ PASS: cap reloaded from encoder_config.json")
+
+
+def test_training_batches_bucketed_by_length(classifier):
+    """encode_many batches texts of similar length together and returns features in input order"""
+    texts = [words(n) for n in (50, 2, 40, 3, 60, 1)]
+    batches = []
+
+    def encode_fn(batch):
+        batches.append([len(text.split()) for text in batch])
+        return [np.full(2, len(text.split())) for text in batch]
+
+    features = classifier.encode_many(texts, batch_size=2, encode_fn=encode_fn, max_length=classifier.MAX_LENGTH,
+                                      background=True)
+    assert batches == [[1, 2], [3, 40], [50, 60]]
+    assert [int(feature[0]) for feature in features] == [50, 2, 40, 3, 60, 1]
+    print("✓ PASS: length-bucketed batches")
+
+
+def test_token_length_api(classifier):
+    """/api/token-lengths reports the cap, live lengths and the training distribution"""
+    import web_ui
+    classifier.choose_sequence_length([words(10)] * 4)
+    classifier.max_length = 64
+    classifier.live_token_lengths.clear()
+    classifier.extract_features(words(10))
+    classifier.extract_features(words(100))
+
+    saved, web_ui._classifier = web_ui._classifier, classifier
+    try:
+        stats = web_ui.app.test_client().get('/api/token-lengths').get_json()
+    finally:
+        web_ui._classifier = saved
+    assert stats['max_length'] == 64 and stats['mode'] == 'auto'
+    assert stats['live']['count'] == 2 and stats['live']['max'] == 64
+    assert stats['live_truncated_fraction'] == 0.5
+    assert stats['training']['count'] == 4
+    print("✓ PASS: token-length API")
+
+
+if __name__ == '__main__':
+    with temporary_classifier(MAX_SEQUENCE_LENGTH='auto', SEQUENCE_LENGTH_PERCENTILE=99) as shared:
+        test_cap_from_token_lengths(shared)
+        test_cap_does_not_flap(shared)
+        test_cap_persisted_and_reloaded(shared)
+        test_training_batches_bucketed_by_length(shared)
+        test_token_length_api(shared)
+    print("\nTest complete!")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Unit test for per-stage latency recording and percentiles
+"""
+import itertools
+import os
+import random
+import tempfile
+import config
+from stats import percentile
+from testing import config_overrides
+
+
+def test_stage_timing_percentiles():
+    """Logged stage timings come back as per-stage p50/p95/p99 in milliseconds"""
+    with tempfile.TemporaryDirectory() as tmp_dir, config_overrides(DB_PATH=os.path.join(tmp_dir, 'classifier.db')):
+        config.init_db()
+        for i in range(1, 101):
+            timings = {'parse': 0.001, 'lookup': 0.0001, 'predict': 0.0005, 'total': i / 1000}
+            if i % 2 == 0:
+                # Only escalated emails run the encoder
+                timings.update({'queue': 0.002, 'tokenize': 0.001, 'forward': i / 1000})
+            config.log_stage_timings(i, 'bert' if i % 2 == 0 else 'cascade', 'model-a', timings)
+
+        stats = config.get_stage_timing_stats(days=1)
+        assert stats['count'] == 100 and stats['stages'] == config.TIMING_STAGES
+        total = stats['overall']['total']
+        print(f"total: p50={total['p50']:.1f}ms p95={total['p95']:.1f}ms p99={total['p99']:.1f}ms")
+        assert (total['p50'], total['p95'], total['p99']) == (51.0, 96.0, 100.0)
+        assert stats['overall']['forward']['count'] == 50, "Skipped stages are not counted"
+        assert stats['overall']['deliver']['p50'] is None
+        assert stats['overall']['parse']['p99'] == 1.0
+        print("✓ PASS: overall percentiles")
+
+        assert len(stats['daily']) == 1 and stats['daily'][0]['count'] == 100
+        assert [m['model_id'] for m in stats['models']] == ['model-a']
+        print("✓ PASS: daily and per-model breakdown")
+
+
+def test_sql_percentiles_match_nearest_rank():
+    """Percentiles computed in SQLite match percentile() over the same values, per model"""
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp_dir, config_overrides(DB_PATH=os.path.join(tmp_dir, 'classifier.db')):
+        config.init_db()
+        totals = {'model-a': [], 'model-b': []}
+        for i in range(257):
+            model_id = 'model-a' if i % 3 else 'model-b'
+            seconds = rng.uniform(0.001, 0.5)
+            totals[model_id].append(seconds * 1000)
+            config.log_stage_timings(None, 'bert', model_id, {'total': seconds})
+
+        stats = config.get_stage_timing_stats(days=1)
+        assert stats['count'] == 257
+        for model in stats['models']:
+            values = sorted(totals[model['model_id']])
+            assert model['count'] == len(values)
+            for p in (50, 95, 99):
+                assert abs(model['stages']['total'][f'p{p}'] - percentile(values, p)) < 1e-9
+        print("✓ PASS: SQL percentiles match nearest rank")
+
+        empty = config.get_stage_timing_stats(days=0)
+        assert empty['count'] == 0 and empty['overall']['total']['p50'] is None and empty['models'] == []
+        print("✓ PASS: empty window")
+
+
+def test_old_timings_pruned_without_classification_id():
+    """Pruning is counted per insert, so cascade and memo rows (no classification id) trigger it too"""
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            config_overrides(DB_PATH=os.path.join(tmp_dir, 'classifier.db'), _stage_timing_inserts=itertools.count(1)):
+        config.init_db()
+        conn = config.get_db()
+        conn.execute("INSERT INTO stage_timings (stage, total_ms, timestamp) VALUES ('bert', 1, datetime('now', ?))",
+                     (f'-{config.STAGE_TIMINGS_RETENTION_DAYS + 1} days',))
+        conn.commit()
+        conn.close()
+
+        for _ in range(config.STAGE_TIMINGS_PRUNE_EVERY):
+            config.log_stage_timings(None, 'cascade', None, {'total': 0.001})
+        conn = config.get_db()
+        count = conn.execute('SELECT COUNT(*) FROM stage_timings').fetchone()[0]
+        conn.close()
+        assert count == config.STAGE_TIMINGS_PRUNE_EVERY
+        print("✓ PASS: old timings pruned")
+
+
+if __name__ == '__main__':
+    test_stage_timing_percentiles()
+    test_sql_percentiles_match_nearest_rank()
+    test_old_timings_pruned_without_classification_id()
+    print("\nTest complete!")
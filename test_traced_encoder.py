@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Unit test that the TorchScript encoder matches the eager PyTorch encoder
+"""
+import os
+import tempfile
+import numpy as np
+import pytest
+
+TEXTS = [
+    'Re: Meeting tomorrow Hi John, yes I can make the meeting at 3pm.',
+    'Your Amazon Order Has Shipped Your order #123-456789 has been shipped. Track your package here.',
+    'URGENT: Claim your prize NOW!!! You have won $1,000,000! Click here immediately to claim.',
+    'Hi',
+]
+
+
+def test_traced_matches_pytorch():
+    """A saved and reloaded trace gives the eager embeddings at any batch size and length"""
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+    from classifier import EmailClassifier
+    from traced_encoder import TracedEncoder, artifact_metadata, save_traced_encoder, trace_encoder
+
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(EmailClassifier.MODEL_NAME)
+        model = AutoModel.from_pretrained(EmailClassifier.MODEL_NAME).eval()
+    except OSError:
+        pytest.skip('DistilBERT model is not available locally')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'distilbert.torchscript.pt')
+        metadata = artifact_metadata(EmailClassifier.MODEL_NAME, 'none')
+        save_traced_encoder(trace_encoder(model, tokenizer), path, metadata)
+        traced = TracedEncoder.load(path, metadata)
+
+        # Batched (padded) and one at a time, at lengths other than the tracing sample's
+        for batch in [TEXTS] + [[text] for text in TEXTS]:
+            inputs = tokenizer(batch, return_tensors='pt', truncation=True,
+                               max_length=EmailClassifier.MAX_LENGTH, padding=True)
+            with torch.no_grad():
+                expected = model(**inputs).last_hidden_state[:, 0, :].numpy()
+            actual = traced.encode_texts(tokenizer, batch, EmailClassifier.MAX_LENGTH)
+
+            assert actual.shape == expected.shape
+            max_diff = float(np.abs(actual - expected).max())
+            print(f"  batch of {len(batch)}: max abs diff {max_diff:.2e}")
+            assert max_diff < 1e-5, f"Traced embeddings differ by {max_diff:.2e}"
+        print("✓ PASS: traced embeddings match PyTorch")
+
+        with pytest.raises(ValueError):
+            TracedEncoder.load(path, artifact_metadata(EmailClassifier.MODEL_NAME, 'int8'))
+        print("✓ PASS: stale artifact rejected")
+
+
+if __name__ == '__main__':
+    test_traced_matches_pytorch()
+    print("\nTest complete!")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Unit test for the out-of-process training helpers
+"""
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from inference_engine import EncoderPriorityGate
+from testing import temporary_classifier
+from training_worker import _fit
+
+
+def test_chunked_fit_reports_progress():
+    """The warm-started fit reports iterations and matches a single fit"""
+    rng = np.random.RandomState(0)
+    labels = np.array(['personal', 'shopping', 'spam'])[np.arange(150) % 3]
+    X = rng.randn(150, 32) + 2 * rng.randn(3, 32)[np.arange(150) % 3]
+
+    reports = []
+    model, iterations = _fit(X, labels, lambda done, total: reports.append((done, total)))
+    print(f"Fit in {iterations} iterations, {len(reports)} progress reports")
+    assert reports and reports[-1][0] == min(iterations, reports[-1][1])
+    assert all(a[0] <= b[0] for a, b in zip(reports, reports[1:]))
+
+    reference = LogisticRegression(max_iter=1000, multi_class='multinomial').fit(X, labels)
+    assert np.mean(model.predict(X) == reference.predict(X)) > 0.98
+    print("✓ PASS: chunked fit")
+
+
+def test_gate_state_is_shared_with_worker():
+    """A gate unpickled in a worker process keeps pointing at the same live counters"""
+    gate = EncoderPriorityGate()
+    state = gate.__getstate__()
+    assert '_lock' not in state
+    restored = EncoderPriorityGate.__new__(EncoderPriorityGate)
+    restored.__setstate__(state)
+    with gate.live():
+        assert restored.get_stats()['active_live_encodes'] == 1
+    assert restored.get_stats()['active_live_encodes'] == 0
+    print("✓ PASS: shared gate state")
+
+
+def test_train_then_prune_keeps_embeddings():
+    """Embeddings the training worker cached at a new sequence cap survive the retrain's prune"""
+    with temporary_classifier(MAX_SEQUENCE_LENGTH='auto') as classifier:
+        categories = ['personal', 'shopping', 'spam']
+        texts = [f'{categories[i % 3]} email number {i}' for i in range(30)]
+        labels = [categories[i % 3] for i in range(30)]
+
+        assert classifier.train(texts, labels)
+        print(f"Sequence cap after training: {classifier.max_length}")
+        assert classifier.max_length < classifier.MAX_LENGTH
+        assert classifier.embedding_cache.model_identity == classifier.encoder_identity
+
+        classifier.prune_embedding_cache(texts)
+        cached = classifier.embedding_cache.get_many(texts)
+        assert all(vector is not None for vector in cached)
+        assert classifier.embedding_cache.get_stats()['entries'] == 30
+        print("✓ PASS: 30 embeddings kept after prune")
+
+
+if __name__ == '__main__':
+    test_chunked_fit_reports_progress()
+    test_gate_state_is_shared_with_worker()
+    test_train_then_prune_keeps_embeddings()
+    print("\nTest complete!")
@@ -0,0 +1,38 @@
+"""
+Shared setup for tests that change config or need a real EmailClassifier.
+"""
+import tempfile
+from contextlib import contextmanager
+import config
+
+
+@contextmanager
+def config_overrides(**values):
+    """Set config attributes for the duration of the block, restoring the previous values after"""
+    saved = {name: getattr(config, name) for name in values}
+    try:
+        for name, value in values.items():
+            setattr(config, name, value)
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(config, name, value)
+
+
+@contextmanager
+def temporary_classifier(**overrides):
+    """
+    EmailClassifier whose model, database and embedding cache live in a
+    temporary directory, with live batching off; closed afterwards
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with config_overrides(MODEL_DIR=f'{tmp_dir}/models', DB_PATH=f'{tmp_dir}/classifier.db',
+                              EMBEDDING_CACHE_DIR=f'{tmp_dir}/models/embedding_cache',
+                              INFERENCE_BATCHING_ENABLED=False, **overrides):
+            config.init_db()
+            from classifier import EmailClassifier
+            classifier = EmailClassifier()
+            try:
+                yield classifier
+            finally:
+                classifier.close()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+TorchScript backend for DistilBERT feature extraction.
+
+The encoder (fp32 or int8, per ENCODER_QUANTIZATION) is traced once into a
+frozen TorchScript graph that returns only the [CLS] embedding, and saved
+under MODEL_DIR with the torch/transformers versions it was built with. At
+startup the saved graph is loaded instead of building the eager model, and a
+stale artifact (different versions or quantization) is rebuilt. The traced
+graph runs the same kernels as the eager model, so embeddings are identical
+and cached training embeddings stay valid.
+
+Tracing runs a forward pass, and the inference pool must be forked before the
+main process runs one, so the artifact is built in a spawned process.
+
+Usage:
+    python traced_encoder.py build   # (re-)build the TorchScript artifact
+"""
+import json
+import multiprocessing
+import os
+import sys
+import numpy as np
+import torch
+import transformers
+
+
+class ClsEncoder(torch.nn.Module):
+    """Wraps DistilBERT so it takes (input_ids, attention_mask) and returns the [CLS] embedding"""
+
+    def __init__(self, bert_model):
+        super().__init__()
+        self.bert_model = bert_model
+
+    def forward(self, input_ids, attention_mask):
+        outputs = self.bert_model(input_ids=input_ids, attention_mask=attention_mask)
+        return outputs.last_hidden_state[:, 0, :]
+
+
+def artifact_metadata(model_name: str, quantization: str) -> dict:
+    """Everything that must match for a saved trace to be reused"""
+    return {
+        'model_name': model_name,
+        'quantization': quantization,
+        'torch_version': torch.__version__,
+        'transformers_version': transformers.__version__,
+    }
+
+
+def trace_encoder(model, tokenizer):
+    """Trace and freeze a DistilBERT model into a ScriptModule"""
+    sample = tokenizer(['trace sample text', 'a longer trace sample text for padding'],
+                       return_tensors='pt', padding=True)
+    with torch.no_grad():
+        traced = torch.jit.trace(ClsEncoder(model).eval(), (sample['input_ids'], sample['attention_mask']),
+                                 check_trace=False)
+        return torch.jit.freeze(traced)
+
+
+def save_traced_encoder(traced, path: str, metadata: dict):
+    # Write to a temporary file first so a crash never leaves a partial artifact
+    tmp_path = path + '.tmp'
+    torch.jit.save(traced, tmp_path, _extra_files={'metadata.json': json.dumps(metadata)})
+    os.replace(tmp_path, path)
+
+
+def _build(model_name: str, quantization: str, path: str):
+    """Spawned-process body: load the eager model, trace it and save the artifact"""
+    from transformers import AutoModel, AutoTokenizer
+    from classifier import EmailClassifier
+
+    model = AutoModel.from_pretrained(model_name).eval()
+    if quantization == 'int8':
+        model = EmailClassifier.quantize_model(model)
+    traced = trace_encoder(model, AutoTokenizer.from_pretrained(model_name))
+    save_traced_encoder(traced, path, artifact_metadata(model_name, quantization))
+
+
+def build_traced_encoder(model_name: str, quantization: str, path: str, timeout: float = 600) -> bool:
+    """Build the TorchScript artifact in a spawned process (keeps this process fork-safe)"""
+    process = multiprocessing.get_context('spawn').Process(target=_build, args=(model_name, quantization, path),
+                                                           daemon=True)
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.kill()
+        process.join()
+    return process.exitcode == 0 and os.path.exists(path)
+
+
+class TracedEncoder:
+    def __init__(self, module, metadata: dict = None):
+        self.module = module
+        self.metadata = metadata or {}
+
+    @classmethod
+    def load(cls, path: str, expected_metadata: dict = None):
+        """Load a saved artifact; raises ValueError when it was built for something else"""
+        extra_files = {'metadata.json': ''}
+        module = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+        metadata = json.loads(extra_files['metadata.json'] or '{}')
+        if expected_metadata is not None and metadata != expected_metadata:
+            raise ValueError(f"artifact was built with {metadata}, expected {expected_metadata}")
+        return cls(module, metadata)
+
+    def encode(self, input_ids, attention_mask) -> np.ndarray:
+        """Return [CLS] embeddings for a tokenized, padded batch"""
+        with torch.no_grad():
+            return self.module(torch.as_tensor(np.asarray(input_ids, dtype=np.int64)),
+                               torch.as_tensor(np.asarray(attention_mask, dtype=np.int64))).numpy()
+
+    def encode_texts(self, tokenizer, texts: list, max_length: int) -> np.ndarray:
+        """Tokenize texts and return their [CLS] embeddings"""
+        inputs = tokenizer(texts, return_tensors='np', truncation=True,
+                           max_length=max_length, padding=True)
+        return self.encode(inputs['input_ids'], inputs['attention_mask'])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print(__doc__)
+        sys.exit(1)
+
+    import config
+    from classifier import EmailClassifier
+
+    os.makedirs(config.MODEL_DIR, exist_ok=True)
+    print(f"Tracing {EmailClassifier.MODEL_NAME} ({config.ENCODER_QUANTIZATION}) to {config.TORCHSCRIPT_MODEL_PATH}...")
+    _build(EmailClassifier.MODEL_NAME, config.ENCODER_QUANTIZATION, config.TORCHSCRIPT_MODEL_PATH)
+    print("Build complete")
@@ -5,6 +5,7 @@ import time
 import threading
 from datetime import datetime, timedelta
 import config
+import mime_stream
 from classifier import EmailClassifier
 from imap_idle_monitor import IMAPIdleMonitorManager
 
@@ -116,9 +117,12 @@ class EmailTrainer:
                         
                         for msg_id in selected_messages:
                             raw_msg = client.fetch([msg_id], ['RFC822'])
-                            email_body = raw_msg[msg_id][b'RFC822'].decode('utf-8', errors='ignore')
 
-                            msg = email.message_from_string(email_body)
+                            # Same bounded parse as the classification path (headers plus
+                            # text snippet, HTML converted when there is no plain part)
+                            msg, body = mime_stream.extract_text(raw_msg[msg_id][b'RFC822'], snippet_chars=1000,
+                                                                 max_scan_bytes=config.MIME_MAX_SCAN_BYTES,
+                                                                 max_parts=config.MIME_MAX_PARTS)
                             message_id = msg.get('message-id', '').strip()
 
                             # Generate fallback Message-ID if missing (unique per user/folder/IMAP-ID)
@@ -127,19 +131,6 @@ class EmailTrainer:
 
                             subject = self.decode_subject(msg.get('subject', ''))
                             
-                            # Extract text
-                            body = ''
-                            if msg.is_multipart():
-                                for part in msg.walk():
-                                    if part.get_content_type() == 'text/plain':
-                                        payload = part.get_payload(decode=True)
-                                        if payload:
-                                            body += payload.decode('utf-8', errors='ignore')
-                            else:
-                                payload = msg.get_payload(decode=True)
-                                if payload:
-                                    body = payload.decode('utf-8', errors='ignore')
-                            
                             text = f"{subject} {body[:1000]}"
                             
                             # Store in database
@@ -314,6 +305,11 @@ class EmailTrainer:
 
         print(f"Retraining with {len(texts)} messages...")
         success = self.classifier.train(texts, labels)
+        if success:
+            self.classifier.train_fast_model(texts, labels)
+
+        # Keep the embedding cache in step with training_data retention
+        self.classifier.prune_embedding_cache(texts)
 
         # Clear training status after completion (also cleared in classifier.train on failure)
         if success:
@@ -344,6 +340,7 @@ class EmailTrainer:
             config.set_training_status(True, len(texts))
             success = self.classifier.train(texts, labels)
             if success:
+                self.classifier.train_fast_model(texts, labels)
                 config.set_training_status(False)
         else:
             print("Insufficient initial training data")
@@ -0,0 +1,242 @@
+"""
+Out-of-process training job.
+
+Feature extraction and the logistic regression fit run in a spawned worker
+process at lower CPU priority. The worker loads its own copy of the encoder,
+because forking after the live process has run forward passes can deadlock
+torch's thread pool. The parent only waits, so it can enforce
+MAX_TRAINING_TIME_SECONDS over the whole job and kill the worker cleanly on
+timeout. It also kills the worker when its resident memory passes
+TRAINING_WORKER_MEMORY_LIMIT_MB. The worker writes its progress (samples
+encoded, fit iterations) to the training_status table and sends the fitted
+model and features back over a pipe.
+
+Training encodes still yield to live encodes through the classifier's
+EncoderPriorityGate, whose state is in shared memory.
+
+With FEATURE_PROJECTION set, embeddings are projected chunk by chunk into the
+float16 feature store and the fit runs on that array; only the store's
+metadata goes back over the pipe, with the accuracies the worker measured for
+validation.
+"""
+import multiprocessing
+import os
+import signal
+import time
+import warnings
+import numpy as np
+import config
+from inference_pool import process_memory
+
+FIT_MAX_ITER = 1000
+FIT_ITERATIONS_PER_REPORT = 50
+FEATURE_STORE_CHUNK = 4096  # Raw embeddings held at once while filling the feature store
+
+
+class TrainingError(Exception):
+    pass
+
+
+def _fit(features, labels, progress):
+    """Multinomial logistic regression fit in warm-started chunks so iterations can be reported"""
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.linear_model import LogisticRegression
+
+    model = LogisticRegression(max_iter=FIT_ITERATIONS_PER_REPORT, multi_class='multinomial', warm_start=True)
+    iterations = 0
+    while iterations < FIT_MAX_ITER:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ConvergenceWarning)
+            model.fit(features, labels)
+        iterations += int(model.n_iter_.max())
+        progress(min(iterations, FIT_MAX_ITER), FIT_MAX_ITER)
+        if model.n_iter_.max() < FIT_ITERATIONS_PER_REPORT:
+            break
+    return model, iterations
+
+
+def _fit_early_exit(classifier, texts: list, labels: list, features, max_length: int):
+    """Fit early-exit heads on a sample of the training data (None when no exit layer applies)"""
+    from early_exit import EVALUATION_THRESHOLDS, fit_heads
+
+    num_layers = len(classifier.bert_model.transformer.layer)
+    layers = sorted(layer for layer in set(config.EARLY_EXIT_LAYERS) if 0 < layer < num_layers)
+    if not layers:
+        return None
+
+    sample = np.random.RandomState(0).permutation(len(texts))[:config.EARLY_EXIT_TRAINING_SAMPLES]
+    config.set_training_progress('early_exit', 0, len(sample))
+    encoded = classifier.encode_many(
+        [texts[i] for i in sample], max_length=max_length, background=True,
+        encode_fn=lambda batch: classifier.encode_layers(batch, layers, max_length),
+        progress=lambda done: config.set_training_progress('early_exit', done, len(sample))
+    )
+    return fit_heads(np.asarray(encoded), features[sample], [labels[i] for i in sample], layers, num_layers,
+                     config.CATEGORIES, classifier.encoder_identity_for(max_length),
+                     fit=lambda X, y: _fit(X, y, lambda done, total: None)[0],
+                     thresholds=sorted(set(EVALUATION_THRESHOLDS + [config.EARLY_EXIT_CONFIDENCE])))
+
+
+def _build_feature_store(classifier, texts: list, labels: list, max_length: int):
+    """
+    Fit the projection on a sample of the embeddings, then project every training
+    embedding into the float16 store a chunk at a time. Returns the committed store
+    and the serving model's accuracy on the raw embeddings (None without a
+    serving model for this encoder).
+    """
+    from feature_store import FeatureProjection, FeatureStore
+
+    identity = classifier.encoder_identity_for(max_length)
+    serving = classifier.classifier
+    if serving is not None and serving.encoder_identity != identity:
+        serving = None
+    labels = np.asarray(labels)
+
+    # The projection sample is the first chunk, so it is only encoded once
+    order = np.random.RandomState(0).permutation(len(texts))
+    fit_samples = max(1, config.FEATURE_PROJECTION_FIT_SAMPLES)
+    chunks = [order[:fit_samples]] + [order[start:start + FEATURE_STORE_CHUNK]
+                                      for start in range(fit_samples, len(texts), FEATURE_STORE_CHUNK)]
+
+    store = None
+    serving_correct = 0
+    done = 0
+    for chunk in chunks:
+        rows = np.sort(chunk)
+        embeddings = np.asarray(classifier.get_training_features(
+            [texts[i] for i in rows], max_length,
+            progress=lambda n, total: config.set_training_progress('encoding', done + n, len(texts))
+        ), dtype=np.float32)
+        if store is None:
+            projection = FeatureProjection.fit(config.FEATURE_PROJECTION, embeddings, config.FEATURE_PROJECTION_DIM)
+            store = FeatureStore.create(classifier.feature_store_path, len(texts), labels, projection, identity)
+        store.write(rows, embeddings)
+        if serving is not None:
+            serving_correct += int(np.sum(serving.predict(embeddings) == labels[rows]))
+        done += len(rows)
+
+    store.commit(classifier.feature_store_path)
+    return store, (serving_correct / len(texts) if serving is not None else None)
+
+
+def _run(conn, settings, encoder_gate, texts, labels, max_length):
+    """Worker process entry point"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        os.nice(settings['TRAINING_WORKER_NICE'])
+    except OSError:
+        pass
+
+    try:
+        # Mirror the parent's configuration, without live-serving machinery
+        for name, value in settings.items():
+            setattr(config, name, value)
+        config.INFERENCE_BATCHING_ENABLED = False
+        config.SENDER_MEMO_ENABLED = False
+        config.NEAR_DUPLICATE_ENABLED = False
+        config.ONLINE_LEARNING_ENABLED = False
+
+        import torch
+        torch.set_num_threads(config.TRAINING_WORKER_THREADS or max(1, (os.cpu_count() or 1) // 2))
+
+        from classifier import EmailClassifier
+        from linear_model import LinearSoftmaxModel
+        classifier = EmailClassifier()
+        classifier.encoder_gate = encoder_gate
+
+        start_time = time.time()
+        store = None
+        if config.FEATURE_PROJECTION != 'none':
+            store, serving_accuracy = _build_feature_store(classifier, texts, labels, max_length)
+            features = store.features
+        else:
+            features = classifier.get_training_features(
+                texts, max_length, progress=lambda done, total: config.set_training_progress('encoding', done, total)
+            )
+            features = np.asarray(features, dtype=np.float32)
+        feature_time = time.time() - start_time
+
+        model, iterations = _fit(features, labels,
+                                 lambda done, total: config.set_training_progress('fitting', done, total))
+        model = LinearSoftmaxModel.from_sklearn(
+            model, classifier.encoder_identity_for(max_length),
+            {'num_samples': len(texts), 'max_length': max_length, 'fit_iterations': iterations}
+        ).aligned_to(config.CATEGORIES)
+
+        validation = None
+        if store is not None:
+            # Measure on the store, then fold the projection in so the model scores raw embeddings
+            validation = {'accuracy': float(np.mean(model.predict(features) == np.asarray(labels))),
+                          'serving_accuracy': serving_accuracy}
+            model = store.projection.fold(model)
+
+        early_exit = None
+        if config.EARLY_EXIT_ENABLED and classifier.bert_model is not None:
+            early_exit = _fit_early_exit(classifier, texts, labels, features, max_length)
+
+        conn.send({'success': True, 'model': model, 'feature_time': feature_time, 'early_exit': early_exit,
+                   'features': features if store is None else None,
+                   'feature_store': store.metadata if store is not None else None,
+                   'validation': validation})
+    except BaseException as e:
+        conn.send({'success': False, 'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run_training_job(encoder_gate, texts: list, labels: list, max_length: int) -> dict:
+    """
+    Encode and fit in a worker process. Returns {'model', 'features', 'feature_time',
+    'early_exit' (heads, or None when early exit is disabled), 'feature_store' and
+    'validation'}. With a feature projection, 'features' is None, 'feature_store'
+    is the store's metadata and 'validation' holds the new and serving models'
+    training accuracy;
+    raises TrainingError on failure, timeout or exceeding the memory limit.
+    """
+    settings = {name: value for name, value in vars(config).items()
+                if name.isupper() and not name.startswith('_')}
+
+    ctx = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run, name='training-worker', daemon=True,
+                          args=(child_conn, settings, encoder_gate, texts, labels, max_length))
+    process.start()
+    child_conn.close()
+    print(f"  Training worker started (pid {process.pid})")
+
+    deadline = time.time() + config.MAX_TRAINING_TIME_SECONDS
+    peak_rss_mb = 0.0
+    try:
+        while True:
+            if parent_conn.poll(0.5):
+                result = parent_conn.recv()
+                break
+            if not process.is_alive():
+                if parent_conn.poll():
+                    result = parent_conn.recv()
+                    break
+                raise TrainingError(f"Training worker exited with code {process.exitcode}")
+            if time.time() > deadline:
+                raise TrainingError(f"Training timeout after {config.MAX_TRAINING_TIME_SECONDS}s")
+
+            rss_mb = process_memory(process.pid).get('rss_mb', 0.0)
+            peak_rss_mb = max(peak_rss_mb, rss_mb)
+            if config.TRAINING_WORKER_MEMORY_LIMIT_MB and rss_mb > config.TRAINING_WORKER_MEMORY_LIMIT_MB:
+                raise TrainingError(f"Training worker exceeded {config.TRAINING_WORKER_MEMORY_LIMIT_MB} MB "
+                                    f"({rss_mb:.0f} MB resident)")
+    except EOFError:
+        raise TrainingError(f"Training worker exited with code {process.exitcode}")
+    finally:
+        parent_conn.close()
+        if process.is_alive():
+            process.terminate()
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    if not result['success']:
+        raise TrainingError(result['error'])
+    result['peak_rss_mb'] = peak_rss_mb
+    print(f"  Training worker finished (peak {peak_rss_mb:.0f} MB resident)")
+    return result
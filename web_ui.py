@@ -2,12 +2,14 @@ from flask import Flask, render_template_string, jsonify, request
 import config
 from datetime import datetime, timedelta
 import threading
+from sender_rules import SenderRules
 
 app = Flask(__name__)
 
 # Global references to trainer and classifier (set by run_web_ui)
 _trainer = None
 _classifier = None
+_smtp_server = None
 
 def get_all_users():
     """Get list of all users from database"""
@@ -29,6 +31,24 @@ def get_all_users():
     conn.close()
     return sorted(list(users))
 
+def get_early_exit_stats(days: int = 7):
+    """Early-exit settings, live exit-depth distribution and the heads' holdout evaluation"""
+    heads = _classifier.early_exit if _classifier is not None else None
+    return {
+        'enabled': config.EARLY_EXIT_ENABLED,
+        'active': heads is not None,
+        'layers': heads.layers if heads is not None else config.EARLY_EXIT_LAYERS,
+        'threshold': config.EARLY_EXIT_CONFIDENCE,
+        'latency_budget_ms': config.EARLY_EXIT_LATENCY_BUDGET_MS,
+        'live': config.get_exit_depth_stats(days),
+        'evaluation': heads.metadata.get('evaluation') if heads is not None else None,
+    }
+
+def get_online_updates():
+    """Corrections applied to the serving model since its last full retrain"""
+    model = _classifier.classifier if _classifier is not None else None
+    return model.metadata.get('online_updates', 0) if model is not None else 0
+
 # HTML template
 TEMPLATE = """
 <!DOCTYPE html>
@@ -824,6 +844,58 @@ TEMPLATE = """
                 <div class="stat-label">Reclassifications</div>
                 <div class="stat-value">{{ stats.reclassifications }}<span class="badge">Learning!</span></div>
             </div>
+            {% if readiness %}
+            <div class="stat-card">
+                <div class="stat-label">Encoder ({{ readiness.encoder_backend }})</div>
+                <div class="stat-value">{% if readiness.ready %}✓ Ready{% else %}Warming up{% endif %}</div>
+                {% if readiness.warm_latency_ms is not none %}
+                <div style="color: #666; font-size: 13px; margin-top: 4px;">
+                    {{ "%.0f"|format(readiness.warm_latency_ms) }}ms warm ({{ "%.0f"|format(readiness.cold_latency_ms) }}ms cold)
+                </div>
+                {% endif %}
+            </div>
+            {% endif %}
+            {% if admission %}
+            <div class="stat-card">
+                <div class="stat-label">Classification Queue</div>
+                <div class="stat-value">{{ admission.depth }}{% if admission.max_queue %} / {{ admission.max_queue }}{% endif %}</div>
+                <div style="color: #666; font-size: 13px; margin-top: 4px;">
+                    peak {{ admission.peak_depth }}, p95 {{ admission.p95_depth if admission.p95_depth is not none else 0 }};
+                    {{ admission.outcomes[admission.policy] }} {{ admission.policy }}{% if admission.last_overload %} (last {{ admission.last_overload }}){% endif %}
+                </div>
+            </div>
+            {% endif %}
+            {% if smtp_runtime and smtp_runtime.event_loop.samples %}
+            <div class="stat-card">
+                <div class="stat-label">SMTP Loop Lag (p99)</div>
+                <div class="stat-value">{{ "%.1f"|format(smtp_runtime.event_loop.p99_lag_ms) }}ms</div>
+                <div style="color: #666; font-size: 13px; margin-top: 4px;">
+                    max {{ "%.0f"|format(smtp_runtime.event_loop.max_lag_ms) }}ms;
+                    classify {{ smtp_runtime.executors.classify.active }}/{{ smtp_runtime.executors.classify.max_workers }} busy,
+                    {{ smtp_runtime.executors.classify.queued }} queued
+                </div>
+            </div>
+            {% endif %}
+            {% if smtp_runtime and smtp_runtime.delivery.delivered %}
+            <div class="stat-card">
+                <div class="stat-label">Delivery Pool Hit Rate</div>
+                <div class="stat-value">{{ "%.0f"|format(smtp_runtime.delivery.hit_rate * 100) }}%</div>
+                <div style="color: #666; font-size: 13px; margin-top: 4px;">
+                    p50 {{ "%.0f"|format(smtp_runtime.delivery.p50_latency_ms) }}ms, p99 {{ "%.0f"|format(smtp_runtime.delivery.p99_latency_ms) }}ms;
+                    {{ smtp_runtime.delivery.connections_opened }} opened, {{ smtp_runtime.delivery.retried }} retried
+                </div>
+            </div>
+            {% endif %}
+            {% if smtp_runtime and smtp_runtime.spool %}
+            <div class="stat-card">
+                <div class="stat-label">Delivery Spool</div>
+                <div class="stat-value">{{ smtp_runtime.spool.depth }}</div>
+                <div style="color: #666; font-size: 13px; margin-top: 4px;">
+                    {% if smtp_runtime.spool.oldest_age_seconds is not none %}oldest {{ "%.0f"|format(smtp_runtime.spool.oldest_age_seconds) }}s, {% endif %}{{ smtp_runtime.spool.retrying }} retrying;
+                    {{ smtp_runtime.spool.delivered }} delivered, {{ smtp_runtime.spool.failed }} failed
+                </div>
+            </div>
+            {% endif %}
         </div>
 
         {% if training_status and training_status.is_training %}
@@ -839,6 +911,17 @@ TEMPLATE = """
                 <div style="margin-bottom: 8px;">
                     <strong>Started:</strong> {{ training_status.started_at }}
                 </div>
+                {% if training_status.progress_total %}
+                {% set progress_pct = (100 * training_status.progress_current / training_status.progress_total)|round(1) %}
+                <div style="margin-bottom: 8px;">
+                    <strong>{{ {'encoding': 'Encoding emails', 'early_exit': 'Encoding early-exit layers'}.get(training_status.phase, 'Fitting model') }}:</strong>
+                    {{ training_status.progress_current }} / {{ training_status.progress_total }}
+                    {{ 'iterations (max)' if training_status.phase == 'fitting' else 'samples' }}
+                    <div style="background: #FFE0B2; border-radius: 4px; height: 10px; margin-top: 6px; overflow: hidden;">
+                        <div style="background: #FF9800; height: 10px; width: {{ progress_pct }}%;"></div>
+                    </div>
+                </div>
+                {% endif %}
                 <div style="color: #666; font-size: 14px; margin-top: 12px;">
                     Please wait... This may take a few minutes depending on the dataset size. The page will automatically refresh to show the results when training completes.
                 </div>
@@ -884,6 +967,24 @@ TEMPLATE = """
                     <div class="model-stat-label">Last Trained</div>
                     <div class="model-stat-value" style="font-size: 13px;">{{ model_stats.last_trained }}</div>
                 </div>
+                {% if model_stats.online_updates %}
+                <div class="model-stat-item">
+                    <div class="model-stat-label">Online Updates</div>
+                    <div class="model-stat-value">{{ model_stats.online_updates }}</div>
+                </div>
+                {% endif %}
+                {% if cascade_stats and cascade_stats.total %}
+                <div class="model-stat-item">
+                    <div class="model-stat-label">BERT Escalation (7d)</div>
+                    <div class="model-stat-value">{{ "%.1f"|format(cascade_stats.escalation_rate * 100) }}%</div>
+                </div>
+                {% if cascade_stats.time_saved_seconds is not none %}
+                <div class="model-stat-item">
+                    <div class="model-stat-label">Cascade Time Saved (7d)</div>
+                    <div class="model-stat-value">{{ "%.1f"|format(cascade_stats.time_saved_seconds) }}s</div>
+                </div>
+                {% endif %}
+                {% endif %}
             </div>
         </div>
         {% else %}
@@ -893,6 +994,86 @@ TEMPLATE = """
         </div>
         {% endif %}
 
+        {% if stage_timings and stage_timings.count %}
+        <h2>⏱️ Latency by Stage (Last {{ stage_timings.days }} Days)</h2>
+        <p style="color: #666; font-size: 14px;">Milliseconds per classification across {{ stage_timings.count }} emails. Shared work (tokenize, forward, predict) is divided across the emails of a batch.</p>
+        <table>
+            <thead>
+                <tr>
+                    <th></th>
+                    {% for name in stage_timings.stages %}<th>{{ name }}</th>{% endfor %}
+                </tr>
+            </thead>
+            <tbody>
+                {% for q in ['p50', 'p95', 'p99'] %}
+                <tr>
+                    <td><strong>{{ q }}</strong></td>
+                    {% for name in stage_timings.stages %}
+                    <td>{% if stage_timings.overall[name][q] is not none %}{{ "%.1f"|format(stage_timings.overall[name][q]) }}{% else %}-{% endif %}</td>
+                    {% endfor %}
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+        <h3>p95 by Day</h3>
+        <table>
+            <thead>
+                <tr>
+                    <th>Date</th>
+                    <th>Emails</th>
+                    {% for name in stage_timings.stages %}<th>{{ name }}</th>{% endfor %}
+                </tr>
+            </thead>
+            <tbody>
+                {% for day in stage_timings.daily|reverse %}
+                <tr>
+                    <td>{{ day.date }}</td>
+                    <td>{{ day.count }}</td>
+                    {% for name in stage_timings.stages %}
+                    <td>{% if day.stages[name].p95 is not none %}{{ "%.1f"|format(day.stages[name].p95) }}{% else %}-{% endif %}</td>
+                    {% endfor %}
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+        {% endif %}
+
+        {% if early_exit and early_exit.enabled %}
+        <h2>🚪 Early Exit</h2>
+        <p style="color: #666; font-size: 14px;">
+            Exit layers {{ early_exit.layers|join(', ') }} at confidence {{ early_exit.threshold }}{% if early_exit.latency_budget_ms %}, {{ early_exit.latency_budget_ms|int }}ms budget{% endif %}.
+            {% if early_exit.live.total %}Last {{ early_exit.live.days }} days:
+            {% for layer in early_exit.live.layers %}layer {{ layer.layer }}: {{ "%.1f"|format(layer.share * 100) }}% ({{ "%.3f"|format(layer.avg_processing_time) }}s){% if not loop.last %}, {% endif %}{% endfor %}.
+            {% endif %}
+        </p>
+        {% if early_exit.evaluation %}
+        <table>
+            <thead>
+                <tr>
+                    <th>Threshold</th>
+                    <th>Holdout Accuracy</th>
+                    <th>Full Depth</th>
+                    <th>Agreement</th>
+                    <th>Avg Layers</th>
+                    <th>Exits per Layer</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for policy in early_exit.evaluation.thresholds %}
+                <tr>
+                    <td>{{ policy.threshold }}</td>
+                    <td>{{ "%.1f"|format(policy.accuracy * 100) }}%</td>
+                    <td>{{ "%.1f"|format(early_exit.evaluation.full_depth_accuracy * 100) }}%</td>
+                    <td>{{ "%.1f"|format(policy.agreement_with_full_depth * 100) }}%</td>
+                    <td>{{ "%.2f"|format(policy.mean_layers) }}</td>
+                    <td>{% for layer, count in policy.exit_distribution.items() %}{{ layer }}: {{ count }}{% if not loop.last %}, {% endif %}{% endfor %}</td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+        {% endif %}
+        {% endif %}
+
         {% if recent_reclassifications %}
         <h2>🔄 Recent Reclassifications (Last 20)</h2>
         <p style="color: #666; font-size: 14px;">Emails you moved between folders - the model learns from these!</p>
@@ -1365,7 +1546,15 @@ def dashboard():
 
     # Get model stats and training status
     model_stats = config.get_latest_model_stats()
+    if model_stats:
+        model_stats['online_updates'] = get_online_updates()
     training_status = config.get_training_status()
+    cascade_stats = config.get_cascade_stats()
+    stage_timings = config.get_stage_timing_stats()
+    readiness = _classifier.readiness if _classifier is not None else None
+    admission = _classifier.admission.get_stats() if _classifier is not None else None
+    smtp_runtime = _smtp_server.get_stats() if _smtp_server is not None else None
+    early_exit = get_early_exit_stats()
 
     return render_template_string(TEMPLATE,
                                  stats=stats,
@@ -1373,6 +1562,12 @@ def dashboard():
                                  training_dist=training_dist,
                                  recent_reclassifications=recent_reclassifications,
                                  model_stats=model_stats,
+                                 cascade_stats=cascade_stats,
+                                 stage_timings=stage_timings,
+                                 readiness=readiness,
+                                 admission=admission,
+                                 smtp_runtime=smtp_runtime,
+                                 early_exit=early_exit,
                                  training_status=training_status,
                                  users=users,
                                  selected_user=selected_user,
@@ -1578,14 +1773,120 @@ def api_retrain():
 
     return jsonify({'success': True, 'message': 'Model retraining started'})
 
+@app.route('/api/training-status')
+def api_training_status():
+    """API endpoint for training progress (phase, samples encoded or fit iterations)"""
+    return jsonify(config.get_training_status())
+
 @app.route('/api/model-stats')
 def api_model_stats():
     """API endpoint for model statistics"""
     stats = config.get_latest_model_stats()
     if stats:
+        stats['online_updates'] = get_online_updates()
         return jsonify(stats)
     return jsonify({'error': 'No model stats available'}), 404
 
+@app.route('/api/inference-stats')
+def api_inference_stats():
+    """API endpoint for micro-batching inference engine statistics"""
+    if _classifier is None:
+        return jsonify({'enabled': False})
+    stats = {'enabled': _classifier.inference_engine is not None}
+    if _classifier.inference_engine is not None:
+        stats.update(_classifier.inference_engine.get_stats())
+    if _classifier.inference_pool is not None:
+        stats['pool'] = _classifier.inference_pool.get_stats()
+    stats['encoder_priority'] = _classifier.encoder_gate.get_stats()
+    return jsonify(stats)
+
+@app.route('/api/event-loop')
+def api_event_loop():
+    """API endpoint for SMTP event-loop lag and the load on its classify and I/O executors"""
+    if _smtp_server is None:
+        return jsonify({'error': 'SMTP server not running'}), 404
+    return jsonify(_smtp_server.get_stats())
+
+@app.route('/api/delivery')
+def api_delivery():
+    """API endpoint for delivery connection pool hit rate, retries and delivery latency"""
+    if _smtp_server is None or _smtp_server.handler is None:
+        return jsonify({'error': 'SMTP server not running'}), 404
+    return jsonify(_smtp_server.handler.delivery_pool.get_stats())
+
+@app.route('/api/spool')
+def api_spool():
+    """API endpoint for delivery spool depth, oldest message age, retries and spool write latency"""
+    if _smtp_server is None or _smtp_server.handler is None or _smtp_server.handler.spool is None:
+        return jsonify({'error': 'Delivery spool not running'}), 404
+    return jsonify(_smtp_server.handler.spool.get_stats())
+
+@app.route('/api/admission')
+def api_admission():
+    """API endpoint for classification queue depth, admission wait and overload policy counters"""
+    if _classifier is None:
+        return jsonify({'error': 'Classifier not running'}), 404
+    return jsonify(_classifier.admission.get_stats())
+
+@app.route('/api/early-exit')
+def api_early_exit():
+    """API endpoint for exit-depth distribution and the early-exit accuracy trade-off"""
+    days = request.args.get('days', 7, type=int)
+    return jsonify(get_early_exit_stats(days))
+
+@app.route('/api/readiness')
+def api_readiness():
+    """API endpoint for readiness (503 until the encoder is warm and SMTP accepts connections) and warm latency"""
+    if _classifier is None:
+        return jsonify({'ready': False}), 503
+    return jsonify(_classifier.readiness), 200 if _classifier.readiness['ready'] else 503
+
+@app.route('/api/token-lengths')
+def api_token_lengths():
+    """API endpoint for the token-length distribution and the current sequence cap"""
+    if _classifier is None:
+        return jsonify({'error': 'Classifier not initialized'}), 500
+    return jsonify(_classifier.get_token_length_stats())
+
+@app.route('/api/sender-rules')
+def api_sender_rules():
+    """API endpoint for the sender rules and how often each one fired"""
+    return jsonify(get_sender_rules().get_stats())
+
+@app.route('/api/sender-rules/reload', methods=['POST'])
+def api_reload_sender_rules():
+    """API endpoint to recompile the sender rules after SENDER_RULES_PATH was edited"""
+    if _classifier is None:
+        return jsonify({'success': False, 'error': 'Classifier not initialized'}), 500
+    try:
+        rules = _classifier.reload_sender_rules()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'rules': len(rules.rules), 'errors': rules.errors})
+
+@app.route('/api/stage-timings')
+def api_stage_timings():
+    """API endpoint for p50/p95/p99 latency per pipeline stage, overall, per day and per model"""
+    days = request.args.get('days', 7, type=int)
+    return jsonify(config.get_stage_timing_stats(days))
+
+@app.route('/api/cascade-stats')
+def api_cascade_stats():
+    """API endpoint for the cascade escalation rate, latency per deciding stage and reuse counters"""
+    days = request.args.get('days', 7, type=int)
+    stats = config.get_cascade_stats(days)
+    fast_model = _classifier.fast_model if _classifier is not None else None
+    stats['fast_model'] = {
+        'loaded': fast_model is not None,
+        'enabled': bool(fast_model and fast_model.enabled),
+        'confidence_threshold': config.CASCADE_CONFIDENCE_THRESHOLD,
+    }
+    sender_memo = _classifier.sender_memo if _classifier is not None else None
+    stats['sender_memo'] = sender_memo.get_stats() if sender_memo is not None else None
+    near_duplicates = _classifier.near_duplicates if _classifier is not None else None
+    stats['near_duplicates'] = near_duplicates.get_stats() if near_duplicates is not None else None
+    return jsonify(stats)
+
 @app.route('/api/classification/<int:classification_id>')
 def api_classification_details(classification_id):
     """API endpoint for detailed classification with explainability"""
@@ -1596,7 +1897,7 @@ def api_classification_details(classification_id):
     c.execute('''SELECT c.id, c.message_id, c.user_email, c.subject, c.predicted_category,
                         c.confidence, c.processing_time, c.timestamp,
                         c.personal_prob, c.shopping_prob, c.spam_prob, c.sender_domain,
-                        t.body
+                        t.body, c.stage
                  FROM classifications c
                  LEFT JOIN training_data t ON c.message_id = t.message_id AND c.user_email = t.user_email
                  WHERE c.id = ?''', (classification_id,))
@@ -1644,6 +1945,7 @@ def api_classification_details(classification_id):
         'timestamp': row[7],
         'probabilities': probabilities,
         'sender_domain': row[11],
+        'stage': row[13] or 'bert',
         'body_preview': body_preview,
         'explanation': explanation
     })
@@ -1687,24 +1989,29 @@ def generate_classification_explanation(predicted_category, confidence, probabil
         elif margin < 0.3:
             explanation.append(f"'{runner_up[0]}' was considered but had lower probability ({runner_up[1]*100:.1f}%).")
 
-    # Sender domain heuristics
+    # Sender rules (the same compiled rules the classifier applied)
     if sender_domain:
-        civic_domains = ['.gov', '.edu', '.org']
-        civic_keywords = ['government', 'county', 'city', 'state', 'municipal', 'district', 'commissioner']
+        explanation.extend(get_sender_rules().explain(sender_domain))
 
-        is_civic = any(sender_domain.endswith(d) for d in civic_domains) or \
-                   any(kw in sender_domain for kw in civic_keywords)
+    return explanation
 
-        if is_civic:
-            explanation.append(f"Sender domain '{sender_domain}' is a civic/institutional domain - shopping probability was reduced.")
+_sender_rules = None
 
-    return explanation
+def get_sender_rules():
+    """The classifier's sender rules, or the configured rules when running without a classifier"""
+    global _sender_rules
+    if _classifier is not None:
+        return _classifier.sender_rules
+    if _sender_rules is None:
+        _sender_rules = SenderRules.load(config.SENDER_RULES_PATH, config.CATEGORIES)
+    return _sender_rules
 
-def run_web_ui(trainer=None, classifier=None):
+def run_web_ui(trainer=None, classifier=None, smtp_server=None):
     """Start the web UI with production WSGI server"""
-    global _trainer, _classifier
+    global _trainer, _classifier, _smtp_server
     _trainer = trainer
     _classifier = classifier
+    _smtp_server = smtp_server
 
     from waitress import serve
     print("Starting web dashboard on http://0.0.0.0:8080")